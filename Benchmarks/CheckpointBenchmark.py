@@ -0,0 +1,121 @@
+"""
+Checkpoint I/O of an EssayWriter-shaped run (growing `content`, large drafts) with the plain
+SqliteSaver and with Shared.Checkpoint.TunedSqliteSaver. Reports bytes on disk and latency per step.
+
+    python Benchmarks/CheckpointBenchmark.py --revisions 10
+"""
+import argparse
+import os
+import sqlite3
+import sys
+import tempfile
+import time
+from typing import Annotated, List, TypedDict
+
+from langgraph.checkpoint.sqlite import SqliteSaver
+from langgraph.graph import StateGraph, END
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from Shared.Checkpoint import TunedSqliteSaver
+from Shared.ContentStore import merge_content
+
+
+class AgentState(TypedDict):
+    task: str
+    plan: str
+    draft: str
+    critique: str
+    content: Annotated[List[str], merge_content]
+    revision_number: int
+    max_revisions: int
+
+
+def snippets(revision: int) -> List[str]:
+    return [f"revision {revision} snippet {i}: " + " ".join(f"fact{revision}_{i}_{w}" for w in range(120))
+            for i in range(6)]
+
+
+def build_graph():
+    builder = StateGraph(AgentState)
+    builder.add_node("planner", lambda s: {"plan": "plan " * 200})
+    builder.add_node("research_plan", lambda s: {"content": snippets(0)})
+    builder.add_node("generate", lambda s: {"draft": f"draft {s['revision_number']} " + "text " * 800,
+                                            "revision_number": s["revision_number"] + 1})
+    builder.add_node("reflect", lambda s: {"critique": "critique " * 300})
+    builder.add_node("research_critique", lambda s: {"content": snippets(s["revision_number"])})
+    builder.set_entry_point("planner")
+    builder.add_edge("planner", "research_plan")
+    builder.add_edge("research_plan", "generate")
+    builder.add_conditional_edges("generate", lambda s: END if s["revision_number"] > s["max_revisions"] else "reflect",
+                                  {END: END, "reflect": "reflect"})
+    builder.add_edge("reflect", "research_critique")
+    builder.add_edge("research_critique", "generate")
+    return builder
+
+
+def disk_bytes(path: str) -> int:
+    """ Database plus WAL; before the WAL is checkpointed this is roughly everything written """
+    return sum(os.path.getsize(p) for p in (path, path + "-wal") if os.path.exists(p))
+
+
+class TimedSaver:
+    """ Wraps put / put_writes of a saver class to time them """
+
+    def __init__(self, saver):
+        self.saver, self.put_times, self.write_times = saver, [], []
+        put, put_writes = saver.put, saver.put_writes
+
+        def timed_put(*args, **kwargs):
+            start = time.perf_counter()
+            try:
+                return put(*args, **kwargs)
+            finally:
+                self.put_times.append(time.perf_counter() - start)
+
+        def timed_put_writes(*args, **kwargs):
+            start = time.perf_counter()
+            try:
+                return put_writes(*args, **kwargs)
+            finally:
+                self.write_times.append(time.perf_counter() - start)
+
+        saver.put, saver.put_writes = timed_put, timed_put_writes
+
+
+def run(name: str, make_saver, revisions: int, threads: int):
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, "checkpoints.db")
+        timed = TimedSaver(make_saver(path))
+        graph = build_graph().compile(checkpointer=timed.saver)
+        start = time.perf_counter()
+        for thread_id in range(threads):
+            graph.invoke({"task": "benchmark", "content": [], "revision_number": 1, "max_revisions": revisions},
+                         {"configurable": {"thread_id": str(thread_id)}, "recursion_limit": 10 * revisions})
+        total = time.perf_counter() - start
+        if hasattr(timed.saver, "flush"):
+            timed.saver.flush()
+        wal = disk_bytes(path)
+        timed.saver.conn.commit()
+        timed.saver.conn.execute("PRAGMA wal_checkpoint(TRUNCATE)")
+        size = disk_bytes(path)
+        steps = len(timed.put_times)
+        io_time = sum(timed.put_times) + sum(timed.write_times)
+        print(f"{name:<12} steps={steps:<4} written={wal / 1024:8.1f} KiB  db={size / 1024:8.1f} KiB  "
+              f"written/step={wal / steps:7.0f} B  "
+              f"io/step={io_time / steps * 1000:6.2f} ms  total={total:.2f}s")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--revisions", type=int, default=10)
+    parser.add_argument("--threads", type=int, default=3)
+    parser.add_argument("--keep-last", type=int, default=10)
+    args = parser.parse_args()
+
+    run("SqliteSaver", lambda path: SqliteSaver(sqlite3.connect(path, check_same_thread=False)),
+        args.revisions, args.threads)
+    run("Tuned", lambda path: TunedSqliteSaver.from_path(path), args.revisions, args.threads)
+    run("Tuned+prune", lambda path: TunedSqliteSaver.from_path(path, keep_last=args.keep_last),
+        args.revisions, args.threads)
+    run("Tuned+defer", lambda path: TunedSqliteSaver.from_path(path, keep_last=args.keep_last, defer_writes=True),
+        args.revisions, args.threads)
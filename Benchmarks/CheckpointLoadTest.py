@@ -0,0 +1,132 @@
+"""
+Load test for checkpointers: N interview threads run at once against a fake LLM,
+reports wall time and checkpoint throughput for MemorySaver, AsyncSqliteSaver
+(one connection behind a lock) and Shared.AsyncCheckpoint.PooledAsyncSqliteSaver.
+
+    python Benchmarks/CheckpointLoadTest.py --threads 50 --latency 0.02 --repeats 5
+
+The savers take turns on every repeat and the median is reported, so one noisy run does not decide.
+"""
+import argparse
+import asyncio
+import os
+import sys
+import tempfile
+import time
+import operator
+import statistics
+from typing import Annotated
+
+from langchain_core.messages import AIMessage, HumanMessage, get_buffer_string
+from langgraph.checkpoint.memory import MemorySaver
+from langgraph.checkpoint.sqlite.aio import AsyncSqliteSaver
+from langgraph.graph import START, END, StateGraph, MessagesState
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from Shared.AsyncCheckpoint import PooledAsyncSqliteSaver
+
+
+class FakeLLM:
+    """ Answers every call with the same text after `latency` seconds, without using threads """
+
+    def __init__(self, latency: float, text: str = "lorem ipsum dolor sit amet " * 10):
+        self.latency = latency
+        self.text = text
+
+    async def ainvoke(self, messages):
+        await asyncio.sleep(self.latency)
+        return AIMessage(content=self.text)
+
+
+class InterviewState(MessagesState):
+    max_num_turns: int
+    context: Annotated[list, operator.add]
+    interview: str
+    sections: list
+
+
+def build_interview_graph(llm):
+    """ Same topology as the ResearchAssistant interview graph """
+
+    async def ask_question(state):
+        return {"messages": [await llm.ainvoke(state["messages"])]}
+
+    async def search(state):
+        return {"context": [(await llm.ainvoke("query")).content * 20]}
+
+    async def answer_question(state):
+        answer = await llm.ainvoke(state["messages"])
+        return {"messages": [AIMessage(content=answer.content, name="expert")]}
+
+    def route_messages(state):
+        answers = [m for m in state["messages"] if isinstance(m, AIMessage) and m.name == "expert"]
+        return "save_interview" if len(answers) >= state.get("max_num_turns", 2) else "ask_question"
+
+    async def write_section(state):
+        return {"sections": [(await llm.ainvoke(state["interview"])).content]}
+
+    builder = StateGraph(InterviewState)
+    builder.add_node("ask_question", ask_question)
+    builder.add_node("search_web", search)
+    builder.add_node("search_wikipedia", search)
+    builder.add_node("answer_question", answer_question)
+    builder.add_node("save_interview", lambda state: {"interview": get_buffer_string(state["messages"])})
+    builder.add_node("write_section", write_section)
+    builder.add_edge(START, "ask_question")
+    builder.add_edge("ask_question", "search_web")
+    builder.add_edge("ask_question", "search_wikipedia")
+    builder.add_edge("search_web", "answer_question")
+    builder.add_edge("search_wikipedia", "answer_question")
+    builder.add_conditional_edges("answer_question", route_messages, ["ask_question", "save_interview"])
+    builder.add_edge("save_interview", "write_section")
+    builder.add_edge("write_section", END)
+    return builder
+
+
+async def run(saver, threads: int, latency: float) -> float:
+    """ Checkpoints written per second by `threads` interviews running at once """
+    llm = FakeLLM(latency)
+    graph = build_interview_graph(llm).compile(checkpointer=saver)
+
+    async def one(i):
+        await graph.ainvoke({"messages": [HumanMessage(content="So you said you were writing an article?")],
+                             "max_num_turns": 2}, {"configurable": {"thread_id": f"interview-{i}"}})
+
+    start = time.perf_counter()
+    await asyncio.gather(*[one(i) for i in range(threads)])
+    elapsed = time.perf_counter() - start
+
+    checkpoints = 0
+    for i in range(threads):
+        checkpoints += len([c async for c in saver.alist({"configurable": {"thread_id": f"interview-{i}"}})])
+    return checkpoints / elapsed
+
+
+async def main(args):
+    # Warm up imports and serializers so the first saver is not penalized
+    await run(MemorySaver(), 2, args.latency)
+    rates = {"MemorySaver": [], "AsyncSqliteSaver": [], "PooledAsyncSqliteSaver": []}
+    commits = []
+    with tempfile.TemporaryDirectory() as tmp:
+        for repeat in range(args.repeats):
+            rates["MemorySaver"].append(await run(MemorySaver(), args.threads, args.latency))
+            async with AsyncSqliteSaver.from_conn_string(os.path.join(tmp, f"single{repeat}.db")) as saver:
+                rates["AsyncSqliteSaver"].append(await run(saver, args.threads, args.latency))
+            with PooledAsyncSqliteSaver(os.path.join(tmp, f"pooled{repeat}.db"), readers=args.readers) as saver:
+                rates["PooledAsyncSqliteSaver"].append(await run(saver, args.threads, args.latency))
+                commits.append(saver.stats["commits"])
+    baseline = statistics.median(rates["AsyncSqliteSaver"])
+    for name, values in rates.items():
+        median = statistics.median(values)
+        print(f"{name:<24} median {median:8.0f} checkpoints/s  (min {min(values):.0f}, max {max(values):.0f})"
+              f"  x{median / baseline:.2f} vs AsyncSqliteSaver")
+    print(f"{'':<24} pooled writer: {statistics.median(commits):.0f} commits per run")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--threads", type=int, default=50, help="Interviews running at once")
+    parser.add_argument("--latency", type=float, default=0.02, help="Seconds per fake LLM call")
+    parser.add_argument("--readers", type=int, default=4)
+    parser.add_argument("--repeats", type=int, default=5)
+    asyncio.run(main(parser.parse_args()))
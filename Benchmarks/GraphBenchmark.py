@@ -0,0 +1,420 @@
+"""
+Offline benchmark of the real compiled graphs: EssayWriter, the ResearchAssistant interview and
+research graphs, LocalModelTest and both SimpleTests scripts run against scripted fake chat models
+and search clients with configurable latency. No API key, network or Ollama is needed.
+
+Per graph it reports end-to-end latency, the per-node breakdown (Shared.Instrumentation),
+peak Python memory (tracemalloc, separate run) and the bytes written by the checkpointer.
+
+    python Benchmarks/GraphBenchmark.py --save-baseline Benchmarks/GraphBaseline.json
+    python Benchmarks/GraphBenchmark.py --baseline Benchmarks/GraphBaseline.json   # exit code 1 on regression
+
+Latencies are "fixed:S", "uniform:A,B", "normal:MEAN,STD" or "lognormal:MEDIAN,SIGMA" seconds.
+Every fake response and delay is derived from the seed and the prompt, so runs are repeatable;
+what still varies is scheduling and sleep overshoot. The comparison therefore uses the median of
+the repeats and flags a metric only when it is both `--tolerance` and MIN_CHANGE above the baseline.
+"""
+import argparse
+import asyncio
+import contextlib
+import hashlib
+import importlib.util
+import io
+import json
+import math
+import os
+import random
+import statistics
+import sys
+import tempfile
+import threading
+import time
+import tracemalloc
+import typing
+import uuid
+from typing import Any, Callable, Dict, List, Optional
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.append(ROOT)
+# The search cache would answer repeated fake searches without their latency; keep it private and empty
+os.environ["SEARCH_CACHE_PATH"] = os.path.join(tempfile.mkdtemp(prefix="graph-benchmark-"), "SearchCache.db")
+
+from langchain_core.documents import Document
+from langchain_core.globals import set_llm_cache
+from langchain_core.language_models.chat_models import BaseChatModel
+from langchain_core.messages import AIMessage, HumanMessage
+from langchain_core.output_parsers import StrOutputParser
+from langchain_core.outputs import ChatGeneration, ChatResult
+from langchain_core.runnables import RunnableLambda
+from langgraph.checkpoint.memory import MemorySaver
+from pydantic import BaseModel
+
+from Shared.Clients import ClientRegistry
+from Shared.Instrumentation import MetricsRegistry, instrument
+from Shared.SearchCache import get_search_cache
+
+WORDS = ("agent graph model state node latency cache token search memory checkpoint thread query answer "
+         "analysis review essay draft source report section interview expert topic budget trip weather").split()
+
+
+class Latency:
+    """ Seeded delay distribution parsed from e.g. "lognormal:0.05,0.3" """
+
+    def __init__(self, spec: str):
+        self.spec = spec
+        kind, _, args = spec.partition(":")
+        self.kind = kind
+        self.args = [float(a) for a in args.split(",") if a]
+
+    def sample(self, rng: random.Random) -> float:
+        if self.kind == "fixed":
+            return self.args[0]
+        if self.kind == "uniform":
+            return rng.uniform(*self.args)
+        if self.kind == "normal":
+            return max(0.0, rng.gauss(*self.args))
+        if self.kind == "lognormal":
+            return rng.lognormvariate(math.log(self.args[0]), self.args[1])
+        raise ValueError(f"Unknown latency distribution: {self.spec}")
+
+
+class Script:
+    """ Seeded randomness per prompt: the same prompt gives the same answer and delay in every run """
+
+    def __init__(self, seed: int):
+        self.seed = seed
+        self._seen: Dict[str, int] = {}
+        self._lock = threading.Lock()
+
+    def rng(self, prompt: str) -> random.Random:
+        with self._lock:
+            occurrence = self._seen.get(prompt, 0)
+            self._seen[prompt] = occurrence + 1
+        digest = hashlib.sha256(f"{self.seed}\x00{occurrence}\x00{prompt}".encode()).digest()
+        return random.Random(int.from_bytes(digest[:8], "big"))
+
+
+def lorem(rng: random.Random, words: int) -> str:
+    return " ".join(rng.choice(WORDS) for _ in range(words))
+
+
+def fake_value(annotation, rng: random.Random, list_size: int = 3):
+    """ JSON-ready value for a pydantic field type; booleans are False so loops run their full course """
+    origin, args = typing.get_origin(annotation), typing.get_args(annotation)
+    if origin is typing.Union:
+        return fake_value(next(a for a in args if a is not type(None)), rng, list_size)
+    if origin in (list, List):
+        return [fake_value(args[0], rng, list_size) for _ in range(list_size)]
+    if isinstance(annotation, type) and issubclass(annotation, BaseModel):
+        return {name: fake_value(field.annotation, rng, list_size) for name, field in annotation.model_fields.items()}
+    if annotation is bool:
+        return False
+    if annotation is int:
+        return rng.randint(1, 100)
+    if annotation is float:
+        return round(rng.random(), 3)
+    return lorem(rng, 12)
+
+
+class ScriptedChatModel(BaseChatModel):
+    """
+    Chat model answering with seeded lorem text after a sampled delay. `with_structured_output(Schema)`
+    returns a filled Schema instance; the call still goes through the chat model, so callbacks,
+    token usage and instrumentation behave as with a real provider.
+    """
+
+    model: str = "scripted"
+    words: int = 150
+    latency: Any = None
+    script: Any = None
+
+    @property
+    def _llm_type(self) -> str:
+        return "scripted-fake"
+
+    def _respond(self, messages, schema) -> ChatResult:
+        prompt = "\n".join(str(m.content) for m in messages)
+        rng = self.script.rng(f"{self.model}\x00{prompt}")
+        if schema is None:
+            content = lorem(rng, self.words)
+        else:
+            content = json.dumps({name: fake_value(field.annotation, rng)
+                                  for name, field in schema.model_fields.items()})
+        usage = {"input_tokens": len(prompt.split()), "output_tokens": len(content.split()),
+                 "total_tokens": len(prompt.split()) + len(content.split())}
+        return ChatResult(generations=[ChatGeneration(message=AIMessage(content=content, usage_metadata=usage))]), rng
+
+    def _generate(self, messages, stop=None, run_manager=None, schema=None, **kwargs) -> ChatResult:
+        result, rng = self._respond(messages, schema)
+        time.sleep(self.latency.sample(rng))
+        return result
+
+    async def _agenerate(self, messages, stop=None, run_manager=None, schema=None, **kwargs) -> ChatResult:
+        result, rng = self._respond(messages, schema)
+        await asyncio.sleep(self.latency.sample(rng))
+        return result
+
+    def with_structured_output(self, schema, **kwargs):
+        return self.bind(schema=schema) | RunnableLambda(lambda message: schema.model_validate_json(message.content))
+
+
+class FakeSearch:
+    """
+    Tavily (async `search`), TavilySearchResults (`invoke`), WikipediaSearch and LocalDocumentSearch (`load`) in one:
+    `max_results` seeded documents per query after a sampled delay.
+    """
+
+    def __init__(self, latency: Latency, script: Script, max_results: int = 3, words: int = 120, **params):
+        self.latency = latency
+        self.script = script
+        self.max_results = max_results
+        self.load_max_docs = params.get("load_max_docs", max_results)
+        self.words = words
+
+    def _documents(self, query: str, count: int):
+        rng = self.script.rng(f"search\x00{query}")
+        return [{"url": f"https://example.com/{rng.randrange(10 ** 8)}", "content": lorem(rng, self.words)}
+                for _ in range(count)], self.latency.sample(rng)
+
+    def invoke(self, query: str):
+        documents, delay = self._documents(query, self.max_results)
+        time.sleep(delay)
+        return documents
+
+    async def search(self, query: str, max_results: int = 5, **params):
+        documents, delay = self._documents(query, max_results)
+        await asyncio.sleep(delay)
+        return {"query": query, "results": documents}
+
+    def load(self, query: str, k: int = None):
+        documents, delay = self._documents(query, k or self.load_max_docs)
+        time.sleep(delay)
+        return [Document(page_content=d["content"], metadata={"source": d["url"], "page": ""}) for d in documents]
+
+
+def fake_registry(args, script: Script) -> ClientRegistry:
+    llm_latency, search_latency = Latency(args.llm_latency), Latency(args.search_latency)
+
+    def chat(registry, model, **params):
+        return ScriptedChatModel(model=model, words=params.get("max_tokens", args.llm_words),
+                                 latency=llm_latency, script=script)
+
+    def search(registry, model=None, **params):
+        return FakeSearch(search_latency, script, **params)
+
+    return ClientRegistry({
+        "openai": chat,
+        # OllamaLLM answers with plain strings
+        "ollama": lambda registry, model, **params: chat(registry, model, **params) | StrOutputParser(),
+        "tavily": search,
+        "tavily_search": search,
+        "wikipedia": search,
+        "local_documents": search,
+    })
+
+
+def load_module(name: str, path: str):
+    sys.path.append(os.path.dirname(os.path.join(ROOT, path)))
+    spec = importlib.util.spec_from_file_location(name, os.path.join(ROOT, path))
+    module = importlib.util.module_from_spec(spec)
+    # Registered, so classes stored in checkpoints (e.g. Analyst) can be imported back
+    sys.modules[name] = module
+    spec.loader.exec_module(module)
+    return module
+
+
+def checkpoint_bytes(saver: MemorySaver) -> int:
+    """ Serialized bytes held by a MemorySaver: checkpoints, metadata and pending writes """
+    def size(value) -> int:
+        if isinstance(value, (bytes, bytearray)):
+            return len(value)
+        if isinstance(value, dict):
+            return sum(size(v) for v in value.values())
+        if isinstance(value, (list, tuple)):
+            return sum(size(v) for v in value)
+        return 0
+    return size(saver.storage) + size(saver.writes)
+
+
+# Scenario: (build(clients, checkpointer) -> graph, run(graph, config))
+
+def essay_writer():
+    module = load_module("essay_writer", "EssayWriter/EssayWriter.py")
+
+    def run(graph, config):
+        graph.invoke({"task": "What is the difference between LangChain and LangSmith", "max_revisions": 3,
+                      "revision_number": 1, "content": [], "draft": "", "stop_reason": ""}, config)
+    return lambda clients, saver: module.build_graph(checkpointer=saver, clients=clients), run
+
+
+def research_assistant():
+    return sys.modules.get("research_assistant") or load_module("research_assistant",
+                                                                "ResearchAssistant/researchAssistant.py")
+
+
+def interview():
+    module = research_assistant()
+    analyst = module.Analyst(affiliation="Benchmark Lab", name="Ada", role="Performance analyst",
+                             description="Focuses on latency and cost of agent graphs.")
+
+    def run(graph, config):
+        graph.invoke({"analyst": analyst, "max_num_turns": 2,
+                      "messages": [HumanMessage("So you said you were writing an article on LangGraph?")]}, config)
+    return lambda clients, saver: module.build_interview_graph(checkpointer=saver, clients=clients), run
+
+
+def research():
+    module = research_assistant()
+
+    def run(graph, config):
+        # Stops before human_feedback; resuming without feedback runs the interviews and the report
+        graph.invoke({"topic": "How to start business with LangChain", "max_analysts": 3}, config)
+        graph.invoke(None, config)
+    return lambda clients, saver: module.build_research_graph(checkpointer=saver, clients=clients), run
+
+
+def local_model_test():
+    module = load_module("local_model_test", "LocalModelTest/main.py")
+
+    def run(graph, config):
+        graph.invoke({"topic": "Time machine development"}, config)
+    return lambda clients, saver: module.build_graph(checkpointer=saver, clients=clients), run
+
+
+def ping_pong():
+    module = load_module("simple_tests_main", "SimpleTests/main.py")
+
+    def run(graph, config):
+        graph.invoke({"topic": "Miami", "FirstAgentMessage": "", "SecondAgentMessage": "",
+                      "current_iteration": 1, "max_iterations": 3}, config)
+    # build_graph has no checkpointer argument
+    return lambda clients, saver: module.build_graph(clients).copy({"checkpointer": saver}), run
+
+
+def conversation():
+    module = load_module("conversation_of_two", "SimpleTests/ConversationOfTwo.py")
+
+    def run(graph, config):
+        graph.invoke({"topic": "Fusion energy", "current_iteration": 0, "max_iterations": 10,
+                      "history": [], "history_text": "", "summary": ""}, config)
+    return lambda clients, saver: module.build_graph(clients).copy({"checkpointer": saver}), run
+
+
+SCENARIOS: Dict[str, Callable] = {
+    "essay_writer": essay_writer,
+    "interview": interview,
+    "research": research,
+    "local_model_test": local_model_test,
+    "ping_pong": ping_pong,
+    "conversation": conversation,
+}
+
+
+def run_once(build, run, clients, metrics: Optional[MetricsRegistry], name: str):
+    saver = MemorySaver()
+    graph = build(clients, saver)
+    if metrics is not None:
+        graph = instrument(graph, registry=metrics, name=name)
+    config = {"configurable": {"thread_id": str(uuid.uuid4())}, "recursion_limit": 100}
+    get_search_cache().clear()
+    started = time.perf_counter()
+    with contextlib.redirect_stdout(io.StringIO()):  # the graphs print their progress
+        run(graph, config)
+    return time.perf_counter() - started, checkpoint_bytes(saver)
+
+
+def benchmark(name: str, args) -> Dict[str, Any]:
+    build, run = SCENARIOS[name]()
+    metrics = MetricsRegistry()
+    latencies, stored = [], 0
+    for repeat in range(args.repeats):
+        # Same seed every repeat: identical work, only the timing differs
+        clients = fake_registry(args, Script(args.seed))
+        elapsed, stored = run_once(build, run, clients, metrics, name)
+        latencies.append(elapsed)
+
+    # Peak memory in a separate run, tracemalloc slows everything down
+    tracemalloc.start()
+    run_once(build, run, fake_registry(args, Script(args.seed)), None, name)
+    peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+
+    nodes = {row["node"]: {"mean_s": row["mean_s"], "calls_per_run": row["count"] / args.repeats}
+             for row in metrics.top(n=50)}
+    return {
+        "e2e_mean_s": round(statistics.mean(latencies), 4),
+        "e2e_median_s": round(statistics.median(latencies), 4),
+        "e2e_min_s": round(min(latencies), 4),
+        "e2e_max_s": round(max(latencies), 4),
+        "peak_memory_mb": round(peak / 2 ** 20, 2),
+        "checkpoint_bytes": stored,
+        "nodes": nodes,
+    }
+
+
+# Compared against the baseline: a result above baseline * (1 + tolerance) and at least
+# MIN_CHANGE above the baseline is a regression (short graphs jitter by tens of milliseconds)
+COMPARED = ("e2e_median_s", "peak_memory_mb", "checkpoint_bytes")
+MIN_CHANGE = {"e2e_median_s": 0.15, "peak_memory_mb": 0.25, "checkpoint_bytes": 1024}
+
+
+def compare(results: Dict[str, dict], baseline: Dict[str, dict], tolerance: float) -> List[str]:
+    regressions = []
+    for name, result in results.items():
+        if name not in baseline["results"]:
+            continue
+        for metric in COMPARED:
+            if metric not in baseline["results"][name]:
+                print(f"{name:18} {metric:18} not in the baseline, save a new one")
+                continue
+            old, new = baseline["results"][name][metric], result[metric]
+            change = (new - old) / old if old else 0.0
+            flag = "  REGRESSION" if change > tolerance and new - old >= MIN_CHANGE[metric] else ""
+            print(f"{name:18} {metric:18} {old:>12} -> {new:>12}  {change:+7.1%}{flag}")
+            if flag:
+                regressions.append(f"{name}.{metric}")
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--graphs", nargs="+", choices=sorted(SCENARIOS), default=list(SCENARIOS))
+    parser.add_argument("--repeats", type=int, default=5)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--llm-latency", default="lognormal:0.05,0.3")
+    parser.add_argument("--search-latency", default="lognormal:0.1,0.5")
+    parser.add_argument("--llm-words", type=int, default=150, help="words per free-text answer")
+    parser.add_argument("--save-baseline", metavar="PATH", help="write the results as a baseline")
+    parser.add_argument("--baseline", metavar="PATH", help="compare with a saved baseline")
+    parser.add_argument("--tolerance", type=float, default=0.2, help="allowed slowdown/growth vs the baseline")
+    args = parser.parse_args()
+
+    set_llm_cache(None)  # every call pays its scripted latency
+    results = {}
+    for name in args.graphs:
+        result = benchmark(name, args)
+        results[name] = result
+        print(f"{name:18} e2e {result['e2e_median_s']:7.3f}s (min {result['e2e_min_s']:.3f}, "
+              f"max {result['e2e_max_s']:.3f})  peak {result['peak_memory_mb']:7.2f} MB  "
+              f"checkpoints {result['checkpoint_bytes'] / 1024:8.1f} KB")
+        for node, row in sorted(result["nodes"].items(), key=lambda item: -item[1]["mean_s"] * item[1]["calls_per_run"]):
+            print(f"    {node:24} {row['mean_s']:7.3f}s x {row['calls_per_run']:g}")
+
+    settings = {key: getattr(args, key) for key in ("repeats", "seed", "llm_latency", "search_latency", "llm_words")}
+    if args.save_baseline:
+        with open(args.save_baseline, "w", encoding="utf-8") as file:
+            json.dump({"settings": settings, "results": results}, file, indent=2, sort_keys=True)
+        print(f"Baseline saved as '{args.save_baseline}'")
+    if args.baseline:
+        with open(args.baseline, encoding="utf-8") as file:
+            baseline = json.load(file)
+        if baseline["settings"] != settings:
+            print(f"Warning: baseline was recorded with {baseline['settings']}")
+        regressions = compare(results, baseline, args.tolerance)
+        if regressions:
+            print(f"Regressions: {', '.join(regressions)}")
+            sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
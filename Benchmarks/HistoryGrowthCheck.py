@@ -0,0 +1,94 @@
+"""
+State size of the LocalModelTest Analyst/Reviewer loop over a long run, with and without the
+compact history mode. Fails if the compact state keeps growing with the number of turns or a
+summary produced by summarize_node exceeds SUMMARY_WORDS.
+
+    python Benchmarks/HistoryGrowthCheck.py --turns 40
+"""
+import argparse
+import contextlib
+import importlib.util
+import io
+import itertools
+import os
+import sys
+
+from langchain_core.runnables import RunnableLambda
+from langgraph.checkpoint.memory import MemorySaver
+from langgraph.checkpoint.serde.jsonplus import JsonPlusSerializer
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.append(ROOT)
+
+
+def load_local_model_test():
+    spec = importlib.util.spec_from_file_location("local_model_test", os.path.join(ROOT, "LocalModelTest", "main.py"))
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    return module
+
+
+_reports = itertools.count(1)
+
+
+def fake_llm(messages):
+    """
+    Fixed-length (numbered) reports and reviews, so any growth in the state comes from the history itself.
+    The summarizer never shortens anything: it answers with the whole new transcript followed by the
+    old summary, so only the summary limit keeps the state bounded.
+    """
+    system = messages[0].content
+    if "Alise, a highly skilled" in system:
+        return f"report {next(_reports)} " + ("report " * 149).strip()
+    if "Mark, a technical reviewer" in system:
+        return ("review " * 100).strip()
+    previous = system.split("Current summary:", 1)[1].strip()
+    return f"{messages[1].content} {previous}"
+
+
+def run(module, turns: int, compact: bool):
+    """
+    Returns the serialized state size (bytes), message count and summary after every analyst turn.
+    """
+    module.MAX_ANALYST_TURNS = turns
+    graph = module.build_graph(model=RunnableLambda(fake_llm), compact_history=compact, checkpointer=MemorySaver(),
+                               convergence=None)
+    serde = JsonPlusSerializer()
+
+    sizes, counts, summaries, last_turn = [], [], [], 0
+    config = {"configurable": {"thread_id": "check"}, "recursion_limit": 4 * turns + 10}
+    with contextlib.redirect_stdout(io.StringIO()):  # the nodes print every answer
+        for state in graph.stream({"topic": "Time machine development"}, config, stream_mode="values"):
+            if state.get("turn", 0) != last_turn:
+                last_turn = state["turn"]
+                sizes.append(len(serde.dumps(state)))
+                counts.append(len(state["messages"]))
+                summaries.append(state.get("summary", ""))
+    return sizes, counts, summaries
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--turns", type=int, default=40)
+    args = parser.parse_args()
+
+    module = load_local_model_test()
+    for compact in (False, True):
+        sizes, counts, summaries = run(module, args.turns, compact)
+        print(f"compact={compact!s:5}  turn 1: {sizes[0]:7d} B / {counts[0]} msgs   "
+              f"turn {len(sizes)}: {sizes[-1]:7d} B / {counts[-1]} msgs")
+
+    # Compact mode: after the first summary the state no longer depends on the number of turns
+    steady = sizes[2:]
+    assert len(sizes) == args.turns, sizes
+    assert max(counts) <= module.KEEP_MESSAGES + 1, counts
+    assert max(steady) - min(steady) <= 0.05 * max(steady), steady
+    # The summaries really come from the transcript, and the longest one is cut at the limit
+    words = [len(summary.split()) for summary in summaries]
+    assert len(set(summaries)) > 2, words
+    assert max(words) == module.SUMMARY_WORDS, words
+    print("compact state size is stable")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,81 @@
+"""
+Time to import each script as a module in a fresh interpreter (median of several runs), plus the
+slowest imports reported by `python -X importtime`. Importing must not build clients that call
+out, draw diagrams or run a graph; the numbers show what a test or a batch job pays on startup.
+
+    python Benchmarks/ImportTimeBenchmark.py --runs 5
+"""
+import argparse
+import os
+import statistics
+import subprocess
+import sys
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+SCRIPTS = [
+    "EssayWriter/EssayWriter.py",
+    "ResearchAssistant/researchAssistant.py",
+    "SimpleTests/main.py",
+    "SimpleTests/ConversationOfTwo.py",
+    "LocalModelTest/main.py",
+    "TravelPlanner/TravelPlanner.py",
+]
+
+IMPORT = """
+import importlib.util, sys, time
+started = time.perf_counter()
+spec = importlib.util.spec_from_file_location("script", sys.argv[1])
+module = importlib.util.module_from_spec(spec)
+spec.loader.exec_module(module)
+print(time.perf_counter() - started)
+"""
+
+# The clients only need a key to be constructed, nothing is called during import
+ENV = {**os.environ, "OPENAI_API_KEY": os.getenv("OPENAI_API_KEY", "benchmark"),
+       "TAVILY_API_KEY": os.getenv("TAVILY_API_KEY", "benchmark")}
+
+
+def import_time(path: str) -> float:
+    result = subprocess.run([sys.executable, "-c", IMPORT, path], cwd=os.path.dirname(path), env=ENV,
+                            capture_output=True, text=True, timeout=120)
+    if result.returncode:
+        raise RuntimeError(result.stderr.strip().splitlines()[-1])
+    return float(result.stdout.strip().splitlines()[-1])
+
+
+def slowest_imports(path: str, top: int):
+    """
+    Top-level packages with the largest cumulative import time, from `-X importtime`.
+    """
+    result = subprocess.run([sys.executable, "-X", "importtime", "-c", IMPORT, path], cwd=os.path.dirname(path),
+                            env=ENV, capture_output=True, text=True, timeout=120)
+    rows = []
+    for line in result.stderr.splitlines():
+        if not line.startswith("import time:") or "cumulative" in line:
+            continue
+        _, cumulative, name = line[len("import time:"):].split("|")
+        if name == " " + name.strip():  # nested imports are indented further
+            rows.append((int(cumulative), name.strip()))
+    return sorted(rows, reverse=True)[:top]
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--runs", type=int, default=5)
+    parser.add_argument("--top", type=int, default=3, help="slowest imports shown per script")
+    args = parser.parse_args()
+
+    for script in SCRIPTS:
+        path = os.path.join(ROOT, script)
+        try:
+            times = [import_time(path) for _ in range(args.runs)]
+        except RuntimeError as error:
+            print(f"{script:42} failed: {error}")
+            continue
+        slowest = ", ".join(f"{name} {us / 1000:.0f}ms" for us, name in slowest_imports(path, args.top))
+        print(f"{script:42} {statistics.median(times):6.2f}s   {slowest}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,71 @@
+"""
+Compares sequential search (old research nodes) with the concurrent fan-out from Shared.SearchFanout.
+Runs fully offline against a fake search client with a fixed latency.
+
+    python Benchmarks/SearchFanoutBenchmark.py --latency 0.4 --queries 3
+"""
+import argparse
+import asyncio
+import os
+import sys
+import time
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from Shared.SearchFanout import search_all, collect_contents
+
+
+class FakeSearchClient:
+    """ Sync stand-in for TavilyClient """
+
+    def __init__(self, latency: float):
+        self.latency = latency
+
+    def search(self, query: str, max_results: int = 5, **kwargs):
+        time.sleep(self.latency)
+        return {"results": [{"content": f"{query} #{i}"} for i in range(max_results)]}
+
+
+class FakeAsyncSearchClient(FakeSearchClient):
+    """ Async stand-in for AsyncTavilyClient """
+
+    async def search(self, query: str, max_results: int = 5, **kwargs):
+        await asyncio.sleep(self.latency)
+        return {"results": [{"content": f"{query} #{i}"} for i in range(max_results)]}
+
+
+def run_sequential(client, queries):
+    content = []
+    for q in queries:
+        response = client.search(query=q, max_results=2)
+        for r in response['results']:
+            content.append(r['content'])
+    return content
+
+
+def run_fanout(client, queries, max_concurrency):
+    return collect_contents(search_all(client, queries, max_concurrency=max_concurrency, max_results=2))
+
+
+def timed(fn, *args):
+    start = time.perf_counter()
+    result = fn(*args)
+    return time.perf_counter() - start, result
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--latency", type=float, default=0.4, help="Seconds per fake search call")
+    parser.add_argument("--queries", type=int, default=3)
+    parser.add_argument("--max-concurrency", type=int, default=3)
+    args = parser.parse_args()
+
+    queries = [f"query {i}" for i in range(args.queries)]
+
+    seq_time, expected = timed(run_sequential, FakeSearchClient(args.latency), queries)
+    print(f"sequential:         {seq_time:.3f}s")
+
+    for name, client in [("fan-out (sync)", FakeSearchClient(args.latency)),
+                         ("fan-out (async)", FakeAsyncSearchClient(args.latency))]:
+        elapsed, content = timed(run_fanout, client, queries, args.max_concurrency)
+        assert content == expected, "fan-out must keep query order"
+        print(f"{name + ':':<20}{elapsed:.3f}s  ({seq_time / elapsed:.1f}x)")
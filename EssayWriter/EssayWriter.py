@@ -1,30 +1,46 @@
-import sqlite3
+import argparse
+import sys
+from functools import partial
 from dotenv import load_dotenv
 from langgraph.graph import StateGraph, END
 from typing import TypedDict, Annotated, List
-from langgraph.checkpoint.sqlite import SqliteSaver
 from langchain_core.messages import AnyMessage, SystemMessage, HumanMessage, AIMessage, ChatMessage
-from langchain_openai import ChatOpenAI
-from pydantic import BaseModel
-from tavily import TavilyClient
+from pydantic import BaseModel, Field
 import os
+import uuid
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from Shared.SearchFanout import search_all, collect_contents
+from Shared.SearchCache import CachedAsyncSearchClient
+from Shared.ContentStore import merge_content
+from Shared.SnippetIndex import SnippetIndex, HashingEmbedder
+from Shared.LLMCache import enable_llm_cache
+from Shared.Streaming import run_streaming
+from Shared.Checkpoint import TunedSqliteSaver
+from Shared.Diagram import add_draw_argument, draw
+from Shared.Instrumentation import add_metrics_argument, instrument, write_metrics
+from Shared.Clients import ClientRegistry, default_registry
+from Shared.Convergence import ConvergenceDetector, STOP_MAX_ITERATIONS, STOP_NO_MAJOR_ISSUES
 
 _ = load_dotenv()
 
 db_path = "EssayWriterMemory.db"
-conn = sqlite3.connect(db_path, check_same_thread=False)
-memory = SqliteSaver(conn)
+CHECKPOINTS_KEPT_PER_THREAD = 25
 
 class AgentState(TypedDict):
     task: str                   # start task from user
     plan: str                   # plan generated by llm
     draft: str                  # tmp draft of essay
     critique: str               # critique generated by llm
-    content: List[str]          # list of info that were found by researcher llm with tools
+    critique_queries: List[str] # search queries for the revisions requested by the critique
+    content: Annotated[List[str], merge_content]  # deduplicated, bounded info found by researcher llm with tools
     revision_number: int        # current revision num
     max_revisions: int          # max revisions num
+    stop_reason: str            # why the revise loop stopped: converged, no_major_issues or max_iterations
 
-model = ChatOpenAI(model="gpt-3.5-turbo", temperature=0.6)
+# Clients come from a ClientRegistry when the graph is built (see build_graph)
+MODEL = "gpt-3.5-turbo"
+TEMPERATURE = 0.6
 
 PLAN_PROMPT = """You are an expert writer tasked with writing a high level outline of an essay. \
 Write such an outline for the user provided topic. Give an outline of the essay along with any relevant notes \
@@ -42,24 +58,40 @@ Utilize all the information below as needed:
 
 REFLECTION_PROMPT = """You are a teacher grading an essay submission. \
 Generate critique and recommendations for the user's submission. \
-Provide detailed recommendations, including requests for length, depth, style, etc."""
+Provide detailed recommendations, including requests for length, depth, style, etc. \
+If only minor polishing is left, say that the essay has no major issues. \
+Also generate a list of search queries that will gather any information needed to make the requested revisions. \
+Only generate 3 queries max."""
 
 RESEARCH_PLAN_PROMPT = """You are a researcher charged with providing information that can \
 be used when writing the following essay. Generate a list of search queries that will gather \
 any relevant information. Only generate 3 queries max."""
 
-RESEARCH_CRITIQUE_PROMPT = """You are a researcher charged with providing information that can \
-be used when making any requested revisions (as outlined below). \
-Generate a list of search queries that will gather any relevant information. Only generate 3 queries max."""
-
 
 class Queries(BaseModel):
     queries: List[str]
 
-tavily = TavilyClient(api_key=os.environ["TAVILY_API_KEY"])
 
+class Reflection(BaseModel):
+    critique: str = Field(description="Critique and recommendations for the essay.")
+    no_major_issues: bool = Field(description="True if only minor polishing is left.")
+    queries: List[str] = Field(description="Up to 3 search queries for the requested revisions.")
+
+SEARCH_MAX_CONCURRENCY = 3      # queries in flight at once (we generate 3 max)
+SEARCH_TIMEOUT = 15.0           # seconds per query, a slow query is dropped instead of blocking the node
+WRITER_TOP_K = 8                # snippets passed to the writer
+WRITER_TOKEN_BUDGET = 1500      # max tokens of snippets in the writer prompt
+
+# Lives across revisions, so old snippets are embedded only once; least recently used snippets
+# are dropped past SNIPPET_INDEX_MAX, so a long-running process does not keep every essay's research.
+# Swap in LangChainEmbedder(OpenAIEmbeddings()) for model embeddings.
+snippet_index = SnippetIndex(HashingEmbedder())
 
-def plan_node(state: AgentState):
+# Stops revising once consecutive drafts barely change; build_graph(convergence=None) always runs max_revisions
+CONVERGENCE = ConvergenceDetector()
+
+
+def plan_node(state: AgentState, model):
     """
     Takes plan_prompt and user's task from state and takes response from model.
     """
@@ -71,30 +103,31 @@ def plan_node(state: AgentState):
     return {"plan": response.content}
 
 
-def research_plan_node(state: AgentState):
+def research_plan_node(state: AgentState, model, tavily):
     """
     Ask model about three search queries.
     It's return must be an object strictly specified by Pydantic(list of strings in our case).
-    We use tavily research then on it.
+    We use tavily research then on it, all queries are sent at once.
+    Only new snippets are returned, the `content` reducer deduplicates and bounds them.
     """
     queries = model.with_structured_output(Queries).invoke([
         SystemMessage(content=RESEARCH_PLAN_PROMPT),
         HumanMessage(content=state['task'])
     ])
-    content = state['content'] or []
-    for q in queries.queries:
-        response = tavily.search(query=q, max_results=2)
-        for r in response['results']:
-            content.append(r['content'])
-    return {"content": content}
+    responses = search_all(tavily, queries.queries, max_concurrency=SEARCH_MAX_CONCURRENCY,
+                           timeout=SEARCH_TIMEOUT, max_results=2)
+    return {"content": collect_contents(responses)}
 
 
-def generation_node(state: AgentState):
+def generation_node(state: AgentState, model, convergence):
     """
     Connect all parts(task, plan and content) to generate version of essay.
-    Return draft and increased revision number.
+    Only the most relevant snippets within the token budget go to the prompt.
+    Return draft, increased revision number and, if the loop should end here, why.
     """
-    content = "\n\n".join(state['content'] or [])
+    query = f"{state['task']}\n{state['plan']}\n{state.get('critique', '')}"
+    content = "\n\n".join(snippet_index.select(state['content'] or [], query,
+                                                k=WRITER_TOP_K, token_budget=WRITER_TOKEN_BUDGET))
     user_message = HumanMessage(
         content=f"{state['task']}\n\nHere is my plan:\n\n{state['plan']}")
 
@@ -106,83 +139,144 @@ def generation_node(state: AgentState):
         ]
 
     response = model.invoke(messages)
+    revision_number = state.get("revision_number", 1) + 1
+    stop_reason = convergence.stop_reason(state.get("draft"), response.content) if convergence else ""
+    if not stop_reason and revision_number > state["max_revisions"]:
+        stop_reason = STOP_MAX_ITERATIONS
     return {
         "draft": response.content,
-        "revision_number": state.get("revision_number", 1) + 1
+        "revision_number": revision_number,
+        "stop_reason": stop_reason,
     }
 
 
-def reflection_node(state: AgentState):
+def reflection_node(state: AgentState, model):
     """
-    Takes draft and reflection prompt to generate critique and recommendations.
+    Takes draft and reflection prompt to generate critique and recommendations,
+    whether any major issues are left and the search queries for the revision, all in one call.
     """
     messages = [
         SystemMessage(content=REFLECTION_PROMPT),
         HumanMessage(content=state['draft'])
     ]
-    response = model.invoke(messages)
-    return {"critique": response.content}
+    reflection = model.with_structured_output(Reflection).invoke(messages)
+    return {
+        "critique": reflection.critique,
+        "critique_queries": reflection.queries[:SEARCH_MAX_CONCURRENCY],
+        "stop_reason": STOP_NO_MAJOR_ISSUES if reflection.no_major_issues else "",
+    }
 
 
-def research_critique_node(state: AgentState):
-    queries = model.with_structured_output(Queries).invoke([
-        SystemMessage(content=RESEARCH_CRITIQUE_PROMPT),
-        HumanMessage(content=state['critique'])
-    ])
-    content = state['content'] or []
-    for q in queries.queries:
-        response = tavily.search(query=q, max_results=2)
-        for r in response['results']:
-            content.append(r['content'])
-    return {"content": content}
+def research_critique_node(state: AgentState, tavily):
+    """
+    Searches the queries the reflection asked for, all at once; no extra LLM call.
+    """
+    responses = search_all(tavily, state['critique_queries'], max_concurrency=SEARCH_MAX_CONCURRENCY,
+                           timeout=SEARCH_TIMEOUT, max_results=2)
+    return {"content": collect_contents(responses)}
 
 
 def should_continue(state):
     """
-    Checks if we can make one more iteration.
+    Checks if we can make one more iteration: the draft has not converged and revisions are left.
     """
-    if state["revision_number"] > state["max_revisions"]:
+    if state.get("stop_reason"):
         return END
     return "reflect"
 
 
-builder = StateGraph(AgentState)
-
-builder.add_node("planner", plan_node)
-builder.add_node("generate", generation_node)
-builder.add_node("reflect", reflection_node)
-builder.add_node("research_plan", research_plan_node)
-builder.add_node("research_critique", research_critique_node)
-
-builder.set_entry_point("planner")
-
-builder.add_conditional_edges(
-    "generate",
-    should_continue,
-    {END: END, "reflect": "reflect"}
-)
-
-builder.add_edge("planner", "research_plan")
-builder.add_edge("research_plan", "generate")
-
-builder.add_edge("reflect", "research_critique")
-builder.add_edge("research_critique", "generate")
-
-graph = builder.compile(checkpointer=memory)
-
-# Save as PNG
-graph_image = graph.get_graph().draw_mermaid_png()
-with open("graph_diagram.png", "wb") as file:
-    file.write(graph_image)
-print("Saved as PNG 'graph_diagram.png'")
+def should_revise(state):
+    """
+    The reviewer found no major issues, so the current draft is final.
+    """
+    if state.get("stop_reason"):
+        return END
+    return "research_critique"
 
-# Now lets try use it
-# thread = {"configurable": {"thread_id": "1"}}
-# for s in graph.stream({
-#     'task': "what is the difference between langchain and langsmith",
-#     "max_revisions": 3,
-#     "revision_number": 1,
-#     "content": []
-# }, thread):
-#     print(s)
 
+def build_graph(checkpointer=None, clients: ClientRegistry = None,
+                convergence: ConvergenceDetector = CONVERGENCE):
+    """
+    Compiles the essay graph. By default checkpoints go to EssayWriterMemory.db and clients
+    come from the process-wide registry; pass a registry with fake factories to test offline.
+    convergence: ends the loop early on similar drafts; None always runs max_revisions.
+    """
+    clients = clients or default_registry
+    if checkpointer is None:
+        # WAL + batched commits, large fields stored once per version, only the last checkpoints of a thread are kept
+        checkpointer = TunedSqliteSaver.from_path(db_path, keep_last=CHECKPOINTS_KEPT_PER_THREAD)
+
+    model = clients.get("openai", MODEL, temperature=TEMPERATURE)
+    # Repeated queries across revisions are answered from the shared on-disk search cache
+    tavily = CachedAsyncSearchClient(clients.get("tavily"))
+
+    builder = StateGraph(AgentState)
+
+    builder.add_node("planner", partial(plan_node, model=model))
+    builder.add_node("generate", partial(generation_node, model=model, convergence=convergence))
+    builder.add_node("reflect", partial(reflection_node, model=model))
+    builder.add_node("research_plan", partial(research_plan_node, model=model, tavily=tavily))
+    builder.add_node("research_critique", partial(research_critique_node, tavily=tavily))
+
+    builder.set_entry_point("planner")
+
+    builder.add_conditional_edges(
+        "generate",
+        should_continue,
+        {END: END, "reflect": "reflect"}
+    )
+
+    builder.add_edge("planner", "research_plan")
+    builder.add_edge("research_plan", "generate")
+
+    builder.add_conditional_edges(
+        "reflect",
+        should_revise,
+        {END: END, "research_critique": "research_critique"}
+    )
+    builder.add_edge("research_critique", "generate")
+
+    return builder.compile(checkpointer=checkpointer)
+
+
+# Nodes whose tokens are streamed to the user
+STREAMING_NODES = ("generate",)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Plan, research, write and revise an essay.")
+    parser.add_argument("--task", help="essay task, e.g. 'what is the difference between langchain and langsmith'")
+    parser.add_argument("--max-revisions", type=int, default=3)
+    add_draw_argument(parser)
+    add_metrics_argument(parser)
+    args = parser.parse_args()
+
+    graph = build_graph()
+    if args.draw:
+        draw(graph, "graph_diagram", args.draw)
+    if not args.task:
+        return
+    if args.metrics:
+        graph = instrument(graph, jsonl_path=args.metrics, name="EssayWriter")
+
+    # Re-runs with the same inputs are answered from LLMCache.db
+    enable_llm_cache()
+
+    # Drafts are printed token by token as they are written. Every run gets its own thread:
+    # `content` is merged by its reducer, so a reused thread would carry snippets of earlier essays
+    thread = {"configurable": {"thread_id": str(uuid.uuid4())}}
+    final_state = run_streaming(graph, {
+        'task': args.task,
+        "max_revisions": args.max_revisions,
+        "revision_number": 1,
+        "draft": "",
+        "stop_reason": "",
+        "content": []
+    }, thread, nodes=STREAMING_NODES)
+    print(f"\nStopped after revision {final_state['revision_number'] - 1}: {final_state['stop_reason']}")
+    if args.metrics:
+        write_metrics(args.metrics)
+
+
+if __name__ == "__main__":
+    main()
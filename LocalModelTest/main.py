@@ -1,10 +1,20 @@
-from langchain_core.messages import SystemMessage
-from langchain_ollama import OllamaLLM
+import argparse
+import os
+import sys
+from functools import partial
+from langchain_core.messages import AIMessage, HumanMessage, RemoveMessage, SystemMessage
 from langgraph.constants import END
 from langgraph.graph import MessagesState, StateGraph
 
-# Инициализация модели
-llm = OllamaLLM(model="phi4")
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from Shared.LLMCache import enable_llm_cache
+from Shared.Diagram import add_draw_argument, draw
+from Shared.Instrumentation import add_metrics_argument, instrument, write_metrics
+from Shared.Clients import ClientRegistry, default_registry
+from Shared.Convergence import ConvergenceDetector, STOP_MAX_ITERATIONS
+
+# Модель берётся из реестра клиентов при сборке графа
+MODEL = "phi4"
 
 # Промпты для аналитика и ревьюера
 ANALYST_PROMPT = """
@@ -33,12 +43,31 @@ You should:
 Your feedback should be precise, focusing on improving the technical quality of the analysis, uncovering any weaknesses or oversights, and ensuring the solution is robust and efficient.
 """
 
+SUMMARY_PROMPT = """
+You keep the running summary of a technical discussion about {topic} between Alise (analyst) and Mark (reviewer).
+Update the summary with the new messages below. Keep the decisions made, open issues and the reviewer's
+recommendations that are still relevant; drop repetition. Answer with the updated summary only, in at most {words} words.
+
+Current summary:
+{summary}
+"""
+
+MAX_ANALYST_TURNS = 4   # Аналитик отвечает 4 раза (раньше: стоп после 7 сообщений)
+KEEP_MESSAGES = 2       # Последний обмен (отчёт + рецензия) хранится дословно
+SUMMARY_WORDS = 200     # Предел длины сводки: в промпте и жёсткая обрезка, если модель его не соблюдает
+
+# Останавливает цикл, когда новый отчёт почти не отличается от предыдущего; build_graph(convergence=None) отключает
+CONVERGENCE = ConvergenceDetector()
+
 # Класс состояния
 class CustomState(MessagesState):
     topic: str
+    summary: str  # Свёрнутая история старых ходов
+    turn: int     # Количество ответов аналитика
+    stop_reason: str  # Почему цикл завершился: converged или max_iterations, пусто — продолжаем
 
 # Узлы графа
-def analyst_node(state):
+def analyst_node(state, model, convergence):
     topic = state["topic"]
     print(f"Analyst Alise activated.")
 
@@ -50,6 +79,8 @@ def analyst_node(state):
             "Your previous report: \n" + messages[-2].content + "\n\n\n" +
             "Reviewers recommendations: \n" + messages[-1].content
         )
+        if state.get("summary"):
+            last_message = "Summary of the earlier discussion: \n" + state["summary"] + "\n\n\n" + last_message
     else:
         last_message = "This is the beginning of the conversation. Make your initial analysis based on the questionnaire results."
 
@@ -57,16 +88,24 @@ def analyst_node(state):
         SystemMessage(content=system_prompt),
         last_message
     ]
-    output = llm.invoke(llm_messages)
+    output = model.invoke(llm_messages)
 
     print("=" * 50)
     print("Analyst Alise output:")
     print(output)
     print("=" * 50)
 
-    return {"messages": messages + [output]}
+    # Сравниваем с предыдущим отчётом (messages[-2]: последний обмен всегда хранится дословно)
+    turn = state.get("turn", 0) + 1
+    previous_report = messages[-2].content if messages else None
+    stop_reason = convergence.stop_reason(previous_report, output) if convergence else ""
+    if not stop_reason and turn >= MAX_ANALYST_TURNS:
+        stop_reason = STOP_MAX_ITERATIONS
 
-def reviewer_node(state):
+    # Возвращаем только новое сообщение: add_messages сам дописывает его в историю
+    return {"messages": [AIMessage(content=output, name="Alise")], "turn": turn, "stop_reason": stop_reason}
+
+def reviewer_node(state, model):
     topic = state["topic"]
     print(f"Reviewer Mark activated.")
 
@@ -77,44 +116,97 @@ def reviewer_node(state):
         SystemMessage(content=system_prompt),
         last_message
     ]
-    output = llm.invoke(llm_messages)
+    output = model.invoke(llm_messages)
 
     print("=" * 50)
     print("Reviewer Mark output:")
     print(output)
     print("=" * 50)
 
-    return {"messages": state["messages"] + [output]}
+    return {"messages": [AIMessage(content=output, name="Mark")]}
+
+def summarize_node(state, model):
+    """
+    Folds everything but the last exchange into the rolling summary and removes it from the state.
+    """
+    messages = state["messages"]
+    older = messages[:-KEEP_MESSAGES]
+    if not older:
+        return {"summary": state.get("summary", "")}
+
+    transcript = "\n\n".join(f"{m.name or m.type}: {m.content}" for m in older)
+    llm_messages = [
+        SystemMessage(content=SUMMARY_PROMPT.format(topic=state["topic"], summary=state.get("summary") or "(empty)",
+                                                    words=SUMMARY_WORDS)),
+        HumanMessage(content=transcript),
+    ]
+    summary = " ".join(model.invoke(llm_messages).split()[:SUMMARY_WORDS])
+    return {"summary": summary, "messages": [RemoveMessage(id=m.id) for m in older]}
 
 # Определение переходов
 def define_edge(state):
-    messages = state.get("messages", [])
-    if len(messages) >= 7:  # Завершаем цикл после 7 сообщений
+    if state.get("stop_reason"):  # Отчёты сошлись или аналитик ответил MAX_ANALYST_TURNS раз
         return END
     return "Reviewer"  # Переход к ревьюеру
 
 # Создание графа
-app_builder = StateGraph(CustomState)
-
-app_builder.add_node("Analyst", analyst_node)
-app_builder.add_node("Reviewer", reviewer_node)
-app_builder.set_entry_point("Analyst")
-app_builder.add_conditional_edges("Analyst", define_edge, ["Reviewer", END])
-app_builder.add_edge("Reviewer", "Analyst")
-
-# Компиляция графа
-graph = app_builder.compile()
-
-# Сохранение визуализации графа
-graph_image = graph.get_graph(xray=1).draw_mermaid_png()
-with open("graph_diagram.png", "wb") as file:
-    file.write(graph_image)
-print("Saved as PNG 'graph_diagram.png'")
-
-# Тестовый ввод и запуск графа
-thread = {"configurable": {"thread_id": "1"}}
-user_input = {
-    "topic": "Time machine development",
-}
-
-graph.invoke(user_input, thread)
+def build_graph(model=None, compact_history=True, checkpointer=None, clients: ClientRegistry = None,
+                convergence: ConvergenceDetector = CONVERGENCE):
+    """
+    model: any LLM to use instead of the pooled Ollama client (e.g. a fake in checks).
+    compact_history: keep only the last exchange verbatim and fold older turns into `summary`,
+    so the state stays the same size whatever the number of turns.
+    convergence: ends the loop once reports stop changing; None always runs MAX_ANALYST_TURNS.
+    """
+    model = model or (clients or default_registry).get("ollama", MODEL)
+
+    app_builder = StateGraph(CustomState)
+
+    app_builder.add_node("Analyst", partial(analyst_node, model=model, convergence=convergence))
+    app_builder.add_node("Reviewer", partial(reviewer_node, model=model))
+    app_builder.set_entry_point("Analyst")
+    app_builder.add_conditional_edges("Analyst", define_edge, ["Reviewer", END])
+    if compact_history:
+        app_builder.add_node("Summarize", partial(summarize_node, model=model))
+        app_builder.add_edge("Reviewer", "Summarize")
+        app_builder.add_edge("Summarize", "Analyst")
+    else:
+        app_builder.add_edge("Reviewer", "Analyst")
+
+    # Компиляция графа
+    return app_builder.compile(checkpointer=checkpointer)
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    add_draw_argument(parser)
+    add_metrics_argument(parser)
+    args = parser.parse_args()
+
+    # Повторные запуски с теми же входными данными берутся из LLMCache.db
+    enable_llm_cache()
+
+    graph = build_graph()
+
+    # Сохранение визуализации графа (только по флагу --draw)
+    if args.draw:
+        draw(graph, "graph_diagram", args.draw, xray=True)
+        return
+    # Время, очередь и токены по узлам и вызовам модели (только по флагу --metrics)
+    if args.metrics:
+        graph = instrument(graph, jsonl_path=args.metrics, name="LocalModelTest")
+
+    # Тестовый ввод и запуск графа
+    thread = {"configurable": {"thread_id": "1"}}
+    user_input = {
+        "topic": "Time machine development",
+    }
+
+    result = graph.invoke(user_input, thread)
+    print(f"Цикл завершён после {result['turn']} отчётов: {result['stop_reason']}")
+    if args.metrics:
+        write_metrics(args.metrics)
+
+
+if __name__ == "__main__":
+    main()
@@ -1,15 +1,32 @@
-import os, getpass
-import ascii_magic
+import os, getpass, sys
+import argparse
+import uuid
+from functools import lru_cache, partial
 from dotenv import load_dotenv
 
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from Shared.Retrievers import RetrieverEngine, build_engine
+from Shared.LLMCache import enable_llm_cache
+from Shared.Scheduler import PriorityScheduler
+from Shared.Clients import ClientRegistry, default_registry
+from Shared.Diagram import add_draw_argument, draw
+from Shared.Instrumentation import add_metrics_argument, instrument, write_metrics
+from Shared.Streaming import run_streaming, node_printer
+
 # Загрузка переменных среды
 load_dotenv()
 
 # Получение ключа API OpenAI
 openai_api_key = os.getenv("OPENAI_API_KEY")
 
-from langchain_openai import ChatOpenAI
-llm = ChatOpenAI(model="gpt-4o-mini", temperature=0.5)
+# Clients come from a ClientRegistry when a graph is built; all OpenAI calls share one
+# token bucket, so parallel interviews do not hit OpenAI rate limits together
+MODEL = "gpt-4o-mini"
+TEMPERATURE = 0.5
+
+
+def get_llm(clients: ClientRegistry):
+    return clients.get("openai", MODEL, temperature=TEMPERATURE)
 
 #Humaninzaloop
 
@@ -42,7 +59,6 @@ class GenerateAnalystsState(TypedDict):
 
 
 
-from IPython.display import Image, display
 from langgraph.graph import START, END, StateGraph
 from langgraph.checkpoint.memory import MemorySaver
 from langchain_core.messages import AIMessage, HumanMessage, SystemMessage
@@ -63,7 +79,7 @@ analyst_instructions = """You are tasked with creating a set of AI analyst perso
 5. Assign one analyst to each theme."""
 
 
-def create_analysts(state: GenerateAnalystsState):
+def create_analysts(state: GenerateAnalystsState, llm):
     """ Create analysts """
 
     topic = state['topic']
@@ -103,93 +119,19 @@ def should_continue(state: GenerateAnalystsState):
     return END
 
 
-# Add nodes and edges
-builder = StateGraph(GenerateAnalystsState)
-builder.add_node("create_analysts", create_analysts)
-builder.add_node("human_feedback", human_feedback)
-builder.add_edge(START, "create_analysts")
-builder.add_edge("create_analysts", "human_feedback")
-builder.add_conditional_edges("human_feedback", should_continue, ["create_analysts", END])
-
-# Compile
-memory = MemorySaver()
-graph = builder.compile(interrupt_before=['human_feedback'], checkpointer=memory)
-
-from PIL import Image
-from io import BytesIO
-
-# Assuming graph.get_graph(xray=1).draw_mermaid_png() returns binary PNG data
-binary_data = graph.get_graph(xray=1).draw_mermaid_png()
-
-
-# Save the binary data as a PNG file
-output_file = "graph_output.png"
-with open(output_file, "wb") as file:
-    file.write(binary_data)
-
-print(f"Image saved to {output_file}")
-
-
-
-# Initialize the thread and input data
-max_analysts = 3
-topic = "How to start business with LangChain"
-thread = {"configurable": {"thread_id": "1"}}
-
-# Run the graph until completion or as long as feedback is provided
-while True:
-    # Run the graph until the first interruption
-    for event in graph.stream({"topic": topic, "max_analysts": max_analysts, }, thread, stream_mode="values"):
-        # Review
-        analysts = event.get('analysts', '')
-        if analysts:
-            for analyst in analysts:
-                print(f"Name: {analyst.name}")
-                print(f"Affiliation: {analyst.affiliation}")
-                print(f"Role: {analyst.role}")
-                print(f"Description: {analyst.description}")
-                print("-" * 50)
-
-    # Get the current state
-    state = graph.get_state(thread)
-    print(state.next)
-
-    # Ask the user for feedback
-    print("=" * 150)
-    feedback = input(
-        "Provide feedback for the analysts (type '0' to proceed without feedback):\n"
-    )
-
-    # Update feedback and decide whether to continue or end
-    if feedback.strip() == "0":
-        break  # Left while
-
-    # Update the state with the feedback
-    graph.update_state(thread, {"human_analyst_feedback":
-                                    feedback}, as_node="human_feedback")
-
-
-# Continue the graph execution to end
-for event in graph.stream(None, thread, stream_mode="updates"):
-    print("--Node--")
-    node_name = next(iter(event.keys()))
-    print(node_name)
-
-final_state = graph.get_state(thread)
-analysts = final_state.values.get('analysts')
+def build_analyst_graph(checkpointer=None, clients: ClientRegistry = None):
+    """ Analyst generation with human feedback, interrupted before `human_feedback` """
+    llm = get_llm(clients or default_registry)
 
-final_state.next
+    # Add nodes and edges
+    analyst_builder = StateGraph(GenerateAnalystsState)
+    analyst_builder.add_node("create_analysts", partial(create_analysts, llm=llm))
+    analyst_builder.add_node("human_feedback", human_feedback)
+    analyst_builder.add_edge(START, "create_analysts")
+    analyst_builder.add_edge("create_analysts", "human_feedback")
+    analyst_builder.add_conditional_edges("human_feedback", should_continue, ["create_analysts", END])
 
-
-
-# Show analysts
-print("=" * 150)
-for analyst in analysts:
-    print(f"Name: {analyst.name}")
-    print(f"Affiliation: {analyst.affiliation}")
-    print(f"Role: {analyst.role}")
-    print(f"Description: {analyst.description}")
-    print("-" * 50)
+    return analyst_builder.compile(interrupt_before=['human_feedback'], checkpointer=checkpointer or MemorySaver())
 
 
 # Conduct Interview
@@ -200,6 +142,7 @@ from langgraph.graph import MessagesState
 class InterviewState(MessagesState):
     max_num_turns: int # Number turns of conversation
     context: Annotated[list, operator.add] # Source docs
+    search_query: str # Query for the last question, shared by all retrievers
     analyst: Analyst # Analyst asking questions
     interview: str # Interview transcript
     sections: list # Final key we duplicate in outer state for Send() API
@@ -227,7 +170,7 @@ When you are satisfied with your understanding, complete the interview with: "Th
 Remember to stay in character throughout your response, reflecting the persona and goals provided to you."""
 
 
-def generate_question(state: InterviewState):
+def generate_question(state: InterviewState, llm):
     """ Node to generate a question """
 
     # Get state
@@ -244,13 +187,6 @@ def generate_question(state: InterviewState):
 # Получение ключа API OpenAI
 tavily_api_key = os.getenv("TAVILY_API_KEY")
 
-# Web search tool
-from langchain_community.tools.tavily_search import TavilySearchResults
-tavily_search = TavilySearchResults(max_results=3)
-
-# Wikipedia search tool
-from langchain_community.document_loaders import WikipediaLoader
-
 from langchain_core.messages import get_buffer_string
 
 # Search query writing
@@ -265,47 +201,79 @@ Pay particular attention to the final question posed by the analyst.
 Convert this final question into a well-structured web search query""")
 
 
-def search_web(state: InterviewState):
-    """ Retrieve docs from web search """
+def generate_query(state: InterviewState, llm):
+    """ One search query for the last question, used by every retriever """
 
     # Search query
     structured_llm = llm.with_structured_output(SearchQuery)
     search_query = structured_llm.invoke([search_instructions] + state['messages'])
 
-    # Search
-    search_docs = tavily_search.invoke(search_query.search_query)
+    return {"search_query": search_query.search_query}
 
-    # Format
-    formatted_search_docs = "\n\n---\n\n".join(
-        [
-            f'<Document href="{doc["url"]}"/>\n{doc["content"]}\n</Document>'
-            for doc in search_docs
-        ]
-    )
 
-    return {"context": [formatted_search_docs]}
+# .md/.txt files searched by the "files" retriever
+DOCUMENTS_DIR = os.getenv("RESEARCH_DOCUMENTS_DIR",
+                          os.path.join(os.path.dirname(os.path.abspath(__file__)), "documents"))
 
+# Sources searched for every question, all at once. deadline: seconds before a source is skipped;
+# hedge: a call slower than the source's p95 gets a duplicate request, the first answer wins
+RETRIEVERS = [
+    {"name": "web", "kind": "web", "deadline": 10.0, "hedge": True, "params": {"max_results": 3}},
+    {"name": "wikipedia", "kind": "wikipedia", "deadline": 15.0, "hedge": True, "params": {"load_max_docs": 2}},
+    {"name": "files", "kind": "files", "deadline": 2.0, "hedge": False, "params": {"path": DOCUMENTS_DIR}},
+]
+# Local files are searched only when their directory exists; e.g. RETRIEVERS=files for fully offline interviews
+ENABLED_RETRIEVERS = os.getenv("RETRIEVERS", "web,wikipedia" + (",files" if os.path.isdir(DOCUMENTS_DIR) else "")).split(",")
 
-def search_wikipedia(state: InterviewState):
-    """ Retrieve docs from wikipedia """
 
-    # Search query
-    structured_llm = llm.with_structured_output(SearchQuery)
-    search_query = structured_llm.invoke([search_instructions] + state['messages'])
+def retrieve(state: InterviewState, engine: RetrieverEngine):
+    """ Retrieve docs from every configured source; late or failing sources add nothing """
 
-    # Search
-    search_docs = WikipediaLoader(query=search_query.search_query,
-                                  load_max_docs=2).load()
+    # Search (repeated queries are answered from the shared search cache)
+    results = engine.retrieve(state['search_query'])
 
-    # Format
-    formatted_search_docs = "\n\n---\n\n".join(
-        [
-            f'<Document source="{doc.metadata["source"]}" page="{doc.metadata.get("page", "")}"/>\n{doc.page_content}\n</Document>'
-            for doc in search_docs
-        ]
-    )
+    # Format, one context entry per source
+    return {"context": ["\n\n---\n\n".join(docs) for docs in results.values()]}
+
+
+# Context ranking
+from Shared.SnippetIndex import SnippetIndex, HashingEmbedder
+from Shared.SourceRegistry import SourceRegistry, finalize_section, merge_sections
+from Shared.AsyncCheckpoint import PooledAsyncSqliteSaver
 
-    return {"context": [formatted_search_docs]}
+# Shared by all interviews, every chunk is embedded once (least recently used ones go past SNIPPET_INDEX_MAX)
+context_index = SnippetIndex(HashingEmbedder())
+
+CONTEXT_CHUNK_CHARS = 1500      # documents longer than this are split into several chunks
+ANSWER_TOP_K = 6                # chunks passed to the expert
+ANSWER_TOKEN_BUDGET = 2000
+SECTION_TOP_K = 10              # chunks passed to the section writer
+SECTION_TOKEN_BUDGET = 3500
+
+
+def split_context(context: List[str]) -> List[str]:
+    """ Splits formatted search results into chunks, each keeps its <Document .../> header for citations """
+    chunks = []
+    for block in context:
+        for doc in block.split("\n\n---\n\n"):
+            header, _, body = doc.partition("\n")
+            body = body.removesuffix("</Document>").strip()
+            if not body:
+                continue
+            paragraphs, piece = body.split("\n"), ""
+            for paragraph in paragraphs:
+                if piece and len(piece) + len(paragraph) > CONTEXT_CHUNK_CHARS:
+                    chunks.append(f"{header}\n{piece.strip()}\n</Document>")
+                    piece = ""
+                piece += paragraph + "\n"
+            if piece.strip():
+                chunks.append(f"{header}\n{piece.strip()}\n</Document>")
+    return list(dict.fromkeys(chunks))
+
+
+def rank_context(context: List[str], query: str, k: int, token_budget: int) -> str:
+    """ Most relevant context chunks for the query, joined for the prompt """
+    return "\n\n---\n\n".join(context_index.select(split_context(context), query, k=k, token_budget=token_budget))
 
 
 answer_instructions = """You are an expert being interviewed by an analyst.
@@ -337,7 +305,7 @@ When answering questions, follow these guidelines:
 And skip the addition of the brackets as well as the Document source preamble in your citation."""
 
 
-def generate_answer(state: InterviewState):
+def generate_answer(state: InterviewState, llm):
     """ Node to answer a question """
 
     # Get state
@@ -345,7 +313,8 @@ def generate_answer(state: InterviewState):
     messages = state["messages"]
     context = state["context"]
 
-    # Answer question
+    # Answer question using only the chunks relevant to the last question
+    context = rank_context(context, messages[-1].content, k=ANSWER_TOP_K, token_budget=ANSWER_TOKEN_BUDGET)
     system_message = answer_instructions.format(goals=analyst.persona, context=context)
     answer = llm.invoke([SystemMessage(content=system_message)] + messages)
 
@@ -400,7 +369,7 @@ section_writer_instructions = """You are an expert technical writer.
 Your task is to create a short, easily digestible section of a report based on a set of source documents.
 
 1. Analyze the content of the source documents: 
-- The name of each source document is at the start of the document, with the <Document tag.
+- Each source document starts with its number, for example: Source [1]: https://example.com
 
 2. Create a report structure using markdown formatting:
 - Use ## for the section title
@@ -409,7 +378,6 @@ Your task is to create a short, easily digestible section of a report based on a
 3. Write the report following this structure:
 a. Title (## header)
 b. Summary (### header)
-c. Sources (### header)
 
 4. Make your title engaging based upon the focus area of the analyst: 
 {focus}
@@ -417,37 +385,19 @@ c. Sources (### header)
 5. For the summary section:
 - Set up summary with general background / context related to the focus area of the analyst
 - Emphasize what is novel, interesting, or surprising about insights gathered from the interview
-- Create a numbered list of source documents, as you use them
 - Do not mention the names of interviewers or experts
 - Aim for approximately 400 words maximum
-- Use numbered sources in your report (e.g., [1], [2]) based on information from source documents
-
-6. In the Sources section:
-- Include all sources used in your report
-- Provide full links to relevant websites or specific document paths
-- Separate each source by a newline. Use two spaces at the end of each line to create a newline in Markdown.
-- It will look like:
-
-### Sources
-[1] Link or Document name
-[2] Link or Document name
-
-7. Be sure to combine sources. For example this is not correct:
-
-[3] https://ai.meta.com/blog/meta-llama-3-1/
-[4] https://ai.meta.com/blog/meta-llama-3-1/
-
-There should be no redundant sources. It should simply be:
+- Cite sources with the number given to the source document (e.g., [1], [2]), never invent numbers
 
-[3] https://ai.meta.com/blog/meta-llama-3-1/
+6. Do not write a Sources section, it is added automatically from your citations.
 
-8. Final review:
+7. Final review:
 - Ensure the report follows the required structure
 - Include no preamble before the title of the report
 - Check that all guidelines have been followed"""
 
 
-def write_section(state: InterviewState):
+def write_section(state: InterviewState, llm):
     """ Node to answer a question """
 
     # Get state
@@ -456,62 +406,69 @@ def write_section(state: InterviewState):
     analyst = state["analyst"]
 
     # Write section using either the gathered source docs from interview (context) or the interview itself (interview)
+    chunks = context_index.select(split_context(context), f"{analyst.description}\n{interview}",
+                                  k=SECTION_TOP_K, token_budget=SECTION_TOKEN_BUDGET)
+
+    # Every distinct source gets one number, the Sources block is built from it in code
+    registry = SourceRegistry()
+    context = registry.number_documents(chunks)
     system_message = section_writer_instructions.format(focus=analyst.description)
     section = llm.invoke([SystemMessage(content=system_message)] + [
         HumanMessage(content=f"Use this source to write your section: {context}")])
 
     # Append it to state
-    return {"sections": [section.content]}
-
-
-# Add nodes and edges
-interview_builder = StateGraph(InterviewState)
-interview_builder.add_node("ask_question", generate_question)
-interview_builder.add_node("search_web", search_web)
-interview_builder.add_node("search_wikipedia", search_wikipedia)
-interview_builder.add_node("answer_question", generate_answer)
-interview_builder.add_node("save_interview", save_interview)
-interview_builder.add_node("write_section", write_section)
-
-# Flow
-interview_builder.add_edge(START, "ask_question")
-interview_builder.add_edge("ask_question", "search_web")
-interview_builder.add_edge("ask_question", "search_wikipedia")
-interview_builder.add_edge("search_web", "answer_question")
-interview_builder.add_edge("search_wikipedia", "answer_question")
-interview_builder.add_conditional_edges("answer_question", route_messages, ['ask_question', 'save_interview'])
-interview_builder.add_edge("save_interview", "write_section")
-interview_builder.add_edge("write_section", END)
-
-# Interview
-memory = MemorySaver()
-interview_graph = interview_builder.compile(checkpointer=memory).with_config(run_name="Conduct Interviews")
-
-# Save the binary data as a PNG file
-binary_data = interview_graph.get_graph(xray=1).draw_mermaid_png()
-
-output_file = "interview_graph_output.png"
-with open(output_file, "wb") as file:
-    file.write(binary_data)
-
-print(f"Image saved to {output_file}")
-# os.system(f"open interview_graph_output.png")
-
-print(analysts[0])
-
-from IPython.display import Markdown
-messages = [HumanMessage(f"So you said you were writing an article on {topic}?")]
-thread = {"configurable": {"thread_id": "1"}}
-interview = interview_graph.invoke({"analyst": analysts[0], "messages": messages, "max_num_turns": 2}, thread)
-# Markdown(interview['sections'][0])
-
-# Write the Markdown content to a file
-output_file = "output.md"
+    return {"sections": [finalize_section(section.content, registry)]}
+
+
+def make_interview_builder(clients: ClientRegistry) -> StateGraph:
+    """ Interview graph with its nodes bound to the registry's clients """
+    llm = get_llm(clients)
+    # One engine per graph, shared by the parallel interviews
+    engine = build_engine(RETRIEVERS, clients, enabled=ENABLED_RETRIEVERS)
+
+    # Add nodes and edges
+    interview_builder = StateGraph(InterviewState)
+    interview_builder.add_node("ask_question", partial(generate_question, llm=llm))
+    interview_builder.add_node("generate_query", partial(generate_query, llm=llm))
+    interview_builder.add_node("retrieve", partial(retrieve, engine=engine))
+    interview_builder.add_node("answer_question", partial(generate_answer, llm=llm))
+    interview_builder.add_node("save_interview", save_interview)
+    interview_builder.add_node("write_section", partial(write_section, llm=llm))
+
+    # Flow
+    interview_builder.add_edge(START, "ask_question")
+    # One query call feeds every retriever, the engine runs them in parallel
+    interview_builder.add_edge("ask_question", "generate_query")
+    interview_builder.add_edge("generate_query", "retrieve")
+    interview_builder.add_edge("retrieve", "answer_question")
+    interview_builder.add_conditional_edges("answer_question", route_messages, ['ask_question', 'save_interview'])
+    interview_builder.add_edge("save_interview", "write_section")
+    interview_builder.add_edge("write_section", END)
+    return interview_builder
+
+
+# "memory", or "pooled" for checkpoints on disk in ResearchAssistantMemory.db
+CHECKPOINTER = os.getenv("RESEARCH_CHECKPOINTER", "memory")
+
+
+@lru_cache(maxsize=None)
+def get_checkpointer():
+    """
+    Saver shared by the interview and research graphs. The pooled saver (a reader pool and a single
+    group-commit writer) only beats AsyncSqliteSaver with many interviews at once, see
+    Benchmarks/CheckpointLoadTest.py, so it is opt-in.
+    """
+    if CHECKPOINTER == "pooled":
+        db_path = os.path.join(os.path.dirname(os.path.abspath(__file__)), "ResearchAssistantMemory.db")
+        return PooledAsyncSqliteSaver(db_path)
+    return MemorySaver()
+
+
+def build_interview_graph(checkpointer=None, clients: ClientRegistry = None):
+    """ One interview on its own, with its own thread """
+    return make_interview_builder(clients or default_registry).compile(
+        checkpointer=checkpointer or get_checkpointer()).with_config(run_name="Conduct Interviews")
 
-with open(output_file, "w") as file:
-    file.write(interview['sections'][0])
-
-print(f"Markdown written to {output_file}")
 
 # Parallelization
 import operator
@@ -524,15 +481,25 @@ class ResearchGraphState(TypedDict):
     human_analyst_feedback: str # Human feedback
     analysts: List[Analyst] # Analyst asking questions
     sections: Annotated[list, operator.add] # Send() API key
+    interview_timings: Annotated[list, operator.add] # Queue wait / execution time per interview
+    formatted_sections: str # All sections joined once for the report writer, with global citation numbers
+    sources: str # Sources section of the final report, built in code
+    section_digest: str # Compact per-section summary + citation map for intro/conclusion
     introduction: str # Introduction for the final report
     content: str # Content for the final report
     conclusion: str # Conclusion for the final report
     final_report: str # Final report
 
 
+import time
 from langgraph.constants import Send
 
 
+MAX_IN_FLIGHT_INTERVIEWS = int(os.getenv("MAX_IN_FLIGHT_INTERVIEWS", 3)) # Interviews running at the same time
+
+interview_scheduler = PriorityScheduler(max_in_flight=MAX_IN_FLIGHT_INTERVIEWS)
+
+
 def initiate_all_interviews(state: ResearchGraphState):
     """ This is the "map" step where we run each interview sub-graph using Send API """
 
@@ -542,14 +509,58 @@ def initiate_all_interviews(state: ResearchGraphState):
         # Return to create_analysts
         return "create_analysts"
 
-    # Otherwise kick off interviews in parallel via Send() API
+    # Otherwise kick off interviews in parallel via Send() API,
+    # the scheduler lets them run in analyst order (first analyst = highest priority)
     else:
         topic = state["topic"]
         return [Send("conduct_interview", {"analyst": analyst,
                                            "messages": [HumanMessage(
                                                content=f"So you said you were writing an article on {topic}?"
                                            )
-                                           ]}) for analyst in state["analysts"]]
+                                           ],
+                                           "priority": priority,
+                                           "enqueued_at": time.time()})
+                for priority, analyst in enumerate(state["analysts"])]
+
+
+def conduct_interview(state: dict, config, interview_graph):
+    """ Runs one interview sub-graph once the scheduler gives it a slot """
+
+    analyst = state["analyst"]
+    with interview_scheduler.slot(priority=state.get("priority", 0), name=analyst.name,
+                                  enqueued_at=state.get("enqueued_at")) as timing:
+        interview = interview_graph.invoke({"analyst": analyst, "messages": state["messages"]}, config)
+    return {"sections": interview["sections"], "interview_timings": [timing]}
+
+
+DIGEST_SUMMARY_WORDS = 60 # Words of each section summary kept in the digest
+
+
+def digest_section(body: str, citations: List[str]) -> str:
+    """ Title, first sentences of the summary and the cited sources of one section """
+    title = next((line[3:].strip() for line in body.splitlines() if line.startswith("## ")), "Untitled")
+    text = " ".join(line.strip() for line in body.splitlines()
+                    if line.strip() and not line.lstrip().startswith("#"))
+    words = text.split()
+    summary = " ".join(words[:DIGEST_SUMMARY_WORDS]) + (" ..." if len(words) > DIGEST_SUMMARY_WORDS else "")
+    digest = f"### {title}\n{summary}"
+    if citations:
+        digest += "\nCitations: " + "; ".join(citations)
+    return digest
+
+
+def build_section_digest(state: ResearchGraphState):
+    """ Precompute once what the three report writers need """
+
+    # One global number per source across all sections, citations are rewritten to it
+    merged, registry = merge_sections(state["sections"])
+    return {
+        "formatted_sections": "\n\n".join(body for body, _ in merged),
+        "section_digest": "\n\n".join(
+            digest_section(body, [f"[{n}] {registry.label(n)}" for n in cited]) for body, cited in merged
+        ),
+        "sources": registry.render(header="## Sources"),
+    }
 
 
 report_writer_instructions = """You are a technical writer creating a report on this overall topic: 
@@ -575,26 +586,19 @@ To format your report:
 3. Use no sub-heading. 
 4. Start your report with a single title header: ## Insights
 5. Do not mention any analyst names in your report.
-6. Preserve any citations in the memos, which will be annotated in brackets, for example [1] or [2].
-7. Create a final, consolidated list of sources and add to a Sources section with the `## Sources` header.
-8. List your sources in order and do not repeat.
-
-[1] Source 1
-[2] Source 2
+6. Preserve any citations in the memos exactly as written, which will be annotated in brackets, for example [1] or [2].
+7. Do not write a Sources section, the consolidated list of sources is added automatically.
 
 Here are the memos from your analysts to build your report from: 
 
 {context}"""
 
 
-def write_report(state: ResearchGraphState):
-    # Full set of sections
-    sections = state["sections"]
+def write_report(state: ResearchGraphState, llm):
+    # Full set of sections, joined once in build_section_digest
+    formatted_str_sections = state["formatted_sections"]
     topic = state["topic"]
 
-    # Concat all sections together
-    formatted_str_sections = "\n\n".join([f"{section}" for section in sections])
-
     # Summarize the sections into a final report
     system_message = report_writer_instructions.format(topic=topic, context=formatted_str_sections)
     report = llm.invoke(
@@ -604,7 +608,7 @@ def write_report(state: ResearchGraphState):
 
 intro_conclusion_instructions = """You are a technical writer finishing a report on {topic}
 
-You will be given all of the sections of the report.
+You will be given a digest of all of the sections of the report: each section title, a short summary and its citations.
 
 You job is to write a crisp and compelling introduction or conclusion section.
 
@@ -622,35 +626,25 @@ For your introduction, use ## Introduction as the section header.
 
 For your conclusion, use ## Conclusion as the section header.
 
-Here are the sections to reflect on for writing: {formatted_str_sections}"""
+Here is the digest of the sections to reflect on for writing: {section_digest}"""
 
 
-def write_introduction(state: ResearchGraphState):
-    # Full set of sections
-    sections = state["sections"]
+def write_introduction(state: ResearchGraphState, llm):
+    # Compact digest of the sections instead of their full text
+    section_digest = state["section_digest"]
     topic = state["topic"]
 
-    # Concat all sections together
-    formatted_str_sections = "\n\n".join([f"{section}" for section in sections])
-
-    # Summarize the sections into a final report
-
-    instructions = intro_conclusion_instructions.format(topic=topic, formatted_str_sections=formatted_str_sections)
+    instructions = intro_conclusion_instructions.format(topic=topic, section_digest=section_digest)
     intro = llm.invoke([instructions] + [HumanMessage(content=f"Write the report introduction")])
     return {"introduction": intro.content}
 
 
-def write_conclusion(state: ResearchGraphState):
-    # Full set of sections
-    sections = state["sections"]
+def write_conclusion(state: ResearchGraphState, llm):
+    # Compact digest of the sections instead of their full text
+    section_digest = state["section_digest"]
     topic = state["topic"]
 
-    # Concat all sections together
-    formatted_str_sections = "\n\n".join([f"{section}" for section in sections])
-
-    # Summarize the sections into a final report
-
-    instructions = intro_conclusion_instructions.format(topic=topic, formatted_str_sections=formatted_str_sections)
+    instructions = intro_conclusion_instructions.format(topic=topic, section_digest=section_digest)
     conclusion = llm.invoke([instructions] + [HumanMessage(content=f"Write the report conclusion")])
     return {"conclusion": conclusion.content}
 
@@ -658,44 +652,181 @@ def write_conclusion(state: ResearchGraphState):
 def finalize_report(state: ResearchGraphState):
     """ The is the "reduce" step where we gather all the sections, combine them, and reflect on them to write the intro/conclusion """
     # Save full final report
-    content = state["content"]
-    if content.startswith("## Insights"):
-        content = content.strip("## Insights")
-    if "## Sources" in content:
-        try:
-            content, sources = content.split("\n## Sources\n")
-        except:
-            sources = None
-    else:
-        sources = None
+    content = state["content"].removeprefix("## Insights")
+
+    # The writer is told not to list sources, drop them if it did anyway
+    content = content.split("\n## Sources", 1)[0]
 
     final_report = state["introduction"] + "\n\n---\n\n" + content + "\n\n---\n\n" + state["conclusion"]
-    if sources is not None:
-        final_report += "\n\n## Sources\n" + sources
+    if state.get("sources"):
+        final_report += "\n\n" + state["sources"]
     return {"final_report": final_report}
 
 
-# Add nodes and edges
-builder = StateGraph(ResearchGraphState)
-builder.add_node("create_analysts", create_analysts)
-builder.add_node("human_feedback", human_feedback)
-builder.add_node("conduct_interview", interview_builder.compile())
-builder.add_node("write_report", write_report)
-builder.add_node("write_introduction", write_introduction)
-builder.add_node("write_conclusion", write_conclusion)
-builder.add_node("finalize_report", finalize_report)
-
-# Logic
-builder.add_edge(START, "create_analysts")
-builder.add_edge("create_analysts", "human_feedback")
-builder.add_conditional_edges("human_feedback", initiate_all_interviews, ["create_analysts", "conduct_interview"])
-builder.add_edge("conduct_interview", "write_report")
-builder.add_edge("conduct_interview", "write_introduction")
-builder.add_edge("conduct_interview", "write_conclusion")
-builder.add_edge(["write_conclusion", "write_report", "write_introduction"], "finalize_report")
-builder.add_edge("finalize_report", END)
-
-# Compile
-memory = MemorySaver()
-graph = builder.compile(interrupt_before=['human_feedback'], checkpointer=memory)
-display(Image(graph.get_graph(xray=1).draw_mermaid_png()))
\ No newline at end of file
+def build_research_graph(checkpointer=None, clients: ClientRegistry = None):
+    """ Analysts, parallel interviews and the final report """
+    clients = clients or default_registry
+    llm = get_llm(clients)
+    # Interview graph run inside the research graph, checkpointed by the parent
+    interview_graph = make_interview_builder(clients).compile()
+
+    # Add nodes and edges
+    builder = StateGraph(ResearchGraphState)
+    builder.add_node("create_analysts", partial(create_analysts, llm=llm))
+    builder.add_node("human_feedback", human_feedback)
+    builder.add_node("conduct_interview", partial(conduct_interview, interview_graph=interview_graph))
+    builder.add_node("build_section_digest", build_section_digest)
+    builder.add_node("write_report", partial(write_report, llm=llm))
+    builder.add_node("write_introduction", partial(write_introduction, llm=llm))
+    builder.add_node("write_conclusion", partial(write_conclusion, llm=llm))
+    builder.add_node("finalize_report", finalize_report)
+
+    # Logic
+    builder.add_edge(START, "create_analysts")
+    builder.add_edge("create_analysts", "human_feedback")
+    builder.add_conditional_edges("human_feedback", initiate_all_interviews, ["create_analysts", "conduct_interview"])
+    builder.add_edge("conduct_interview", "build_section_digest")
+    builder.add_edge("build_section_digest", "write_report")
+    builder.add_edge("build_section_digest", "write_introduction")
+    builder.add_edge("build_section_digest", "write_conclusion")
+    builder.add_edge(["write_conclusion", "write_report", "write_introduction"], "finalize_report")
+    builder.add_edge("finalize_report", END)
+
+    return builder.compile(interrupt_before=['human_feedback'], checkpointer=checkpointer or get_checkpointer())
+
+
+# Report writers stream their tokens after the human feedback step (see stream_report)
+REPORT_STREAMING_NODES = ("write_report", "write_introduction", "write_conclusion")
+
+
+def review_analysts(graph, topic: str, max_analysts: int, thread) -> None:
+    """ Generates analysts and asks for feedback in the terminal until the user accepts them """
+
+    # Run the graph until completion or as long as feedback is provided
+    while True:
+        # Run the graph until the first interruption
+        for event in graph.stream({"topic": topic, "max_analysts": max_analysts, }, thread, stream_mode="values"):
+            # Review
+            analysts = event.get('analysts', '')
+            if analysts:
+                for analyst in analysts:
+                    print(f"Name: {analyst.name}")
+                    print(f"Affiliation: {analyst.affiliation}")
+                    print(f"Role: {analyst.role}")
+                    print(f"Description: {analyst.description}")
+                    print("-" * 50)
+
+        # Get the current state
+        state = graph.get_state(thread)
+        print(state.next)
+
+        # Ask the user for feedback
+        print("=" * 150)
+        feedback = input(
+            "Provide feedback for the analysts (type '0' to proceed without feedback):\n"
+        )
+
+        # Update feedback and decide whether to continue or end
+        if feedback.strip() == "0":
+            break  # Left while
+
+        # Update the state with the feedback
+        graph.update_state(thread, {"human_analyst_feedback":
+                                        feedback}, as_node="human_feedback")
+
+
+def collect_analysts(graph, topic: str, max_analysts: int, thread) -> List[Analyst]:
+    """ Analysts accepted by the user in the terminal """
+    review_analysts(graph, topic, max_analysts, thread)
+
+    # Continue the graph execution to end
+    for event in graph.stream(None, thread, stream_mode="updates"):
+        print("--Node--")
+        node_name = next(iter(event.keys()))
+        print(node_name)
+
+    final_state = graph.get_state(thread)
+    return final_state.values.get('analysts')
+
+
+def stream_report(graph, topic: str, max_analysts: int, thread) -> str:
+    """
+    Full research run: analysts reviewed in the terminal, then the interviews and the report,
+    whose writers print their tokens as they are generated. Returns the final report.
+    """
+    review_analysts(graph, topic, max_analysts, thread)
+    final_state = run_streaming(graph, None, thread, nodes=REPORT_STREAMING_NODES, on_token=node_printer())
+    print()
+    return final_state["final_report"]
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Generate analysts, then interview an expert with the first one.")
+    parser.add_argument("--topic", default="How to start business with LangChain")
+    parser.add_argument("--max-analysts", type=int, default=3)
+    parser.add_argument("--report", action="store_true",
+                        help="interview with every analyst and stream the full report instead")
+    add_draw_argument(parser)
+    add_metrics_argument(parser)
+    args = parser.parse_args()
+
+    if args.draw:
+        draw(build_analyst_graph(), "graph_output", args.draw, xray=True)
+        draw(build_interview_graph(), "interview_graph_output", args.draw, xray=True)
+        draw(build_research_graph(), "research_graph_output", args.draw, xray=True)
+        return
+
+    # Re-runs with the same inputs are answered from LLMCache.db
+    enable_llm_cache()
+
+    # Initialize the thread and input data
+    topic = args.topic
+    if args.report:
+        research_graph = build_research_graph()
+        if args.metrics:
+            research_graph = instrument(research_graph, jsonl_path=args.metrics, name="research")
+        report = stream_report(research_graph, topic, args.max_analysts,
+                               {"configurable": {"thread_id": f"research-{uuid.uuid4()}"}})
+        with open("output.md", "w") as file:
+            file.write(report)
+        print("Markdown written to output.md")
+        if args.metrics:
+            write_metrics(args.metrics)
+        return
+
+    thread = {"configurable": {"thread_id": "1"}}
+    analyst_graph, interview_graph = build_analyst_graph(), build_interview_graph()
+    if args.metrics:
+        analyst_graph = instrument(analyst_graph, jsonl_path=args.metrics, name="analysts")
+        interview_graph = instrument(interview_graph, jsonl_path=args.metrics, name="interview")
+    analysts = collect_analysts(analyst_graph, topic, args.max_analysts, thread)
+
+    # Show analysts
+    print("=" * 150)
+    for analyst in analysts:
+        print(f"Name: {analyst.name}")
+        print(f"Affiliation: {analyst.affiliation}")
+        print(f"Role: {analyst.role}")
+        print(f"Description: {analyst.description}")
+        print("-" * 50)
+
+    # Interview with the first analyst, on a new thread since interview checkpoints may be kept on disk
+    print(analysts[0])
+    messages = [HumanMessage(f"So you said you were writing an article on {topic}?")]
+    interview_thread = {"configurable": {"thread_id": f"interview-{uuid.uuid4()}"}}
+    interview = interview_graph.invoke({"analyst": analysts[0], "messages": messages, "max_num_turns": 2},
+                                       interview_thread)
+
+    # Write the Markdown content to a file
+    output_file = "output.md"
+
+    with open(output_file, "w") as file:
+        file.write(interview['sections'][0])
+
+    print(f"Markdown written to {output_file}")
+    if args.metrics:
+        write_metrics(args.metrics)
+
+
+if __name__ == "__main__":
+    main()
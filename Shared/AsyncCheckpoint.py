@@ -0,0 +1,280 @@
+import asyncio
+import queue
+import sqlite3
+import threading
+from concurrent.futures import Future, ThreadPoolExecutor
+from typing import Any, AsyncIterator, Dict, Iterator, List, Optional, Sequence, Tuple
+
+from langchain_core.runnables import RunnableConfig
+from langgraph.checkpoint.base import (
+    WRITES_IDX_MAP,
+    BaseCheckpointSaver,
+    ChannelVersions,
+    Checkpoint,
+    CheckpointMetadata,
+    CheckpointTuple,
+    get_checkpoint_id,
+)
+from langgraph.checkpoint.serde.jsonplus import JsonPlusSerializer
+from langgraph.checkpoint.sqlite import SqliteSaver
+from langgraph.checkpoint.sqlite.utils import search_where
+
+# Same tables as SqliteSaver, so either saver can open the file
+SCHEMA = """
+PRAGMA journal_mode=WAL;
+CREATE TABLE IF NOT EXISTS checkpoints (
+    thread_id TEXT NOT NULL,
+    checkpoint_ns TEXT NOT NULL DEFAULT '',
+    checkpoint_id TEXT NOT NULL,
+    parent_checkpoint_id TEXT,
+    type TEXT,
+    checkpoint BLOB,
+    metadata BLOB,
+    PRIMARY KEY (thread_id, checkpoint_ns, checkpoint_id)
+);
+CREATE TABLE IF NOT EXISTS writes (
+    thread_id TEXT NOT NULL,
+    checkpoint_ns TEXT NOT NULL DEFAULT '',
+    checkpoint_id TEXT NOT NULL,
+    task_id TEXT NOT NULL,
+    idx INTEGER NOT NULL,
+    channel TEXT NOT NULL,
+    type TEXT,
+    value BLOB,
+    PRIMARY KEY (thread_id, checkpoint_ns, checkpoint_id, task_id, idx)
+);
+"""
+
+MAX_WRITE_BATCH = 256   # queued write operations committed in one transaction
+
+Statement = Tuple[str, str, list]   # (table, sql, rows)
+
+
+class PooledAsyncSqliteSaver(BaseCheckpointSaver[str]):
+    """
+    Checkpointer for many graph threads running at once (e.g. parallel interviews).
+
+    Reads run on a pool of `readers` threads, each with its own connection (WAL lets them
+    read in parallel). All writes go through one queue drained by a single writer thread,
+    which commits everything queued so far in one transaction. Async methods only await
+    futures, so checkpointing never blocks the event loop; sync methods wait on the same
+    futures, so the saver works for `ainvoke`/`astream` and for `invoke`/`stream`.
+    """
+
+    def __init__(self, path: str, readers: int = 4, serde=None):
+        super().__init__(serde=serde)
+        self.jsonplus_serde = JsonPlusSerializer()
+        self.path = path
+        self.stats = {"checkpoints": 0, "writes": 0, "commits": 0}
+
+        writer = self._connect()
+        writer.executescript(SCHEMA)
+        writer.execute("PRAGMA synchronous=NORMAL")
+        writer.commit()
+        writer.isolation_level = None   # transactions and savepoints are managed by _commit
+        self._queue: "queue.Queue[Optional[Tuple[List[Statement], Future]]]" = queue.Queue()
+        self._writer = threading.Thread(target=self._write_loop, args=(writer,), name="checkpoint-writer",
+                                        daemon=True)
+        self._writer.start()
+
+        self._local = threading.local()
+        self._readers = ThreadPoolExecutor(max_workers=max(1, readers), thread_name_prefix="checkpoint-reader")
+
+    def _connect(self) -> sqlite3.Connection:
+        return sqlite3.connect(self.path, check_same_thread=False)
+
+    def close(self) -> None:
+        self._queue.put(None)
+        self._writer.join()
+        self._readers.shutdown(wait=True)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    # --- single writer ---
+
+    def _write_loop(self, conn: sqlite3.Connection) -> None:
+        while True:
+            item = self._queue.get()
+            if item is None:
+                conn.close()
+                return
+            batch, stop = [item], False
+            while len(batch) < MAX_WRITE_BATCH:
+                try:
+                    item = self._queue.get_nowait()
+                except queue.Empty:
+                    break
+                if item is None:
+                    stop = True
+                    break
+                batch.append(item)
+            self._commit(conn, batch)
+            if stop:
+                conn.close()
+                return
+
+    def _commit(self, conn: sqlite3.Connection, batch) -> None:
+        """
+        One transaction for the whole batch, each request in its own savepoint:
+        a failing request is rolled back alone and only its caller gets the error.
+        """
+        done = []
+        try:
+            conn.execute("BEGIN")
+            for statements, future in batch:
+                conn.execute("SAVEPOINT request")
+                try:
+                    for table, sql, rows in statements:
+                        conn.executemany(sql, rows)
+                except Exception as error:
+                    conn.execute("ROLLBACK TO request")
+                    conn.execute("RELEASE request")
+                    future.set_exception(error)
+                    continue
+                conn.execute("RELEASE request")
+                done.append((statements, future))
+            conn.execute("COMMIT")
+        except Exception as error:
+            if conn.in_transaction:
+                conn.execute("ROLLBACK")
+            for _, future in done:
+                future.set_exception(error)
+            return
+        self.stats["commits"] += 1
+        for statements, future in done:
+            for table, _, rows in statements:
+                self.stats[table] += len(rows)
+            future.set_result(None)
+
+    def _write(self, statements: List[Statement]) -> Future:
+        future = Future()
+        self._queue.put((statements, future))
+        return future
+
+    # --- reads, run on the reader pool ---
+
+    def _reader(self) -> sqlite3.Connection:
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = self._local.conn = self._connect()
+            conn.execute("PRAGMA query_only=ON")
+        return conn
+
+    def _get_tuple(self, config: RunnableConfig) -> Optional[CheckpointTuple]:
+        conn = self._reader()
+        thread_id = str(config["configurable"]["thread_id"])
+        checkpoint_ns = config["configurable"].get("checkpoint_ns", "")
+        if checkpoint_id := get_checkpoint_id(config):
+            row = conn.execute(
+                "SELECT checkpoint_id, parent_checkpoint_id, type, checkpoint, metadata FROM checkpoints "
+                "WHERE thread_id = ? AND checkpoint_ns = ? AND checkpoint_id = ?",
+                (thread_id, checkpoint_ns, checkpoint_id),
+            ).fetchone()
+        else:
+            row = conn.execute(
+                "SELECT checkpoint_id, parent_checkpoint_id, type, checkpoint, metadata FROM checkpoints "
+                "WHERE thread_id = ? AND checkpoint_ns = ? ORDER BY checkpoint_id DESC LIMIT 1",
+                (thread_id, checkpoint_ns),
+            ).fetchone()
+        if row is None:
+            return None
+        return self._tuple(conn, thread_id, checkpoint_ns, *row)
+
+    def _list(self, config, filter, before, limit) -> List[CheckpointTuple]:
+        conn = self._reader()
+        where, params = search_where(config, filter, before)
+        query = ("SELECT thread_id, checkpoint_ns, checkpoint_id, parent_checkpoint_id, type, checkpoint, metadata "
+                 f"FROM checkpoints {where} ORDER BY checkpoint_id DESC")
+        if limit:
+            query += f" LIMIT {int(limit)}"
+        return [self._tuple(conn, *row) for row in conn.execute(query, params).fetchall()]
+
+    def _tuple(self, conn, thread_id, checkpoint_ns, checkpoint_id, parent_checkpoint_id,
+               type_, checkpoint, metadata) -> CheckpointTuple:
+        writes = conn.execute(
+            "SELECT task_id, channel, type, value FROM writes "
+            "WHERE thread_id = ? AND checkpoint_ns = ? AND checkpoint_id = ? ORDER BY task_id, idx",
+            (thread_id, checkpoint_ns, checkpoint_id),
+        ).fetchall()
+        return CheckpointTuple(
+            {"configurable": {"thread_id": thread_id, "checkpoint_ns": checkpoint_ns,
+                              "checkpoint_id": checkpoint_id}},
+            self.serde.loads_typed((type_, checkpoint)),
+            self.jsonplus_serde.loads(metadata) if metadata is not None else {},
+            {"configurable": {"thread_id": thread_id, "checkpoint_ns": checkpoint_ns,
+                              "checkpoint_id": parent_checkpoint_id}} if parent_checkpoint_id else None,
+            [(task_id, channel, self.serde.loads_typed((t, value))) for task_id, channel, t, value in writes],
+        )
+
+    # --- statements for the writer, serialized in the caller's thread ---
+
+    def _put_statements(self, config, checkpoint, metadata) -> List[Statement]:
+        type_, serialized_checkpoint = self.serde.dumps_typed(checkpoint)
+        return [(
+            "checkpoints",
+            "INSERT OR REPLACE INTO checkpoints (thread_id, checkpoint_ns, checkpoint_id, parent_checkpoint_id, "
+            "type, checkpoint, metadata) VALUES (?, ?, ?, ?, ?, ?, ?)",
+            [(str(config["configurable"]["thread_id"]), config["configurable"]["checkpoint_ns"], checkpoint["id"],
+              config["configurable"].get("checkpoint_id"), type_, serialized_checkpoint,
+              self.jsonplus_serde.dumps(metadata))],
+        )]
+
+    def _writes_statements(self, config, writes, task_id) -> List[Statement]:
+        verb = "REPLACE" if all(w[0] in WRITES_IDX_MAP for w in writes) else "IGNORE"
+        return [(
+            "writes",
+            f"INSERT OR {verb} INTO writes (thread_id, checkpoint_ns, checkpoint_id, task_id, idx, channel, type, value) "
+            "VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+            [(str(config["configurable"]["thread_id"]), str(config["configurable"]["checkpoint_ns"]),
+              str(config["configurable"]["checkpoint_id"]), task_id, WRITES_IDX_MAP.get(channel, idx), channel,
+              *self.serde.dumps_typed(value))
+             for idx, (channel, value) in enumerate(writes)],
+        )]
+
+    @staticmethod
+    def _next_config(config, checkpoint) -> RunnableConfig:
+        return {"configurable": {"thread_id": config["configurable"]["thread_id"],
+                                 "checkpoint_ns": config["configurable"]["checkpoint_ns"],
+                                 "checkpoint_id": checkpoint["id"]}}
+
+    # --- BaseCheckpointSaver API, async ---
+
+    async def aget_tuple(self, config: RunnableConfig) -> Optional[CheckpointTuple]:
+        return await asyncio.wrap_future(self._readers.submit(self._get_tuple, config))
+
+    async def alist(self, config: Optional[RunnableConfig], *, filter: Optional[Dict[str, Any]] = None,
+                    before: Optional[RunnableConfig] = None, limit: Optional[int] = None
+                    ) -> AsyncIterator[CheckpointTuple]:
+        for result in await asyncio.wrap_future(self._readers.submit(self._list, config, filter, before, limit)):
+            yield result
+
+    async def aput(self, config: RunnableConfig, checkpoint: Checkpoint, metadata: CheckpointMetadata,
+                   new_versions: ChannelVersions) -> RunnableConfig:
+        await asyncio.wrap_future(self._write(self._put_statements(config, checkpoint, metadata)))
+        return self._next_config(config, checkpoint)
+
+    async def aput_writes(self, config: RunnableConfig, writes: Sequence[Tuple[str, Any]], task_id: str) -> None:
+        await asyncio.wrap_future(self._write(self._writes_statements(config, writes, task_id)))
+
+    # --- BaseCheckpointSaver API, sync ---
+
+    def get_tuple(self, config: RunnableConfig) -> Optional[CheckpointTuple]:
+        return self._readers.submit(self._get_tuple, config).result()
+
+    def list(self, config: Optional[RunnableConfig], *, filter: Optional[Dict[str, Any]] = None,
+             before: Optional[RunnableConfig] = None, limit: Optional[int] = None) -> Iterator[CheckpointTuple]:
+        yield from self._readers.submit(self._list, config, filter, before, limit).result()
+
+    def put(self, config: RunnableConfig, checkpoint: Checkpoint, metadata: CheckpointMetadata,
+            new_versions: ChannelVersions) -> RunnableConfig:
+        self._write(self._put_statements(config, checkpoint, metadata)).result()
+        return self._next_config(config, checkpoint)
+
+    def put_writes(self, config: RunnableConfig, writes: Sequence[Tuple[str, Any]], task_id: str) -> None:
+        self._write(self._writes_statements(config, writes, task_id)).result()
+
+    get_next_version = SqliteSaver.get_next_version
@@ -0,0 +1,219 @@
+import sqlite3
+import threading
+from typing import Any, Dict, Iterator, Optional, Sequence, Tuple
+
+from langchain_core.runnables import RunnableConfig
+from langgraph.checkpoint.base import ChannelVersions, Checkpoint, CheckpointMetadata, CheckpointTuple
+from langgraph.checkpoint.sqlite import SqliteSaver
+
+BLOB_THRESHOLD_BYTES = 2048     # channel values larger than this are stored once per version
+MAX_PENDING_WRITES = 64         # commit writes early if a superstep produces more than this
+
+
+def connect(path: str) -> sqlite3.Connection:
+    """ SQLite connection tuned for checkpoints: WAL, fsync only at checkpoints of the WAL, big page cache """
+    conn = sqlite3.connect(path, check_same_thread=False)
+    conn.executescript(
+        """
+        PRAGMA journal_mode=WAL;
+        PRAGMA synchronous=NORMAL;
+        PRAGMA temp_store=MEMORY;
+        PRAGMA cache_size=-16000;
+        PRAGMA wal_autocheckpoint=1000;
+        """
+    )
+    return conn
+
+
+class TunedSqliteSaver(SqliteSaver):
+    """
+    SqliteSaver that writes less and commits less:
+
+    - with `defer_writes=True`, writes of a superstep (put_writes) are committed together with the
+      next checkpoint (put); until then a crash loses them and the open transaction blocks other
+      writers, so call flush() at the end of a run. Off by default: every put_writes commits;
+    - large channel values (the growing `content` list, drafts) are stored once per channel version
+      in `checkpoint_blobs`, a checkpoint only references them, so unchanged values are never rewritten;
+    - with `keep_last` set, only the newest checkpoints of each thread are kept; a thread and
+      namespace is pruned after every `prune_every` of its own puts.
+    A checkpoint whose blob is missing raises instead of loading without that channel.
+    """
+
+    def __init__(self, conn: sqlite3.Connection, *, keep_last: Optional[int] = None,
+                 prune_every: int = 10, blob_threshold: int = BLOB_THRESHOLD_BYTES,
+                 defer_writes: bool = False, serde=None):
+        super().__init__(conn, serde=serde)
+        self.keep_last = keep_last
+        self.defer_writes = defer_writes
+        self.prune_every = prune_every
+        self.blob_threshold = blob_threshold
+        self._pending_writes = 0
+        self._puts: Dict[Tuple[str, str], int] = {}   # puts since the last prune, per thread and namespace
+        self._local = threading.local()
+
+    @classmethod
+    def from_path(cls, path: str, **kwargs) -> "TunedSqliteSaver":
+        return cls(connect(path), **kwargs)
+
+    def setup(self) -> None:
+        if self.is_setup:
+            return
+        super().setup()
+        self.conn.executescript(
+            """
+            CREATE TABLE IF NOT EXISTS checkpoint_blobs (
+                thread_id TEXT NOT NULL,
+                checkpoint_ns TEXT NOT NULL DEFAULT '',
+                channel TEXT NOT NULL,
+                version TEXT NOT NULL,
+                type TEXT,
+                blob BLOB,
+                PRIMARY KEY (thread_id, checkpoint_ns, channel, version)
+            );
+            """
+        )
+
+    def flush(self) -> None:
+        with self.lock:
+            self.conn.commit()
+            self._pending_writes = 0
+
+    def put_writes(self, config: RunnableConfig, writes: Sequence[Tuple[str, Any]], task_id: str) -> None:
+        if not self.defer_writes:
+            return super().put_writes(config, writes, task_id)
+        # Same rows as SqliteSaver, but left in the open transaction until the checkpoint
+        self._local.defer_commit = True
+        try:
+            super().put_writes(config, writes, task_id)
+        finally:
+            self._local.defer_commit = False
+        self._pending_writes += len(writes)
+        if self._pending_writes >= MAX_PENDING_WRITES:
+            self.flush()
+
+    def cursor(self, transaction: bool = True):
+        return super().cursor(transaction=transaction and not getattr(self._local, "defer_commit", False))
+
+    def put(self, config: RunnableConfig, checkpoint: Checkpoint, metadata: CheckpointMetadata,
+            new_versions: ChannelVersions) -> RunnableConfig:
+        thread_id = str(config["configurable"]["thread_id"])
+        checkpoint_ns = config["configurable"]["checkpoint_ns"]
+
+        channel_values = dict(checkpoint["channel_values"])
+        blobs = []
+        for channel, value in checkpoint["channel_values"].items():
+            type_, blob = self.serde.dumps_typed(value)
+            if len(blob) >= self.blob_threshold and channel in checkpoint["channel_versions"]:
+                blobs.append((thread_id, checkpoint_ns, channel,
+                              str(checkpoint["channel_versions"][channel]), type_, blob))
+                del channel_values[channel]
+
+        stored = {**checkpoint, "channel_values": channel_values, "blob_channels": [b[2] for b in blobs]}
+        if blobs:
+            with self.cursor(transaction=False) as cur:
+                # Unchanged channels keep their version, the row is already there and nothing is written
+                cur.executemany(
+                    "INSERT OR IGNORE INTO checkpoint_blobs (thread_id, checkpoint_ns, channel, version, type, blob) "
+                    "VALUES (?, ?, ?, ?, ?, ?)",
+                    blobs,
+                )
+        # Commits the blobs and the pending writes of this superstep together with the checkpoint
+        next_config = super().put(config, stored, metadata, new_versions)
+        self._pending_writes = 0
+
+        if self.keep_last:
+            key = (thread_id, checkpoint_ns)
+            with self.lock:
+                puts = self._puts.get(key, 0) + 1
+                if puts >= self.prune_every:
+                    del self._puts[key]
+                else:
+                    self._puts[key] = puts
+            if puts >= self.prune_every:
+                self.prune(thread_id, keep_last=self.keep_last, checkpoint_ns=checkpoint_ns)
+        return next_config
+
+    def _restore(self, checkpoint: Checkpoint, thread_id: str, checkpoint_ns: str) -> Checkpoint:
+        """ Puts externally stored channel values back; caller holds self.lock """
+        for channel in checkpoint.pop("blob_channels", []):
+            row = self.conn.execute(
+                "SELECT type, blob FROM checkpoint_blobs WHERE thread_id = ? AND checkpoint_ns = ? "
+                "AND channel = ? AND version = ?",
+                (thread_id, checkpoint_ns, channel, str(checkpoint["channel_versions"][channel])),
+            ).fetchone()
+            if row is None:
+                raise ValueError(f"Checkpoint {checkpoint['id']} of thread '{thread_id}' is corrupted: "
+                                 f"no stored value for channel '{channel}' "
+                                 f"version {checkpoint['channel_versions'][channel]}")
+            checkpoint["channel_values"][channel] = self.serde.loads_typed(row)
+        return checkpoint
+
+    def get_tuple(self, config: RunnableConfig) -> Optional[CheckpointTuple]:
+        result = super().get_tuple(config)
+        if result is not None:
+            with self.lock:
+                self._restore(result.checkpoint, str(result.config["configurable"]["thread_id"]),
+                              result.config["configurable"].get("checkpoint_ns", ""))
+        return result
+
+    def list(self, config: Optional[RunnableConfig], **kwargs) -> Iterator[CheckpointTuple]:
+        # SqliteSaver.list holds self.lock while yielding, so _restore runs under it
+        for result in super().list(config, **kwargs):
+            self._restore(result.checkpoint, str(result.config["configurable"]["thread_id"]),
+                          result.config["configurable"].get("checkpoint_ns", ""))
+            yield result
+
+    def prune(self, thread_id: str, keep_last: int, checkpoint_ns: str = "") -> int:
+        """ Deletes all but the newest `keep_last` checkpoints of a thread and the data only they used """
+        with self.cursor() as cur:
+            cur.execute(
+                "SELECT checkpoint_id, type, checkpoint FROM checkpoints WHERE thread_id = ? AND checkpoint_ns = ? "
+                "ORDER BY checkpoint_id DESC",
+                (thread_id, checkpoint_ns),
+            )
+            rows = cur.fetchall()
+            if len(rows) <= keep_last:
+                return 0
+            kept, dropped = rows[:keep_last], rows[keep_last:]
+            oldest_kept = kept[-1][0]
+
+            cur.execute(
+                "DELETE FROM checkpoints WHERE thread_id = ? AND checkpoint_ns = ? AND checkpoint_id < ?",
+                (thread_id, checkpoint_ns, oldest_kept),
+            )
+            cur.execute(
+                "DELETE FROM writes WHERE thread_id = ? AND checkpoint_ns = ? AND checkpoint_id < ?",
+                (thread_id, checkpoint_ns, oldest_kept),
+            )
+
+            # Versions only grow, so a blob older than every version the kept checkpoints use is garbage
+            oldest_versions: Dict[str, str] = {}
+            for _, type_, blob in kept:
+                for channel, version in self.serde.loads_typed((type_, blob))["channel_versions"].items():
+                    version = str(version)
+                    if channel not in oldest_versions or version < oldest_versions[channel]:
+                        oldest_versions[channel] = version
+            cur.execute(
+                "SELECT DISTINCT channel FROM checkpoint_blobs WHERE thread_id = ? AND checkpoint_ns = ?",
+                (thread_id, checkpoint_ns),
+            )
+            for (channel,) in cur.fetchall():
+                if channel in oldest_versions:
+                    cur.execute(
+                        "DELETE FROM checkpoint_blobs WHERE thread_id = ? AND checkpoint_ns = ? "
+                        "AND channel = ? AND version < ?",
+                        (thread_id, checkpoint_ns, channel, oldest_versions[channel]),
+                    )
+                else:
+                    cur.execute(
+                        "DELETE FROM checkpoint_blobs WHERE thread_id = ? AND checkpoint_ns = ? AND channel = ?",
+                        (thread_id, checkpoint_ns, channel),
+                    )
+        return len(dropped)
+
+    def compact(self) -> None:
+        """ Gives pruned space back to the file system """
+        with self.lock:
+            self.conn.commit()
+            self.conn.execute("PRAGMA wal_checkpoint(TRUNCATE)")
+            self.conn.execute("VACUUM")
@@ -0,0 +1,147 @@
+import os
+import threading
+from typing import Any, Callable, Dict, Hashable, Optional, Tuple
+
+from Shared.Instrumentation import note
+from Shared.Scheduler import get_rate_limiter
+
+# Connections kept open per provider, shared by every client of that provider
+HTTP_MAX_CONNECTIONS = int(os.getenv("HTTP_MAX_CONNECTIONS", 20))
+HTTP_MAX_KEEPALIVE = int(os.getenv("HTTP_MAX_KEEPALIVE", 10))
+HTTP_TIMEOUT = float(os.getenv("HTTP_TIMEOUT", 60.0))
+
+# factory(registry, model, **params) -> client
+Factory = Callable[..., Any]
+
+
+def _freeze(value: Any) -> Hashable:
+    """ Params such as stop lists or nested dicts become part of the key too """
+    if isinstance(value, dict):
+        return tuple(sorted((k, _freeze(v)) for k, v in value.items()))
+    if isinstance(value, (list, tuple, set)):
+        return tuple(_freeze(v) for v in value)
+    try:
+        hash(value)
+    except TypeError:
+        return repr(value)
+    return value
+
+
+class ClientRegistry:
+    """
+    Model and API clients pooled per (provider, model, params).
+
+    A client is built the first time it is asked for and then reused, so nodes can call
+    `registry.get(...)` on every execution. Clients of one provider share one HTTP connection
+    pool. Graph builders take a registry, tests pass one whose factories return fakes:
+
+        registry = ClientRegistry({"openai": lambda registry, model, **params: FakeChat()})
+    """
+
+    def __init__(self, factories: Optional[Dict[str, Factory]] = None):
+        self.factories: Dict[str, Factory] = dict(DEFAULT_FACTORIES if factories is None else factories)
+        self._clients: Dict[Tuple, Any] = {}
+        self._http: Dict[str, Any] = {}
+        self._lock = threading.RLock()  # factories ask for the shared HTTP client while holding it
+
+    def register(self, provider: str, factory: Factory) -> None:
+        """ Adds or replaces a provider; clients already built for it are dropped """
+        with self._lock:
+            self.factories[provider] = factory
+            self._clients = {key: client for key, client in self._clients.items() if key[0] != provider}
+
+    def get(self, provider: str, model: Optional[str] = None, **params) -> Any:
+        key = (provider, model, _freeze(params))
+        client = self._clients.get(key)
+        if client is not None:
+            return client
+        with self._lock:
+            if key not in self._clients:
+                if provider not in self.factories:
+                    raise KeyError(f"No client factory registered for '{provider}'")
+                self._clients[key] = self.factories[provider](self, model, **params)
+            return self._clients[key]
+
+    def http_client(self, provider: str):
+        """ One keep-alive httpx.Client per provider """
+        with self._lock:
+            if provider not in self._http:
+                import httpx
+                self._http[provider] = httpx.Client(
+                    limits=httpx.Limits(max_connections=HTTP_MAX_CONNECTIONS,
+                                        max_keepalive_connections=HTTP_MAX_KEEPALIVE),
+                    timeout=HTTP_TIMEOUT,
+                    # Every attempt of an SDK call, so retries show up in the instrumentation
+                    event_hooks={"request": [lambda request: note("attempts")]},
+                )
+            return self._http[provider]
+
+    def stats(self) -> Dict[str, int]:
+        """ Number of pooled clients per provider """
+        counts: Dict[str, int] = {}
+        for provider, _, _ in self._clients:
+            counts[provider] = counts.get(provider, 0) + 1
+        return counts
+
+    def close(self) -> None:
+        with self._lock:
+            for client in self._http.values():
+                client.close()
+            self._http.clear()
+            self._clients.clear()
+
+
+def openai_chat(registry: ClientRegistry, model: str, **params):
+    from langchain_openai import ChatOpenAI
+    # The async client stays per model: an httpx.AsyncClient is bound to the event loop that opened it
+    return ChatOpenAI(model=model, http_client=registry.http_client("openai"),
+                      rate_limiter=get_rate_limiter("openai"), **params)
+
+
+def ollama_llm(registry: ClientRegistry, model: str, **params):
+    from langchain_ollama import OllamaLLM
+    return OllamaLLM(model=model, **params)
+
+
+def tavily_async(registry: ClientRegistry, model: Optional[str] = None, **params):
+    from tavily import AsyncTavilyClient
+    return AsyncTavilyClient(api_key=os.environ["TAVILY_API_KEY"], **params)
+
+
+def tavily_search_tool(registry: ClientRegistry, model: Optional[str] = None, **params):
+    from langchain_community.tools.tavily_search import TavilySearchResults
+    return TavilySearchResults(**params)
+
+
+class WikipediaSearch:
+    """ WikipediaLoader behind a `load(query)` call, so it is pooled and replaceable like the other clients """
+
+    def __init__(self, load_max_docs: int = 2, **params):
+        self.load_max_docs = load_max_docs
+        self.params = params
+
+    def load(self, query: str):
+        from langchain_community.document_loaders import WikipediaLoader
+        return WikipediaLoader(query=query, load_max_docs=self.load_max_docs, **self.params).load()
+
+
+def wikipedia_search(registry: ClientRegistry, model: Optional[str] = None, **params):
+    return WikipediaSearch(**params)
+
+
+def local_documents(registry: ClientRegistry, model: Optional[str] = None, **params):
+    from Shared.Retrievers import LocalDocumentSearch
+    return LocalDocumentSearch(**params)
+
+
+DEFAULT_FACTORIES: Dict[str, Factory] = {
+    "openai": openai_chat,
+    "ollama": ollama_llm,
+    "tavily": tavily_async,
+    "tavily_search": tavily_search_tool,
+    "wikipedia": wikipedia_search,
+    "local_documents": local_documents,
+}
+
+# Process-wide registry used when a builder is not given one
+default_registry = ClientRegistry()
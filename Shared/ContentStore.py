@@ -0,0 +1,91 @@
+import hashlib
+import re
+from functools import lru_cache
+from typing import FrozenSet, List, Optional, Sequence
+
+MAX_CONTENT_ITEMS = 60          # snippets kept in state, the oldest ones are dropped first
+NEAR_DUPLICATE_THRESHOLD = 0.8  # Jaccard similarity of word shingles above which two snippets are the same
+SHINGLE_SIZE = 4
+
+_WORD = re.compile(r"\w+")
+
+
+def tokenize(text: str) -> List[str]:
+    return _WORD.findall(text.lower())
+
+
+def estimate_tokens(text: str) -> int:
+    """ Rough token count (~4 characters per token), good enough for budgeting prompts """
+    return len(text) // 4 + 1
+
+
+@lru_cache(maxsize=4096)
+def shingles(text: str) -> FrozenSet[int]:
+    """ Hashed word n-grams of a snippet, cached because the same snippets are compared on every merge """
+    words = tokenize(text)
+    if len(words) < SHINGLE_SIZE:
+        grams = [" ".join(words)]
+    else:
+        grams = [" ".join(words[i:i + SHINGLE_SIZE]) for i in range(len(words) - SHINGLE_SIZE + 1)]
+    return frozenset(int.from_bytes(hashlib.blake2b(g.encode(), digest_size=8).digest(), "big") for g in grams)
+
+
+def is_near_duplicate(a: str, b: str, threshold: float = NEAR_DUPLICATE_THRESHOLD) -> bool:
+    sa, sb = shingles(a), shingles(b)
+    if not sa or not sb:
+        return a.strip() == b.strip()
+    return len(sa & sb) / len(sa | sb) >= threshold
+
+
+def merge_content(left: Optional[List[str]], right: Optional[List[str]]) -> List[str]:
+    """
+    Reducer for `content`: appends new snippets that are not (near) duplicates of stored ones
+    and keeps at most MAX_CONTENT_ITEMS of the most recent snippets.
+    Nodes return only the snippets they found, never the whole list.
+    """
+    merged = list(left or [])
+    seen = {" ".join(tokenize(text)) for text in merged}
+    for text in right or []:
+        normalized = " ".join(tokenize(text))
+        if not normalized or normalized in seen:
+            continue
+        if any(is_near_duplicate(text, other) for other in merged):
+            continue
+        seen.add(normalized)
+        merged.append(text)
+    return merged[-MAX_CONTENT_ITEMS:]
+
+
+def pack_by_score(snippets: Sequence[str], scores: Sequence[float], k: int, token_budget: int) -> List[str]:
+    """
+    Takes the best scored snippets (at most `k`) that fit into `token_budget` tokens,
+    returned in their original order.
+    """
+    ranked = sorted(range(len(snippets)), key=lambda i: scores[i], reverse=True)
+
+    selected, used = [], 0
+    for i in ranked:
+        if len(selected) >= k:
+            break
+        cost = estimate_tokens(snippets[i])
+        if used + cost > token_budget:
+            continue
+        selected.append(i)
+        used += cost
+    # Keep the order in which the snippets were found
+    return [snippets[i] for i in sorted(selected)]
+
+
+def select_snippets(snippets: Sequence[str], query: str, k: int = 8, token_budget: int = 1500) -> List[str]:
+    """
+    Picks the top `k` snippets by word overlap with `query` that fit into `token_budget` tokens.
+    """
+    query_words = set(tokenize(query))
+
+    def score(text: str) -> float:
+        words = tokenize(text)
+        if not words:
+            return 0.0
+        return sum(1 for w in words if w in query_words) / len(words) ** 0.5
+
+    return pack_by_score(snippets, [score(text) for text in snippets], k, token_budget)
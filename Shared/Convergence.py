@@ -0,0 +1,39 @@
+import os
+from typing import Optional
+
+import numpy as np
+
+from Shared.SnippetIndex import HashingEmbedder, _normalize
+
+# Consecutive drafts at least this similar are treated as converged
+CONVERGENCE_THRESHOLD = float(os.getenv("CONVERGENCE_THRESHOLD", 0.95))
+
+# Values of `stop_reason` in the graph states
+STOP_CONVERGED = "converged"
+STOP_NO_MAJOR_ISSUES = "no_major_issues"
+STOP_MAX_ITERATIONS = "max_iterations"
+
+
+class ConvergenceDetector:
+    """
+    Decides when a revise loop can stop before its iteration limit.
+
+    Consecutive drafts are compared by cosine similarity of their embeddings: by default the
+    offline HashingEmbedder (words and bigrams, no model call), or any embedder with `embed(texts)`
+    such as LangChainEmbedder(OpenAIEmbeddings()).
+    """
+
+    def __init__(self, threshold: float = CONVERGENCE_THRESHOLD, embedder=None):
+        self.threshold = threshold
+        self.embedder = embedder or HashingEmbedder()
+
+    def similarity(self, previous: str, current: str) -> float:
+        vectors = _normalize(self.embedder.embed([previous, current]))
+        return float(np.dot(vectors[0], vectors[1]))
+
+    def stop_reason(self, previous: Optional[str], current: str) -> str:
+        """ Why the loop should stop now, or "" to keep going """
+        if previous and current and self.similarity(previous, current) >= self.threshold:
+            return STOP_CONVERGED
+        return ""
+
@@ -0,0 +1,56 @@
+import hashlib
+import os
+import shutil
+
+# PNGs rendered once per graph structure, shared by all scripts
+DIAGRAM_CACHE_DIR = os.getenv(
+    "DIAGRAM_CACHE_DIR",
+    os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), ".diagram_cache"),
+)
+
+FORMATS = {"mermaid": ".mmd", "png": ".png"}
+
+
+def add_draw_argument(parser) -> None:
+    """
+    `--draw` writes the diagrams as Mermaid text, `--draw png` as images. Nothing is drawn without it.
+    """
+    parser.add_argument("--draw", nargs="?", const="mermaid", choices=sorted(FORMATS),
+                        help="save the graph diagram(s) in the current directory")
+
+
+def render_png(drawable) -> bytes:
+    """
+    Graphviz when it is installed (offline), otherwise the Mermaid.ink API (network).
+    """
+    try:
+        import pygraphviz  # noqa: F401
+    except ImportError:
+        return drawable.draw_mermaid_png()
+    return drawable.draw_png()
+
+
+def draw(graph, name: str, fmt: str = "mermaid", xray: bool = False) -> str:
+    """
+    Saves the diagram of a compiled graph as `<name>.mmd` or `<name>.png` and returns the path.
+
+    Mermaid text is generated locally. A PNG is looked up in DIAGRAM_CACHE_DIR by the hash of
+    that text, so it is only rendered again when the graph structure changes.
+    """
+    drawable = graph.get_graph(xray=xray)
+    mermaid = drawable.draw_mermaid()
+    path = name + FORMATS[fmt]
+
+    if fmt == "mermaid":
+        with open(path, "w", encoding="utf-8") as file:
+            file.write(mermaid)
+    else:
+        cached = os.path.join(DIAGRAM_CACHE_DIR, hashlib.sha256(mermaid.encode()).hexdigest() + ".png")
+        if not os.path.exists(cached):
+            os.makedirs(DIAGRAM_CACHE_DIR, exist_ok=True)
+            with open(cached, "wb") as file:
+                file.write(render_png(drawable))
+        shutil.copyfile(cached, path)
+
+    print(f"Saved as '{path}'")
+    return path
@@ -0,0 +1,307 @@
+import bisect
+import json
+import threading
+import time
+from contextvars import ContextVar
+from typing import Any, Dict, List, Optional, Sequence, Tuple
+from uuid import UUID
+
+from langchain_core.callbacks import BaseCallbackHandler
+
+# Upper bounds (seconds) of the latency histogram buckets, +Inf is implicit
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0, 120.0)
+
+# USD per 1K (prompt, completion) tokens; models not listed get no cost. Update when pricing changes.
+PRICES_PER_1K_TOKENS = {
+    "gpt-4o": (0.0025, 0.01),
+    "gpt-4o-mini": (0.00015, 0.0006),
+    "gpt-3.5-turbo": (0.0005, 0.0015),
+}
+
+Labels = Tuple[Tuple[str, str], ...]
+
+
+class Histogram:
+    """ Cumulative-bucket histogram in the Prometheus sense """
+
+    def __init__(self, buckets: Sequence[float] = DEFAULT_BUCKETS):
+        self.buckets = tuple(buckets)
+        self.counts = [0] * (len(self.buckets) + 1)
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, value: float) -> None:
+        self.counts[bisect.bisect_left(self.buckets, value)] += 1
+        self.sum += value
+        self.count += 1
+
+    def quantile(self, q: float) -> float:
+        """ Upper bound of the bucket holding the q-th observation (inf past the last bucket) """
+        rank = q * self.count
+        seen = 0
+        for bound, count in zip(self.buckets + (float("inf"),), self.counts):
+            seen += count
+            if seen >= rank and seen:
+                return bound
+        return 0.0
+
+
+class MetricsRegistry:
+    """
+    In-process histograms and counters keyed by name and labels, e.g.
+    `registry.observe("graph_node_duration_seconds", 1.2, node="generate")`.
+    Thread safe; dump with `to_prometheus()` or inspect with `top()`.
+    """
+
+    def __init__(self, buckets: Sequence[float] = DEFAULT_BUCKETS):
+        self.buckets = buckets
+        self.histograms: Dict[Tuple[str, Labels], Histogram] = {}
+        self.counters: Dict[Tuple[str, Labels], float] = {}
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def _labels(labels: Dict[str, Any]) -> Labels:
+        return tuple(sorted((key, str(value)) for key, value in labels.items()))
+
+    def observe(self, name: str, value: float, **labels) -> None:
+        key = (name, self._labels(labels))
+        with self._lock:
+            if key not in self.histograms:
+                self.histograms[key] = Histogram(self.buckets)
+            self.histograms[key].observe(value)
+
+    def inc(self, name: str, amount: float = 1.0, **labels) -> None:
+        key = (name, self._labels(labels))
+        with self._lock:
+            self.counters[key] = self.counters.get(key, 0.0) + amount
+
+    def top(self, name: str = "graph_node_duration_seconds", n: int = 10) -> List[Dict[str, Any]]:
+        """ Label sets of a histogram with the most total time first: the hot nodes """
+        with self._lock:
+            rows = [{**dict(labels), "count": h.count, "total_s": round(h.sum, 4),
+                     "mean_s": round(h.sum / h.count, 4), "p95_s": h.quantile(0.95)}
+                    for (metric, labels), h in self.histograms.items() if metric == name and h.count]
+        return sorted(rows, key=lambda row: -row["total_s"])[:n]
+
+    def to_prometheus(self) -> str:
+        """ Prometheus text exposition format """
+        def render(labels: Labels, extra: Labels = ()) -> str:
+            pairs = ",".join(f'{key}="{value}"' for key, value in labels + extra)
+            return "{" + pairs + "}" if pairs else ""
+
+        lines, typed = [], set()
+        with self._lock:
+            for (name, labels), histogram in sorted(self.histograms.items()):
+                if name not in typed:
+                    lines.append(f"# TYPE {name} histogram")
+                    typed.add(name)
+                cumulative = 0
+                for bound, count in zip(histogram.buckets + (float("inf"),), histogram.counts):
+                    cumulative += count
+                    le = "+Inf" if bound == float("inf") else repr(bound)
+                    lines.append(f"{name}_bucket{render(labels, (('le', le),))} {cumulative}")
+                lines.append(f"{name}_sum{render(labels)} {histogram.sum}")
+                lines.append(f"{name}_count{render(labels)} {histogram.count}")
+            for (name, labels), value in sorted(self.counters.items()):
+                if name not in typed:
+                    lines.append(f"# TYPE {name} counter")
+                    typed.add(name)
+                lines.append(f"{name}{render(labels)} {value}")
+        return "\n".join(lines) + "\n"
+
+    def reset(self) -> None:
+        with self._lock:
+            self.histograms.clear()
+            self.counters.clear()
+
+
+# Process-wide registry used when none is given
+metrics = MetricsRegistry()
+
+# Facts about the LLM call running in this context that callbacks cannot see:
+# rate limiter wait, cache hit, HTTP attempts. Filled by `note`, read when the call ends.
+_current_call: ContextVar[Optional[Dict[str, float]]] = ContextVar("instrumented_llm_call", default=None)
+
+
+def note(key: str, amount: float = 1.0) -> None:
+    """ Adds to `key` of the LLM call in flight; a no-op outside an instrumented call """
+    call = _current_call.get()
+    if call is not None:
+        call[key] = call.get(key, 0.0) + amount
+
+
+def _token_usage(response) -> Tuple[int, int]:
+    """ (prompt, completion) tokens from OpenAI usage, message usage_metadata or Ollama generation_info """
+    usage = (response.llm_output or {}).get("token_usage") or {}
+    if usage:
+        return usage.get("prompt_tokens", 0), usage.get("completion_tokens", 0)
+    prompt = completion = 0
+    for generation in (g for batch in response.generations for g in batch):
+        usage_metadata = getattr(getattr(generation, "message", None), "usage_metadata", None)
+        if usage_metadata:
+            prompt += usage_metadata.get("input_tokens", 0)
+            completion += usage_metadata.get("output_tokens", 0)
+        elif generation.generation_info:
+            prompt += generation.generation_info.get("prompt_eval_count") or 0
+            completion += generation.generation_info.get("eval_count") or 0
+    return prompt, completion
+
+
+class InstrumentationHandler(BaseCallbackHandler):
+    """
+    Records every graph node and LLM call of the runs it is attached to:
+    wall time, queue time, prompt/completion tokens, cost, cache hits and retries.
+
+    Node queue time is the time between the previous step finishing and the node starting,
+    i.e. waiting for a free worker (max_concurrency) plus routing. LLM queue time is the
+    wait on the provider's rate limiter. Every record also goes to `jsonl_path` if given.
+    """
+
+    # Called in the caller's context, so `note` from the model call reaches the same call record
+    run_inline = True
+
+    def __init__(self, registry: Optional[MetricsRegistry] = None, jsonl_path: Optional[str] = None,
+                 graph: str = "LangGraph"):
+        self.registry = registry or metrics
+        self.jsonl_path = jsonl_path
+        self.graph = graph
+        self._nodes: Dict[UUID, tuple] = {}
+        self._calls: Dict[UUID, tuple] = {}
+        self._ready: Dict[Optional[UUID], Dict[int, float]] = {}  # graph run -> step -> time it could start
+        self._lock = threading.Lock()
+
+    def _write(self, record: Dict[str, Any]) -> None:
+        if self.jsonl_path is None:
+            return
+        line = json.dumps({"ts": round(time.time(), 3), "graph": self.graph, **record})
+        with self._lock, open(self.jsonl_path, "a", encoding="utf-8") as file:
+            file.write(line + "\n")
+
+    # Nodes
+
+    def on_chain_start(self, serialized, inputs, *, run_id: UUID, parent_run_id: Optional[UUID] = None,
+                       tags: Optional[List[str]] = None, metadata: Optional[Dict[str, Any]] = None, **kwargs) -> None:
+        node = (metadata or {}).get("langgraph_node")
+        # Only the node run itself, not the runnables inside it
+        if node is None or kwargs.get("name") != node or not any(t.startswith("graph:step:") for t in tags or ()):
+            return
+        now = time.perf_counter()
+        step = metadata.get("langgraph_step", 0)
+        with self._lock:
+            ready = self._ready.setdefault(parent_run_id, {}).get(step, now)
+            self._nodes[run_id] = (node, step, now, max(0.0, now - ready), parent_run_id)
+
+    def on_chain_end(self, outputs, *, run_id: UUID, **kwargs) -> None:
+        self._end_node(run_id, None)
+
+    def on_chain_error(self, error: BaseException, *, run_id: UUID, **kwargs) -> None:
+        self._end_node(run_id, error)
+
+    def _end_node(self, run_id: UUID, error: Optional[BaseException]) -> None:
+        now = time.perf_counter()
+        with self._lock:
+            self._ready.pop(run_id, None)  # the run was a graph that has finished
+            entry = self._nodes.pop(run_id, None)
+            if entry is None:
+                return
+            node, step, started, queue_s, graph_run = entry
+            steps = self._ready.setdefault(graph_run, {})
+            steps[step + 1] = max(steps.get(step + 1, 0.0), now)
+        if node == "__start__":
+            return
+        wall_s = now - started
+        self.registry.observe("graph_node_duration_seconds", wall_s, graph=self.graph, node=node)
+        self.registry.observe("graph_node_queue_seconds", queue_s, graph=self.graph, node=node)
+        record = {"kind": "node", "node": node, "step": step, "wall_s": round(wall_s, 4), "queue_s": round(queue_s, 4)}
+        if error is not None:
+            self.registry.inc("graph_node_errors_total", graph=self.graph, node=node, error=type(error).__name__)
+            record["error"] = type(error).__name__
+        self._write(record)
+
+    # LLM calls
+
+    def on_chat_model_start(self, serialized, messages, *, run_id: UUID, metadata: Optional[Dict[str, Any]] = None,
+                            **kwargs) -> None:
+        self._start_call(serialized, run_id, metadata)
+
+    def on_llm_start(self, serialized, prompts, *, run_id: UUID, metadata: Optional[Dict[str, Any]] = None,
+                     **kwargs) -> None:
+        self._start_call(serialized, run_id, metadata)
+
+    def _start_call(self, serialized, run_id: UUID, metadata: Optional[Dict[str, Any]]) -> None:
+        metadata = metadata or {}
+        model = metadata.get("ls_model_name") or ((serialized or {}).get("kwargs") or {}).get("model_name", "unknown")
+        call: Dict[str, float] = {}
+        token = _current_call.set(call)
+        with self._lock:
+            self._calls[run_id] = (metadata.get("langgraph_node", ""), model, time.perf_counter(), call, token)
+
+    def on_llm_end(self, response, *, run_id: UUID, **kwargs) -> None:
+        self._end_call(run_id, response, None)
+
+    def on_llm_error(self, error: BaseException, *, run_id: UUID, **kwargs) -> None:
+        self._end_call(run_id, None, error)
+
+    def _end_call(self, run_id: UUID, response, error: Optional[BaseException]) -> None:
+        now = time.perf_counter()
+        with self._lock:
+            entry = self._calls.pop(run_id, None)
+        if entry is None:
+            return
+        node, model, started, call, token = entry
+        # Later notes in this context must not land in the finished call
+        try:
+            _current_call.reset(token)
+        except ValueError:  # ended in another context than it started in
+            if _current_call.get() is call:
+                _current_call.set(None)
+        labels = {"graph": self.graph, "node": node, "model": model}
+        wall_s, queue_s = now - started, call.get("queue_s", 0.0)
+        cache_hit = bool(call.get("cache_hit"))
+        retries = int(max(0.0, call.get("attempts", 0.0) - 1))
+        prompt_tokens, completion_tokens = _token_usage(response) if response is not None and not cache_hit else (0, 0)
+        prices = PRICES_PER_1K_TOKENS.get(model)
+        cost = (prompt_tokens * prices[0] + completion_tokens * prices[1]) / 1000 if prices else 0.0
+
+        self.registry.observe("graph_llm_duration_seconds", wall_s, **labels)
+        self.registry.observe("graph_llm_queue_seconds", queue_s, **labels)
+        self.registry.inc("graph_llm_calls_total", **labels)
+        self.registry.inc("graph_llm_prompt_tokens_total", prompt_tokens, **labels)
+        self.registry.inc("graph_llm_completion_tokens_total", completion_tokens, **labels)
+        self.registry.inc("graph_llm_cost_usd_total", cost, **labels)
+        self.registry.inc("graph_llm_cache_hits_total", int(cache_hit), **labels)
+        self.registry.inc("graph_llm_retries_total", retries, **labels)
+        record = {"kind": "llm", "node": node, "model": model, "wall_s": round(wall_s, 4),
+                  "queue_s": round(queue_s, 4), "prompt_tokens": prompt_tokens,
+                  "completion_tokens": completion_tokens, "cost_usd": round(cost, 6),
+                  "cache_hit": cache_hit, "retries": retries}
+        if error is not None:
+            self.registry.inc("graph_llm_errors_total", error=type(error).__name__, **labels)
+            record["error"] = type(error).__name__
+        self._write(record)
+
+
+def instrument(graph, registry: Optional[MetricsRegistry] = None, jsonl_path: Optional[str] = None,
+               name: Optional[str] = None):
+    """
+    Returns the compiled graph with an InstrumentationHandler attached to every run,
+    sub-graphs and nested LLM calls included. The graph itself is not modified.
+    """
+    handler = InstrumentationHandler(registry, jsonl_path, name or graph.name)
+    return graph.with_config(callbacks=[handler])
+
+
+def add_metrics_argument(parser) -> None:
+    """ `--metrics PATH` records per-node and per-LLM-call metrics, see write_metrics """
+    parser.add_argument("--metrics", metavar="PATH",
+                        help="append node/LLM timings and tokens to PATH (JSONL), Prometheus text to PATH.prom")
+
+
+def write_metrics(path: str, registry: Optional[MetricsRegistry] = None) -> None:
+    """ Prometheus dump next to the JSONL records, plus the hot nodes on stdout """
+    registry = registry or metrics
+    with open(path + ".prom", "w", encoding="utf-8") as file:
+        file.write(registry.to_prometheus())
+    for row in registry.top():
+        print(row)
+    print(f"Metrics saved as '{path}' and '{path}.prom'")
@@ -0,0 +1,70 @@
+import hashlib
+import os
+from typing import Optional, Sequence
+
+from langchain_core.caches import BaseCache
+from langchain_core.globals import set_llm_cache
+from langchain_core.load import dumps, loads
+from langchain_core.outputs import Generation
+
+from Shared.Cache import MemoryCache, SqliteCache
+from Shared.Instrumentation import note
+
+LLM_CACHE_PATH = os.getenv(
+    "LLM_CACHE_PATH",
+    os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "LLMCache.db"),
+)
+
+
+class LLMResponseCache(BaseCache):
+    """
+    LangChain cache on top of MemoryCache / SqliteCache.
+
+    LangChain calls it with the serialized messages (`prompt`) and `llm_string`, which holds
+    the model name, temperature and every bound kwarg, so `with_structured_output(Schema)`
+    calls are keyed on the schema too. Models created with `cache=False` skip it,
+    use that for nodes whose output is meant to be sampled.
+    """
+
+    def __init__(self, store):
+        self.store = store
+
+    @staticmethod
+    def _key(prompt: str, llm_string: str) -> str:
+        return hashlib.sha256(f"{llm_string}\x00{prompt}".encode("utf-8")).hexdigest()
+
+    def lookup(self, prompt: str, llm_string: str) -> Optional[Sequence[Generation]]:
+        value = self.store.get(self._key(prompt, llm_string))
+        if value is None:
+            return None
+        note("cache_hit")
+        return [loads(generation) for generation in value]
+
+    def update(self, prompt: str, llm_string: str, return_val: Sequence[Generation]) -> None:
+        self.store.set(self._key(prompt, llm_string), [dumps(generation) for generation in return_val])
+
+    def clear(self, **kwargs) -> None:
+        self.store.clear()
+
+
+def enable_llm_cache(backend: Optional[str] = None,
+                     path: str = LLM_CACHE_PATH,
+                     ttl: Optional[float] = None,
+                     max_entries: int = 5000) -> Optional[LLMResponseCache]:
+    """
+    Turns on caching for every ChatOpenAI / OllamaLLM call in the process.
+    backend: "sqlite" (default, survives restarts), "memory" or "off"; LLM_CACHE_BACKEND overrides it.
+    """
+    backend = os.getenv("LLM_CACHE_BACKEND", backend or "sqlite")
+    if backend == "off":
+        set_llm_cache(None)
+        return None
+    if backend == "memory":
+        store = MemoryCache(ttl=ttl, max_entries=max_entries)
+    elif backend == "sqlite":
+        store = SqliteCache(path, ttl=ttl, max_entries=max_entries)
+    else:
+        raise ValueError(f"Unknown LLM cache backend: {backend}")
+    cache = LLMResponseCache(store)
+    set_llm_cache(cache)
+    return cache
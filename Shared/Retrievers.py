@@ -0,0 +1,290 @@
+import os
+import threading
+import time
+import weakref
+from collections import deque
+from concurrent.futures import Future, ThreadPoolExecutor, FIRST_COMPLETED, wait
+from typing import Any, Callable, Dict, List, Optional, Sequence
+
+import numpy as np
+
+from Shared.SearchCache import cached_tavily_results, cached_wikipedia_docs
+from Shared.SnippetIndex import SnippetIndex, HashingEmbedder
+
+MAX_IN_FLIGHT = int(os.getenv("RETRIEVER_MAX_IN_FLIGHT", 8))   # calls running at once per source, late ones included
+START_POLL = 0.01               # seconds between checks while a call waits for its worker
+LATENCY_WINDOW = 200            # recent successful calls kept per source for its p95
+HEDGE_MIN_SAMPLES = 10          # no hedging until a source has this many latencies
+DOCUMENT_EXTENSIONS = (".md", ".txt")
+DOCUMENT_CHUNK_CHARS = 1500     # local documents are split into paragraphs packed up to this size
+
+# Status of a source in one `retrieve` call
+STATUS_OK = "ok"
+STATUS_HEDGED = "hedged"        # the duplicate request answered first
+STATUS_TIMEOUT = "timeout"      # deadline passed, its late result is dropped
+STATUS_ERROR = "error"
+STATUS_BUSY = "busy"            # max_in_flight calls still running, the source is skipped
+STATUSES = (STATUS_OK, STATUS_HEDGED, STATUS_TIMEOUT, STATUS_ERROR, STATUS_BUSY)
+
+
+def format_web(results: Sequence[Dict[str, Any]]) -> List[str]:
+    return [f'<Document href="{doc["url"]}"/>\n{doc["content"]}\n</Document>' for doc in results]
+
+
+def format_documents(docs) -> List[str]:
+    return [f'<Document source="{doc.metadata["source"]}" page="{doc.metadata.get("page", "")}"/>\n'
+            f'{doc.page_content}\n</Document>' for doc in docs]
+
+
+def web_source(clients, max_results: int = 3, **params) -> Callable[[str], List[str]]:
+    """ TavilySearchResults through the shared search cache """
+    tool = clients.get("tavily_search", max_results=max_results, **params)
+    return lambda query: format_web(cached_tavily_results(tool, query))
+
+
+def wikipedia_source(clients, load_max_docs: int = 2, **params) -> Callable[[str], List[str]]:
+    """ Wikipedia pages through the shared search cache """
+    wikipedia = clients.get("wikipedia", load_max_docs=load_max_docs, **params)
+    return lambda query: format_documents(
+        cached_wikipedia_docs(query, load_max_docs=wikipedia.load_max_docs, wikipedia=wikipedia))
+
+
+def files_source(clients, path: str, k: int = 4, **params) -> Callable[[str], List[str]]:
+    """ Local .md/.txt files, no network """
+    documents = clients.get("local_documents", path=path, **params)
+    return lambda query: format_documents(documents.load(query, k=k))
+
+
+# Source kinds usable in a retriever config
+SOURCE_KINDS: Dict[str, Callable[..., Callable[[str], List[str]]]] = {
+    "web": web_source,
+    "wikipedia": wikipedia_source,
+    "files": files_source,
+}
+
+
+class _Document:
+    """ Same shape as a LangChain Document, so local hits format like Wikipedia pages """
+
+    def __init__(self, page_content: str, metadata: Dict[str, Any]):
+        self.page_content = page_content
+        self.metadata = metadata
+
+
+class LocalDocumentSearch:
+    """
+    Searches .md/.txt files under `path` without any network call.
+    Files are split into paragraph chunks once, chunks are ranked against the query
+    with the offline HashingEmbedder. A missing directory simply has no documents.
+    """
+
+    def __init__(self, path: str, embedder=None, chunk_chars: int = DOCUMENT_CHUNK_CHARS):
+        self.path = path
+        self.chunk_chars = chunk_chars
+        self.index = SnippetIndex(embedder or HashingEmbedder())
+        self._chunks: Optional[Dict[str, Dict[str, Any]]] = None
+        self._lock = threading.Lock()
+
+    def _split(self, text: str) -> List[str]:
+        chunks, piece = [], ""
+        for paragraph in text.split("\n\n"):
+            if piece and len(piece) + len(paragraph) > self.chunk_chars:
+                chunks.append(piece.strip())
+                piece = ""
+            piece += paragraph + "\n\n"
+        if piece.strip():
+            chunks.append(piece.strip())
+        return chunks
+
+    def _load_chunks(self) -> Dict[str, Dict[str, Any]]:
+        with self._lock:
+            if self._chunks is None:
+                chunks = {}
+                for root, _, files in os.walk(self.path):
+                    for name in sorted(files):
+                        if not name.endswith(DOCUMENT_EXTENSIONS):
+                            continue
+                        file_path = os.path.join(root, name)
+                        with open(file_path, encoding="utf-8", errors="replace") as file:
+                            for number, chunk in enumerate(self._split(file.read()), start=1):
+                                chunks.setdefault(chunk, {"source": os.path.relpath(file_path, self.path),
+                                                          "page": str(number)})
+                self._chunks = chunks
+            return self._chunks
+
+    def load(self, query: str, k: int = 4) -> List[_Document]:
+        chunks = self._load_chunks()
+        texts = list(chunks)
+        if not texts:
+            return []
+        scores = self.index.scores(query, texts)
+        best = np.argsort(-scores)[:k]
+        return [_Document(texts[i], chunks[texts[i]]) for i in best if scores[i] > 0]
+
+
+class _Call:
+    """ One request to a source; `started` is set when a worker picks it up """
+
+    def __init__(self):
+        self.started: Optional[float] = None
+        self.future: Optional[Future] = None
+
+
+class Retriever:
+    """
+    One configured source: `fetch(query)` returns formatted <Document .../> blocks.
+    Keeps the latencies of its recent successful calls; once there are enough of them,
+    a call still running after the p95 gets a duplicate (hedged) request.
+    At most `max_in_flight` calls run at once, late ones from earlier queries included.
+    """
+
+    def __init__(self, name: str, fetch: Callable[[str], List[str]], deadline: float = 10.0,
+                 hedge: bool = True, hedge_after: Optional[float] = None, max_in_flight: int = MAX_IN_FLIGHT):
+        self.name = name
+        self.fetch = fetch
+        self.deadline = deadline
+        self.hedge = hedge
+        self.hedge_after = hedge_after      # fixed hedge delay in seconds instead of the p95
+        self.max_in_flight = max_in_flight
+        self._in_flight = 0
+        self._latencies = deque(maxlen=LATENCY_WINDOW)
+        self._lock = threading.Lock()
+
+    def acquire(self) -> bool:
+        """ Reserves a call slot, False while `max_in_flight` calls are still running """
+        with self._lock:
+            if self._in_flight >= self.max_in_flight:
+                return False
+            self._in_flight += 1
+            return True
+
+    def timed_fetch(self, query: str, call: _Call) -> List[str]:
+        call.started = time.perf_counter()
+        try:
+            documents = self.fetch(query)
+        finally:
+            with self._lock:
+                self._in_flight -= 1
+        # Late calls are recorded too, so a slow source raises its own p95
+        with self._lock:
+            self._latencies.append(time.perf_counter() - call.started)
+        return documents
+
+    def p95(self) -> Optional[float]:
+        with self._lock:
+            if len(self._latencies) < HEDGE_MIN_SAMPLES:
+                return None
+            return float(np.percentile(self._latencies, 95))
+
+    def hedge_delay(self) -> Optional[float]:
+        """ Seconds after which a duplicate request is sent, None for no hedging """
+        if not self.hedge:
+            return None
+        delay = self.hedge_after if self.hedge_after is not None else self.p95()
+        return delay if delay is not None and delay < self.deadline else None
+
+
+class RetrieverEngine:
+    """
+    Runs every retriever at once for a query, each under its own deadline, counted from the
+    moment its call starts running. A source that misses its deadline, fails or still has
+    `max_in_flight` calls running contributes nothing instead of blocking the answer; a late
+    call keeps running, so its result still fills the search cache.
+    There is a worker for every call slot, so calls never queue behind each other.
+    Safe to share between parallel interviews; `close()` (or `with`) stops the workers.
+    """
+
+    def __init__(self, retrievers: Sequence[Retriever]):
+        self.retrievers = list(retrievers)
+        self._pool = ThreadPoolExecutor(max_workers=max(1, sum(r.max_in_flight for r in self.retrievers)),
+                                        thread_name_prefix="retriever")
+        # Idle workers also go away with an engine that is dropped without close()
+        weakref.finalize(self, self._pool.shutdown, wait=False)
+        self._counts = {r.name: {s: 0 for s in STATUSES} for r in self.retrievers}
+        self._errors: Dict[str, str] = {}
+        self._lock = threading.Lock()
+
+    def close(self) -> None:
+        self._pool.shutdown(wait=False, cancel_futures=True)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def _submit(self, retriever: Retriever, query: str, calls: List[_Call]) -> bool:
+        if not retriever.acquire():
+            return False
+        call = _Call()
+        call.future = self._pool.submit(retriever.timed_fetch, query, call)
+        calls.append(call)
+        return True
+
+    def retrieve(self, query: str) -> Dict[str, List[str]]:
+        """ Documents per source name, in retriever order; sources that gave nothing are left out """
+        calls: Dict[str, List[_Call]] = {r.name: [] for r in self.retrievers}
+        statuses = {r.name: STATUS_BUSY for r in self.retrievers if not self._submit(r, query, calls[r.name])}
+        hedge_at = {r.name: r.hedge_delay() for r in self.retrievers}
+        results: Dict[str, List[str]] = {}
+
+        while len(statuses) < len(self.retrievers):
+            now = time.perf_counter()
+            open_ = [r for r in self.retrievers if r.name not in statuses]
+            events = []
+            for r in open_:
+                started = calls[r.name][0].started
+                if started is None:
+                    events.append(now + START_POLL)
+                    continue
+                events.append(started + r.deadline)
+                if hedge_at[r.name] is not None:
+                    events.append(started + hedge_at[r.name])
+            running = [c.future for r in open_ for c in calls[r.name] if not c.future.done()]
+            if running:
+                wait(running, timeout=max(0.0, min(events) - now), return_when=FIRST_COMPLETED)
+            now = time.perf_counter()
+
+            for r in open_:
+                attempts, started = calls[r.name], calls[r.name][0].started
+                finished = [c for c in attempts if c.future.done() and c.future.exception() is None]
+                if finished:
+                    results[r.name] = finished[0].future.result()
+                    statuses[r.name] = STATUS_HEDGED if finished[0] is not attempts[0] else STATUS_OK
+                elif all(c.future.done() for c in attempts):
+                    self._errors[r.name] = repr(attempts[-1].future.exception())
+                    statuses[r.name] = STATUS_ERROR
+                elif started is not None and now >= started + r.deadline:
+                    statuses[r.name] = STATUS_TIMEOUT
+                elif hedge_at[r.name] is not None and started is not None and now >= started + hedge_at[r.name]:
+                    # No duplicate when the source is already at its limit
+                    self._submit(r, query, attempts)
+                    hedge_at[r.name] = None
+
+        with self._lock:
+            for name, status in statuses.items():
+                self._counts[name][status] += 1
+        return {r.name: results[r.name] for r in self.retrievers if results.get(r.name)}
+
+    def stats(self) -> Dict[str, Dict[str, Any]]:
+        """ Outcome counts, current p95 and the last error per source """
+        with self._lock:
+            return {r.name: dict(self._counts[r.name], p95=r.p95(), last_error=self._errors.get(r.name))
+                    for r in self.retrievers}
+
+
+def build_engine(config: Sequence[Dict[str, Any]], clients, enabled: Optional[Sequence[str]] = None) -> RetrieverEngine:
+    """
+    Engine from a declarative config, one dict per source:
+    {"name": ..., "kind": "web" | "wikipedia" | "files", "deadline": seconds, "hedge": bool,
+     "hedge_after": seconds, "max_in_flight": calls, "params": {...}}. `enabled` keeps only the named sources.
+    """
+    retrievers = []
+    for spec in config:
+        if enabled is not None and spec["name"] not in enabled:
+            continue
+        fetch = SOURCE_KINDS[spec["kind"]](clients, **spec.get("params", {}))
+        retrievers.append(Retriever(spec["name"], fetch, deadline=spec.get("deadline", 10.0),
+                                    hedge=spec.get("hedge", True), hedge_after=spec.get("hedge_after"),
+                                    max_in_flight=spec.get("max_in_flight", MAX_IN_FLIGHT)))
+    return RetrieverEngine(retrievers)
@@ -0,0 +1,98 @@
+import heapq
+import itertools
+import os
+import threading
+import time
+from collections import deque
+from contextlib import contextmanager
+from typing import Any, Deque, Dict, Optional
+
+from langchain_core.rate_limiters import InMemoryRateLimiter
+
+from Shared.Instrumentation import note
+
+# Requests per second allowed per provider, override with e.g. OPENAI_REQUESTS_PER_SECOND=2
+DEFAULT_REQUESTS_PER_SECOND = {"openai": 5.0, "tavily": 5.0, "ollama": 50.0}
+TIMINGS_KEPT = 1000             # timings of the most recent jobs kept by a PriorityScheduler
+
+class TimedRateLimiter(InMemoryRateLimiter):
+    """ Reports how long each acquire waited as the queue time of the LLM call in flight """
+
+    def acquire(self, *, blocking: bool = True) -> bool:
+        started = time.perf_counter()
+        acquired = super().acquire(blocking=blocking)
+        note("queue_s", time.perf_counter() - started)
+        return acquired
+
+    async def aacquire(self, *, blocking: bool = True) -> bool:
+        started = time.perf_counter()
+        acquired = await super().aacquire(blocking=blocking)
+        note("queue_s", time.perf_counter() - started)
+        return acquired
+
+
+_rate_limiters: Dict[str, InMemoryRateLimiter] = {}
+_rate_limiters_lock = threading.Lock()
+
+
+def get_rate_limiter(provider: str) -> InMemoryRateLimiter:
+    """
+    One token bucket per provider shared by every model of that provider in the process.
+    Pass it to the model: ChatOpenAI(..., rate_limiter=get_rate_limiter("openai")).
+    """
+    with _rate_limiters_lock:
+        if provider not in _rate_limiters:
+            rate = float(os.getenv(f"{provider.upper()}_REQUESTS_PER_SECOND",
+                                   DEFAULT_REQUESTS_PER_SECOND.get(provider, 5.0)))
+            _rate_limiters[provider] = TimedRateLimiter(
+                requests_per_second=rate,
+                check_every_n_seconds=0.05,
+                max_bucket_size=max(1.0, rate),
+            )
+        return _rate_limiters[provider]
+
+
+class PriorityScheduler:
+    """
+    Lets at most `max_in_flight` jobs run at once, the waiting ones start in priority
+    order (lower first, then submission order). Every job reports how long it waited
+    for a slot and how long it ran; the last `timings_kept` reports stay in `timings`.
+
+    LangGraph starts all Send() tasks of a step at once, so each task takes a slot first:
+
+        with scheduler.slot(priority=1, name="analyst 1") as timing:
+            ...
+    """
+
+    def __init__(self, max_in_flight: int = 3, timings_kept: int = TIMINGS_KEPT):
+        self.max_in_flight = max(1, max_in_flight)
+        self.timings: Deque[Dict[str, Any]] = deque(maxlen=timings_kept)
+        self._condition = threading.Condition()
+        self._waiting: list = []
+        self._in_flight = 0
+        self._counter = itertools.count()
+
+    @contextmanager
+    def slot(self, priority: int = 0, name: str = "", enqueued_at: Optional[float] = None):
+        """ `enqueued_at` (time.time()) lets the wait include time spent before reaching the scheduler """
+        enqueued_at = enqueued_at or time.time()
+        ticket = (priority, next(self._counter))
+        with self._condition:
+            heapq.heappush(self._waiting, ticket)
+            while self._in_flight >= self.max_in_flight or self._waiting[0] != ticket:
+                self._condition.wait()
+            heapq.heappop(self._waiting)
+            self._in_flight += 1
+            # The next job in line may also fit
+            self._condition.notify_all()
+
+        started_at = time.time()
+        timing = {"name": name, "priority": priority, "queue_wait_s": started_at - enqueued_at}
+        try:
+            yield timing
+        finally:
+            timing["execution_s"] = time.time() - started_at
+            with self._condition:
+                self._in_flight -= 1
+                self.timings.append(timing)
+                self._condition.notify_all()
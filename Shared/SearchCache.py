@@ -0,0 +1,86 @@
+import hashlib
+import json
+import os
+import re
+from typing import Any, Dict, List, Optional
+
+from Shared.Cache import SqliteCache
+
+# One file in the repository root so every graph shares the same cache
+SEARCH_CACHE_PATH = os.getenv(
+    "SEARCH_CACHE_PATH",
+    os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "SearchCache.db"),
+)
+SEARCH_CACHE_TTL = float(os.getenv("SEARCH_CACHE_TTL", 3 * 24 * 3600))
+SEARCH_CACHE_MAX_ENTRIES = int(os.getenv("SEARCH_CACHE_MAX_ENTRIES", 5000))
+
+_search_cache: Optional[SqliteCache] = None
+
+
+def get_search_cache() -> SqliteCache:
+    """ Opens the shared search cache on first use """
+    global _search_cache
+    if _search_cache is None:
+        _search_cache = SqliteCache(SEARCH_CACHE_PATH, ttl=SEARCH_CACHE_TTL, max_entries=SEARCH_CACHE_MAX_ENTRIES)
+    return _search_cache
+
+
+def normalize_query(query: str) -> str:
+    """ "  What is LangGraph? " and "what is langgraph" should hit the same entry """
+    return re.sub(r"\s+", " ", query).strip().rstrip("?!.").lower()
+
+
+def make_key(source: str, query: str, **params) -> str:
+    """ Content address of a search: source name, normalized query and its parameters """
+    payload = json.dumps([source, normalize_query(query), params], sort_keys=True, default=str)
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+
+class CachedSearchClient:
+    """ Drop-in wrapper for TavilyClient.search """
+
+    def __init__(self, client, cache: Optional[SqliteCache] = None, source: str = "tavily"):
+        self.client = client
+        self.cache = cache or get_search_cache()
+        self.source = source
+
+    def search(self, query: str, **params) -> Dict[str, Any]:
+        key = make_key(self.source, query, **params)
+        return self.cache.get_or_set(key, lambda: self.client.search(query=query, **params))
+
+
+class CachedAsyncSearchClient(CachedSearchClient):
+    """ Drop-in wrapper for AsyncTavilyClient.search """
+
+    async def search(self, query: str, **params) -> Dict[str, Any]:
+        key = make_key(self.source, query, **params)
+        response = self.cache.get(key)
+        if response is None:
+            response = await self.client.search(query=query, **params)
+            self.cache.set(key, response)
+        return response
+
+
+def cached_tavily_results(tool, query: str, cache: Optional[SqliteCache] = None) -> List[Dict[str, Any]]:
+    """ Cached TavilySearchResults.invoke(query) """
+    cache = cache or get_search_cache()
+    key = make_key("tavily_tool", query, max_results=tool.max_results)
+    return cache.get_or_set(key, lambda: tool.invoke(query))
+
+
+def cached_wikipedia_docs(query: str, load_max_docs: int = 2, cache: Optional[SqliteCache] = None, wikipedia=None):
+    """
+    Cached WikipediaLoader(query, load_max_docs).load().
+    wikipedia: any client with `load(query)`, e.g. the registry's "wikipedia" client, by default WikipediaLoader.
+    """
+    from langchain_core.documents import Document
+    from Shared.Clients import WikipediaSearch
+
+    cache = cache or get_search_cache()
+    wikipedia = wikipedia or WikipediaSearch(load_max_docs)
+    key = make_key("wikipedia", query, load_max_docs=load_max_docs)
+    docs = cache.get_or_set(key, lambda: [
+        {"page_content": doc.page_content, "metadata": doc.metadata}
+        for doc in wikipedia.load(query)
+    ])
+    return [Document(page_content=d["page_content"], metadata=d["metadata"]) for d in docs]
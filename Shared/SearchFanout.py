@@ -0,0 +1,67 @@
+import asyncio
+import functools
+import inspect
+import os
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Dict, List, Sequence
+
+SEARCH_WORKERS = int(os.getenv("SEARCH_WORKERS", 16))  # threads shared by all sync search clients
+
+# Not the loop's default executor: asyncio.run waits for that one on exit, so a timed out
+# sync call would still block the node until it returned
+_executor = ThreadPoolExecutor(max_workers=SEARCH_WORKERS, thread_name_prefix="search")
+
+
+async def _search_one(client, query: str, semaphore: asyncio.Semaphore, timeout: float, **params) -> Dict[str, Any]:
+    """
+    Runs one search under the concurrency limit.
+    Async clients (AsyncTavilyClient) are awaited, sync clients (TavilyClient) run in a shared worker thread.
+    A query that fails or exceeds its timeout gives an empty result instead of failing the whole batch;
+    a timed out sync call keeps its worker until it returns, but nobody waits for it.
+    """
+    async with semaphore:
+        try:
+            if inspect.iscoroutinefunction(client.search):
+                call = client.search(query=query, **params)
+            else:
+                call = asyncio.get_running_loop().run_in_executor(
+                    _executor, functools.partial(client.search, query=query, **params))
+            return await asyncio.wait_for(call, timeout=timeout)
+        except Exception as error:
+            print(f"Search for '{query}' failed: {error!r}")
+            return {"results": []}
+
+
+async def asearch_all(client,
+                      queries: Sequence[str],
+                      max_concurrency: int = 4,
+                      timeout: float = 15.0,
+                      **params) -> List[Dict[str, Any]]:
+    """
+    Issues all queries at once (at most `max_concurrency` in flight) and returns
+    the responses in the same order as `queries`, no matter which one finished first.
+    """
+    semaphore = asyncio.Semaphore(max(1, max_concurrency))
+    return list(await asyncio.gather(
+        *[_search_one(client, q, semaphore, timeout, **params) for q in queries]
+    ))
+
+
+def search_all(client,
+               queries: Sequence[str],
+               max_concurrency: int = 4,
+               timeout: float = 15.0,
+               **params) -> List[Dict[str, Any]]:
+    """
+    Sync entry point for graph nodes. LangGraph runs sync nodes in a worker thread
+    under `astream`/`ainvoke` and in the caller's thread under `stream`/`invoke`,
+    so there is no running event loop here and we can start our own.
+    """
+    return asyncio.run(asearch_all(client, queries, max_concurrency=max_concurrency, timeout=timeout, **params))
+
+
+def collect_contents(responses: Sequence[Dict[str, Any]]) -> List[str]:
+    """
+    Flattens search responses into a list of snippet texts, keeping query order.
+    """
+    return [r['content'] for response in responses for r in response.get('results', [])]
@@ -0,0 +1,131 @@
+import hashlib
+import os
+import threading
+from typing import Dict, List, Sequence
+
+import numpy as np
+
+from Shared.ContentStore import tokenize, pack_by_score
+
+SNIPPET_INDEX_MAX = int(os.getenv("SNIPPET_INDEX_MAX", 20000))   # snippets kept per index (~40 MB at 512 dims)
+EVICT_TO = 0.75                 # a full index drops its least recently used snippets down to this share
+
+
+class HashingEmbedder:
+    """
+    Deterministic offline embedder: signed feature hashing of words and word bigrams.
+    No model, no network, same vector for the same text in every process.
+    """
+
+    def __init__(self, dim: int = 512):
+        self.dim = dim
+
+    def _bucket(self, feature: str):
+        digest = int.from_bytes(hashlib.blake2b(feature.encode(), digest_size=8).digest(), "big")
+        return digest % self.dim, 1.0 if (digest >> 63) & 1 else -1.0
+
+    def embed(self, texts: Sequence[str]) -> np.ndarray:
+        vectors = np.zeros((len(texts), self.dim), dtype=np.float32)
+        for row, text in enumerate(texts):
+            words = tokenize(text)
+            for feature in words + [f"{a} {b}" for a, b in zip(words, words[1:])]:
+                column, sign = self._bucket(feature)
+                vectors[row, column] += sign
+        return vectors
+
+
+class LangChainEmbedder:
+    """ Adapter for any LangChain `Embeddings` (e.g. OpenAIEmbeddings, OllamaEmbeddings) """
+
+    def __init__(self, embeddings):
+        self.embeddings = embeddings
+
+    def embed(self, texts: Sequence[str]) -> np.ndarray:
+        return np.asarray(self.embeddings.embed_documents(list(texts)), dtype=np.float32)
+
+
+def _normalize(vectors: np.ndarray) -> np.ndarray:
+    norms = np.linalg.norm(vectors, axis=1, keepdims=True)
+    norms[norms == 0] = 1.0
+    return vectors / norms
+
+
+class SnippetIndex:
+    """
+    In-memory embedding index of snippets.
+    Every snippet is embedded once (new ones in a single batch) and scored against
+    a query with one matrix-vector product. Safe to share between parallel nodes.
+    Holds at most `max_size` snippets: when it is full, the least recently scored ones are dropped
+    (down to EVICT_TO of the limit, so eviction does not run on every add).
+    """
+
+    def __init__(self, embedder=None, max_size: int = SNIPPET_INDEX_MAX):
+        self.embedder = embedder or HashingEmbedder()
+        self.max_size = max_size
+        self._rows: Dict[str, int] = {}
+        self._texts: List[str] = []
+        self._vectors = None
+        self._used = np.zeros(0, dtype=np.int64)   # tick of the last add/score of every row
+        self._clock = 0
+        self._size = 0
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return self._size
+
+    def add(self, texts: Sequence[str]) -> None:
+        """ Embeds snippets that are not in the index yet """
+        with self._lock:
+            self._add(texts)
+
+    def _add(self, texts: Sequence[str]) -> None:
+        self._clock += 1
+        known = [self._rows[t] for t in texts if t in self._rows]
+        self._used[known] = self._clock
+        new = list(dict.fromkeys(t for t in texts if t not in self._rows))
+        if not new:
+            return
+        if self._size and self._size + len(new) > self.max_size:
+            self._evict(max(0, int(self.max_size * EVICT_TO) - len(new)))
+        vectors = _normalize(self.embedder.embed(new))
+        if self._vectors is None:
+            self._vectors = np.zeros((max(64, len(new)), vectors.shape[1]), dtype=np.float32)
+            self._used = np.zeros(len(self._vectors), dtype=np.int64)
+        needed = self._size + len(new)
+        if needed > len(self._vectors):
+            capacity = max(needed, 2 * len(self._vectors))
+            grown = np.zeros((capacity, self._vectors.shape[1]), dtype=np.float32)
+            grown[:self._size] = self._vectors[:self._size]
+            self._vectors = grown
+            self._used = np.concatenate([self._used[:self._size], np.zeros(capacity - self._size, dtype=np.int64)])
+        self._vectors[self._size:needed] = vectors
+        self._used[self._size:needed] = self._clock
+        for offset, text in enumerate(new):
+            self._rows[text] = self._size + offset
+        self._texts.extend(new)
+        self._size = needed
+
+    def _evict(self, keep: int) -> None:
+        """ Keeps the `keep` most recently used rows, and always the ones of the current call """
+        keep = max(keep, int(np.count_nonzero(self._used[:self._size] == self._clock)))
+        order = np.sort(np.argsort(-self._used[:self._size], kind="stable")[:keep])
+        self._vectors[:len(order)] = self._vectors[order]
+        self._used[:len(order)] = self._used[order]
+        self._texts = [self._texts[i] for i in order]
+        self._rows = {text: row for row, text in enumerate(self._texts)}
+        self._size = len(order)
+
+    def scores(self, query: str, texts: Sequence[str]) -> np.ndarray:
+        """ Cosine similarity of every text to the query """
+        if not texts:
+            return np.zeros(0, dtype=np.float32)
+        query_vector = _normalize(self.embedder.embed([query]))[0]
+        # Added and read under one lock, so another thread cannot evict the rows in between
+        with self._lock:
+            self._add(texts)
+            rows = np.fromiter((self._rows[t] for t in texts), dtype=np.int64, count=len(texts))
+            return self._vectors[rows] @ query_vector
+
+    def select(self, texts: Sequence[str], query: str, k: int = 8, token_budget: int = 1500) -> List[str]:
+        """ Top `k` texts most similar to the query that fit into `token_budget` tokens """
+        return pack_by_score(texts, self.scores(query, texts).tolist(), k, token_budget)
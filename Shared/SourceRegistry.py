@@ -0,0 +1,117 @@
+import re
+from typing import Dict, List, Optional, Sequence, Tuple
+
+# Headers written by the retrievers (Shared/Retrievers.py)
+DOCUMENT_HEADER = re.compile(r'<Document (href|source)="([^"]*)"(?: page="([^"]*)")?\s*/>')
+# [1], [1, 2], [1,2,3]
+CITATION = re.compile(r"\[(\d{1,3}(?:\s*,\s*\d{1,3})*)\]")
+SOURCES_HEADER = re.compile(r"^#{2,3} Sources\s*$", re.MULTILINE)
+SOURCE_LINE = re.compile(r"^\s*\[(\d+)\]\s*(.+?)\s*$")
+
+
+def source_label(header: str) -> Optional[str]:
+    """ URL for web results, "title/url, page N" for wikipedia or document results """
+    match = DOCUMENT_HEADER.search(header)
+    if match is None:
+        return None
+    kind, value, page = match.groups()
+    if kind == "source" and page:
+        return f"{value}, page {page}"
+    return value
+
+
+class SourceRegistry:
+    """
+    Numbers every distinct source once, in order of first registration.
+    """
+
+    def __init__(self):
+        self._numbers: Dict[str, int] = {}
+        self.labels: List[str] = []
+
+    def __len__(self):
+        return len(self.labels)
+
+    def register(self, label: str) -> int:
+        number = self._numbers.get(label)
+        if number is None:
+            self.labels.append(label)
+            number = self._numbers[label] = len(self.labels)
+        return number
+
+    def label(self, number: int) -> str:
+        return self.labels[number - 1]
+
+    def number_documents(self, chunks: Sequence[str]) -> str:
+        """ Prefixes every context chunk with the number of its source, for the writer to cite """
+        numbered = []
+        for chunk in chunks:
+            label = source_label(chunk)
+            prefix = f"Source [{self.register(label)}]: {label}\n" if label else ""
+            numbered.append(prefix + chunk)
+        return "\n\n---\n\n".join(numbered)
+
+    def render(self, numbers: Optional[Sequence[int]] = None, header: str = "### Sources") -> str:
+        """ Markdown sources list (two trailing spaces keep the lines apart) """
+        numbers = range(1, len(self.labels) + 1) if numbers is None else numbers
+        return header + "\n" + "\n".join(f"[{n}] {self.label(n)}  " for n in numbers)
+
+
+def rewrite_citations(text: str, mapping: Dict[int, int]) -> str:
+    """ Renumbers all citations in one pass, unknown numbers are dropped """
+
+    def replace(match: re.Match) -> str:
+        numbers = [mapping.get(int(n)) for n in match.group(1).split(",")]
+        numbers = list(dict.fromkeys(n for n in numbers if n is not None))
+        return "".join(f"[{n}]" for n in numbers)
+
+    return CITATION.sub(replace, text)
+
+
+def split_sources(section: str) -> Tuple[str, Dict[int, str]]:
+    """ Separates the body from its Sources block and parses it into {number: label} """
+    match = SOURCES_HEADER.search(section)
+    if match is None:
+        return section.rstrip(), {}
+    sources = {}
+    for line in section[match.end():].splitlines():
+        parsed = SOURCE_LINE.match(line)
+        if parsed:
+            sources[int(parsed.group(1))] = parsed.group(2)
+    return section[:match.start()].rstrip(), sources
+
+
+def cited_numbers(text: str) -> List[int]:
+    """ Citation numbers in order of first use """
+    numbers = [int(n) for match in CITATION.finditer(text) for n in match.group(1).split(",")]
+    return list(dict.fromkeys(numbers))
+
+
+def finalize_section(section: str, registry: SourceRegistry) -> str:
+    """
+    Replaces whatever Sources block the writer produced with one built from `registry`:
+    only cited sources, numbered 1..n in order of first use.
+    """
+    body, _ = split_sources(section)
+    used = [n for n in cited_numbers(body) if 1 <= n <= len(registry)]
+    mapping = {old: new for new, old in enumerate(used, start=1)}
+    compact = SourceRegistry()
+    for n in used:
+        compact.register(registry.label(n))
+    body = rewrite_citations(body, mapping)
+    return body + "\n\n" + compact.render() if used else body
+
+
+def merge_sections(sections: Sequence[str]) -> Tuple[List[Tuple[str, List[int]]], SourceRegistry]:
+    """
+    Gives every source used in any section one global number and rewrites each section's
+    citations to it. Returns [(section body without Sources, global numbers it cites)] and the registry.
+    """
+    registry = SourceRegistry()
+    merged = []
+    for section in sections:
+        body, local_sources = split_sources(section)
+        mapping = {local: registry.register(label) for local, label in local_sources.items()}
+        body = rewrite_citations(body, mapping)
+        merged.append((body, [n for n in cited_numbers(body)]))
+    return merged, registry
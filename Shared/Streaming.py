@@ -0,0 +1,93 @@
+import sys
+from typing import Any, Callable, Dict, Iterable, Optional
+from uuid import UUID
+
+from langchain_core.callbacks import BaseCallbackHandler
+
+TokenCallback = Callable[[str, str], None]
+
+
+def print_token(node: str, token: str) -> None:
+    sys.stdout.write(token)
+    sys.stdout.flush()
+
+
+def node_printer() -> TokenCallback:
+    """ print_token with a header whenever the tokens start coming from another node (parallel nodes interleave) """
+    last = {"node": None}
+
+    def on_token(node: str, token: str) -> None:
+        if node != last["node"]:
+            last["node"] = node
+            sys.stdout.write(f"\n\n[{node}]\n")
+        print_token(node, token)
+
+    return on_token
+
+
+def _text(chunk) -> str:
+    """ Text of a message chunk, tool call / structured output chunks have none """
+    content = getattr(chunk, "content", chunk)
+    if isinstance(content, str):
+        return content
+    return "".join(part.get("text", "") for part in content if isinstance(part, dict))
+
+
+def run_streaming(graph,
+                  inputs: Optional[Dict[str, Any]],
+                  config: Optional[Dict[str, Any]] = None,
+                  nodes: Optional[Iterable[str]] = None,
+                  on_token: TokenCallback = print_token) -> Dict[str, Any]:
+    """
+    Runs the graph with stream_mode="messages" and hands every generated token of `nodes`
+    (all nodes if None) to `on_token(node, token)` as soon as it arrives.
+    Returns the final state, the same one `graph.invoke` would return.
+    """
+    nodes = set(nodes) if nodes is not None else None
+    final_state = None
+    for mode, payload in graph.stream(inputs, config, stream_mode=["messages", "values"]):
+        if mode == "values":
+            final_state = payload
+            continue
+        chunk, metadata = payload
+        node = metadata.get("langgraph_node", "")
+        if nodes is not None and node not in nodes:
+            continue
+        token = _text(chunk)
+        if token:
+            on_token(node, token)
+    return final_state
+
+
+class TokenCallbackHandler(BaseCallbackHandler):
+    """
+    Callback alternative to run_streaming for code that calls `graph.invoke` itself:
+
+        graph.invoke(inputs, {"callbacks": [TokenCallbackHandler(on_token, nodes={"generate"})]})
+
+    Tokens only arrive from models that stream on `.invoke`: ChatOpenAI created with `streaming=True`
+    (clients.get("openai", MODEL, streaming=True)) or any chat model bound with `.bind(stream=True)`.
+    run_streaming needs no such flag.
+    """
+
+    def __init__(self, on_token: TokenCallback = print_token, nodes: Optional[Iterable[str]] = None):
+        self.on_token = on_token
+        self.nodes = set(nodes) if nodes is not None else None
+        self._run_nodes: Dict[UUID, str] = {}
+
+    def on_chat_model_start(self, serialized, messages, *, run_id: UUID, metadata=None, **kwargs) -> None:
+        self._run_nodes[run_id] = (metadata or {}).get("langgraph_node", "")
+
+    def on_llm_new_token(self, token: str, *, chunk=None, run_id: UUID, **kwargs) -> None:
+        node = self._run_nodes.get(run_id, "")
+        if self.nodes is not None and node not in self.nodes:
+            return
+        text = _text(chunk.message) if chunk is not None and hasattr(chunk, "message") else token
+        if text:
+            self.on_token(node, text)
+
+    def on_llm_end(self, response, *, run_id: UUID, **kwargs) -> None:
+        self._run_nodes.pop(run_id, None)
+
+    def on_llm_error(self, error: BaseException, *, run_id: UUID, **kwargs) -> None:
+        self._run_nodes.pop(run_id, None)
@@ -0,0 +1,3 @@
+"""
+Helpers shared by the graphs in this repository (search, caching, retrieval, etc.).
+"""
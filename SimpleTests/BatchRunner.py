@@ -0,0 +1,106 @@
+"""
+Runs many topics through one of the two-agent graphs in a single process.
+
+    python SimpleTests/BatchRunner.py topics.txt --graph conversation --out dialogues.jsonl --max-concurrency 8
+
+`topics.txt` holds one topic per line (blank lines and lines starting with '#' are skipped).
+Each finished conversation is written to the JSONL sink as soon as it completes, so a long
+batch can be followed with `tail -f` and an interrupted one keeps everything done so far.
+"""
+import argparse
+import json
+import os
+import sys
+import time
+from typing import Iterator, List
+
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from Shared.Instrumentation import add_metrics_argument, instrument, write_metrics
+
+
+def read_topics(path: str) -> List[str]:
+    with open(path, encoding="utf-8") as file:
+        return [line.strip() for line in file if line.strip() and not line.lstrip().startswith("#")]
+
+
+def conversation_inputs(topic: str, max_iterations: int) -> dict:
+    return {
+        "topic": topic,
+        "current_iteration": 0,
+        "max_iterations": max_iterations,
+        "history": [],
+        "history_text": "",
+        "summary": "",
+    }
+
+
+def ping_pong_inputs(topic: str, max_iterations: int) -> dict:
+    return {
+        "topic": topic,
+        "FirstAgentMessage": "",
+        "SecondAgentMessage": "",
+        "current_iteration": 1,
+        "max_iterations": max_iterations,
+    }
+
+
+def load_graph(name: str):
+    """
+    Imported lazily so only the selected graph (and its model client) is built.
+    """
+    if name == "conversation":
+        from ConversationOfTwo import build_graph
+        return build_graph(), conversation_inputs
+    from main import build_graph
+    return build_graph(), ping_pong_inputs
+
+
+def run_batch(graph, inputs: List[dict], max_concurrency: int) -> Iterator[dict]:
+    """
+    Yields one record per input in completion order. A failed conversation is reported, not raised.
+    """
+    started = time.perf_counter()
+    results = graph.batch_as_completed(inputs, config={"max_concurrency": max_concurrency}, return_exceptions=True)
+    for index, output in results:
+        record = {"index": index, "topic": inputs[index]["topic"],
+                  "finished_after_s": round(time.perf_counter() - started, 3)}
+        if isinstance(output, Exception):
+            record["error"] = f"{type(output).__name__}: {output}"
+        else:
+            record["state"] = output
+        yield record
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("topics", help="file with one topic per line")
+    parser.add_argument("--graph", choices=["conversation", "ping-pong"], default="conversation",
+                        help="ConversationOfTwo.py or main.py")
+    parser.add_argument("--out", default="dialogues.jsonl")
+    parser.add_argument("--max-concurrency", type=int, default=8)
+    parser.add_argument("--max-iterations", type=int, default=3)
+    add_metrics_argument(parser)
+    args = parser.parse_args()
+
+    topics = read_topics(args.topics)
+    graph, make_inputs = load_graph(args.graph)
+    if args.metrics:
+        graph = instrument(graph, jsonl_path=args.metrics, name=args.graph)
+    inputs = [make_inputs(topic, args.max_iterations) for topic in topics]
+
+    failed = 0
+    with open(args.out, "a", encoding="utf-8") as sink:
+        for record in run_batch(graph, inputs, args.max_concurrency):
+            failed += "error" in record
+            sink.write(json.dumps(record, ensure_ascii=False, default=str) + "\n")
+            sink.flush()
+            print(f"[{record['finished_after_s']:8.2f}s] {'FAILED' if 'error' in record else 'done  '} {record['topic']}")
+
+    print(f"{len(topics) - failed}/{len(topics)} conversations succeeded, results appended to {args.out}")
+    if args.metrics:
+        write_metrics(args.metrics)
+
+
+if __name__ == "__main__":
+    main()
@@ -1,17 +1,19 @@
+import argparse
+import os
+import sys
+from functools import partial
 from dotenv import load_dotenv
 from langgraph.graph import StateGraph, END
 from typing import TypedDict, List, Dict
 from langchain_core.messages import SystemMessage, HumanMessage
-from langchain_openai import ChatOpenAI
-
-_ = load_dotenv()
 
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from Shared.Diagram import add_draw_argument, draw
+from Shared.Instrumentation import add_metrics_argument, instrument, write_metrics
+from Shared.Clients import ClientRegistry, default_registry
+from Shared.Convergence import ConvergenceDetector, STOP_MAX_ITERATIONS
 
-class AgentState(TypedDict):
-    topic: str
-    current_iteration: int
-    max_iterations: int
-    history: List[Dict[str, str]]
+_ = load_dotenv()
 
 
 FIRST_AGENT_PROMPT = """
@@ -28,46 +30,104 @@ Stay focused on evidence-based reasoning, technical ideas, and actionable steps.
 Avoid broad moral or philosophical debates and ensure your response advances the scientific exploration of the topic.
 """
 
+SUMMARY_PROMPT = """
+You keep the running summary of a scientific discussion about: {topic}
+Update the summary with the new messages below. Keep the hypotheses, proposed methods, agreements and open questions,
+and who proposed what; drop repetition. Answer with the updated summary only, in at most 200 words.
 
-model = ChatOpenAI(model="gpt-4o-mini", temperature=0.7, max_tokens=300)
+Current summary:
+{summary}
+"""
+
+
+MODEL = "gpt-4o-mini"
+# Dialogues are meant to be sampled, so they never come from the LLM cache
+MODEL_PARAMS = {"temperature": 0.7, "max_tokens": 300, "cache": False}
+# Summaries should be stable, so these may be cached
+SUMMARY_MODEL_PARAMS = {"temperature": 0, "max_tokens": 300}
+
+# Ends the discussion once an agent keeps repeating itself; build_graph(convergence=None) disables it
+CONVERGENCE = ConvergenceDetector()
 
 class AgentState(TypedDict):
     topic: str
     current_iteration: int
     max_iterations: int
-    history: List[dict]  # Modified for agent-based history
+    history: List[dict]  # Recent turns kept verbatim
+    history_text: str    # `history` pre-formatted for the prompt
+    summary: str         # Running summary of the turns evicted from `history`
+    stop_reason: str     # Why the discussion ended: converged or max_iterations
 
 
-class Agent:
-    def __init__(self, model, system_prompt: str, max_history_length: int = 5):
+class ConversationMemory:
+    def __init__(self, model, max_history_length: int = 5, summary_batch: int = 4):
         """
-        Initializes the Agent class.
+        Recent turns verbatim plus a running summary of everything older.
 
-        :param model: ChatOpenAI model or similar callable model
-        :param system_prompt: The system prompt for the agent
-        :param max_history_length: Maximum length of the conversation history
+        Turns are evicted `summary_batch` at a time, so the summary costs one LLM call per batch
+        rather than one per turn, and the prompt never holds more than
+        `max_history_length + summary_batch` turns.
+
+        :param model: ChatOpenAI model or similar callable model used for summaries
+        :param max_history_length: Number of turns kept verbatim after an eviction
+        :param summary_batch: Number of turns folded into the summary at once
         """
         self.model = model
-        self.system_prompt = system_prompt
         self.max_history_length = max_history_length
+        self.summary_batch = summary_batch
+
+    @staticmethod
+    def format_entry(entry: dict) -> str:
+        return f"{entry['agent']}: {entry['message']}\n\n"
 
-    def truncate_history(self, history: List[dict]) -> List[dict]:
+    def render(self, state: AgentState) -> str:
         """
-        Truncate history to the last `max_history_length` entries.
+        Prompt text for the conversation so far: the summary, then the recent turns.
+        """
+        history_text = state.get("history_text", "")
+        if state.get("summary"):
+            return f"Summary of the earlier discussion:\n{state['summary']}\n\nRecent messages:\n\n{history_text}"
+        return history_text
 
-        :param history: Full conversation history
-        :return: Truncated conversation history
+    def append(self, state: AgentState, entry: dict) -> dict:
+        """
+        Adds a turn and returns the state update for `history`, `history_text` and `summary`.
         """
-        return history[-self.max_history_length:]
+        history = state["history"] + [entry]
+        history_text = state.get("history_text", "") + self.format_entry(entry)
+        summary = state.get("summary", "")
+
+        if len(history) >= self.max_history_length + self.summary_batch:
+            evicted, history = history[:self.summary_batch], history[self.summary_batch:]
+            evicted_text = "".join(self.format_entry(e) for e in evicted)
+            history_text = history_text[len(evicted_text):]
+            summary = self.summarize(state["topic"], summary, evicted_text)
 
-    def format_history(self, history: List[dict]) -> str:
+        return {"history": history, "history_text": history_text, "summary": summary}
+
+    def summarize(self, topic: str, summary: str, evicted_text: str) -> str:
+        messages = [
+            SystemMessage(content=SUMMARY_PROMPT.format(topic=topic, summary=summary or "(empty)")),
+            HumanMessage(content=evicted_text),
+        ]
+        return self.model.invoke(messages).content
+
+
+class Agent:
+    def __init__(self, model, system_prompt: str, memory: ConversationMemory,
+                 convergence: ConvergenceDetector = None):
         """
-        Format the history into a readable string for use in the prompt.
+        Initializes the Agent class.
 
-        :param history: Conversation history as a list of dicts
-        :return: Formatted history string
+        :param model: ChatOpenAI model or similar callable model
+        :param system_prompt: The system prompt for the agent
+        :param memory: Conversation memory shared by both participants
+        :param convergence: Compares the agent's message with its previous one, None never stops early
         """
-        return "\n\n".join([f"{entry['agent']}: {entry['message']}" for entry in history])
+        self.model = model
+        self.system_prompt = system_prompt
+        self.memory = memory
+        self.convergence = convergence
 
     def generate_message(self, state: AgentState, agent_name: str) -> AgentState:
         """
@@ -77,8 +137,8 @@ class Agent:
         :param agent_name: Name of the agent generating the response
         :return: Updated state with the agent's response
         """
-        # Format history for the prompt
-        history_str = self.format_history(state["history"])
+        # Summary plus recent turns, already formatted
+        history_str = self.memory.render(state)
 
         # Construct user message
         user_message = HumanMessage(
@@ -96,133 +156,109 @@ class Agent:
         response = self.model.invoke(messages)
         new_message = response.content
 
-        # Append the new message to the history and truncate
-        updated_history = self.truncate_history(
-            state["history"] + [{"agent": agent_name, "message": new_message}]
-        )
+        # The second agent closes an iteration, so it decides whether the discussion goes on
+        update = {}
+        if agent_name == "second_agent":
+            previous = next((entry["message"] for entry in reversed(state["history"])
+                             if entry["agent"] == agent_name), None)
+            stop_reason = self.convergence.stop_reason(previous, new_message) if self.convergence else ""
+            if not stop_reason and state["current_iteration"] + 1 >= state["max_iterations"]:
+                stop_reason = STOP_MAX_ITERATIONS
+            update["stop_reason"] = stop_reason
 
         # Update and return the state
         return {
             "topic": state["topic"],
             "current_iteration": state["current_iteration"] + (1 if agent_name == "second_agent" else 0),
             "max_iterations": state["max_iterations"],
-            "history": updated_history,
+            **update,
+            **self.memory.append(state, {"agent": agent_name, "message": new_message}),
         }
 
 
-def first_agent(state: AgentState):
-    history_str = format_history(state["history"])
-
-    user_message = HumanMessage(
-        content=f"Here is the topic: {state['topic']}\n\n"
-                f"Here is a Conversation history:\n\n{history_str}"
-    )
-
-    messages = [
-        SystemMessage(content=FIRST_AGENT_PROMPT),
-        user_message,
-    ]
-
-    response = model.invoke(messages)
-    new_message = response.content
-
-    # Return the updated state, preserving all keys
-    return {
-        "topic": state["topic"],
-        "current_iteration": state["current_iteration"],
-        "max_iterations": state["max_iterations"],
-        "history": truncate_history(state["history"] + [{"agent": "first_agent", "message": new_message}]),
-    }
-
-
-def second_agent(state: AgentState):
-    history_str = format_history(state["history"])
-
-    user_message = HumanMessage(
-        content=f"Here is the topic: {state['topic']}\n\n"
-                f"Here is a Conversation history:\n\n{history_str}"
-    )
-
-    messages = [
-        SystemMessage(content=SECOND_AGENT_PROMPT),
-        user_message,
-    ]
-
-    response = model.invoke(messages)
-    new_message = response.content
-
-    # Return the updated state, preserving all keys
-    return {
-        "topic": state["topic"],
-        "current_iteration": state["current_iteration"] + 1,
-        "max_iterations": state["max_iterations"],
-        "history": truncate_history(state["history"] + [{"agent": "second_agent", "message": new_message}]),
-    }
-
-
-
 def should_continue(state: AgentState):
     """
     Checks if we can make one more iteration.
     """
-    if state["current_iteration"] >= state["max_iterations"]:
+    if state.get("stop_reason"):
         return END
     return "first_agent"
 
 
-builder = StateGraph(AgentState)
+def build_graph(clients: ClientRegistry = None, convergence: ConvergenceDetector = CONVERGENCE):
+    clients = clients or default_registry
+    model = clients.get("openai", MODEL, **MODEL_PARAMS)
+    memory = ConversationMemory(clients.get("openai", MODEL, **SUMMARY_MODEL_PARAMS))
+    first_agent = partial(Agent(model, FIRST_AGENT_PROMPT, memory).generate_message, agent_name="first_agent")
+    second_agent = partial(Agent(model, SECOND_AGENT_PROMPT, memory, convergence).generate_message, agent_name="second_agent")
+
+    builder = StateGraph(AgentState)
+
+    builder.add_node("first_agent", first_agent)
+    builder.add_node("second_agent", second_agent)
 
-builder.add_node("first_agent", first_agent)
-builder.add_node("second_agent", second_agent)
+    builder.set_entry_point("first_agent")
+    builder.add_edge("first_agent", "second_agent")
 
-builder.set_entry_point("first_agent")
-builder.add_edge("first_agent", "second_agent")
+    builder.add_conditional_edges(
+        "second_agent",
+        should_continue,
+        {END: END, "first_agent": "first_agent"}
+    )
+
+    return builder.compile()
 
-builder.add_conditional_edges(
-    "second_agent",
-    should_continue,
-    {END: END, "first_agent": "first_agent"}
-)
 
-graph = builder.compile()
+def main():
+    parser = argparse.ArgumentParser()
+    add_draw_argument(parser)
+    add_metrics_argument(parser)
+    args = parser.parse_args()
 
-# Save as PNG
-graph_image = graph.get_graph().draw_mermaid_png()
-with open("graph_diagram.png", "wb") as file:
-    file.write(graph_image)
-print("Saved as PNG 'graph_diagram.png'")
+    graph = build_graph()
+    if args.draw:
+        draw(graph, "graph_diagram", args.draw)
+        return
+    if args.metrics:
+        graph = instrument(graph, jsonl_path=args.metrics, name="ConversationOfTwo")
 
+    # Thread configuration and graph input
+    thread = {"configurable": {"thread_id": "1"}}
 
-# Thread configuration and graph input
-thread = {"configurable": {"thread_id": "1"}}
+    user_input = {
+        "topic": "Внешнеполитическая обстановка российской федерации",
+        "current_iteration": 0,
+        "max_iterations": 10,
+        "history": [],  # Initialize empty history
+        "history_text": "",
+        "summary": "",
+    }
 
-user_input = {
-    "topic": "Внешнеполитическая обстановка российской федерации",
-    "current_iteration": 0,
-    "max_iterations": 10,
-    "history": []  # Initialize empty history
-}
+    # response = graph.invoke(user_input, thread)
+    #
+    # print(response)
 
-# response = graph.invoke(user_input, thread)
-#
-# print(response)
+    # Stream through the graph with the user-defined task
+    for state in graph.stream(user_input, thread):
+        print("-" * 50)  # Separator for readability
+        print("Current State (Raw):", state)  # Print the entire state for debugging
 
-# Stream through the graph with the user-defined task
-for state in graph.stream(user_input, thread):
-    print("-" * 50)  # Separator for readability
-    print("Current State (Raw):", state)  # Print the entire state for debugging
+        # Extract the current node's state dynamically
+        current_node_state = next(iter(state.values()))  # Get the first value from the dictionary
 
-    # Extract the current node's state dynamically
-    current_node_state = next(iter(state.values()))  # Get the first value from the dictionary
+        # Safely access keys from the current node's state
+        print("Processed State:")
+        print(f"Topic: {current_node_state.get('topic', 'N/A')}")
+        print(f"Current Iteration: {current_node_state.get('current_iteration', 'N/A')}")
+        print(f"Max Iterations: {current_node_state.get('max_iterations', 'N/A')}")
+        print("History:")
+        for entry in current_node_state.get("history", []):
+            print(f"{entry['agent']}: {entry['message']}")
+        print("-" * 50)  # Separator for clarity
 
-    # Safely access keys from the current node's state
-    print("Processed State:")
-    print(f"Topic: {current_node_state.get('topic', 'N/A')}")
-    print(f"Current Iteration: {current_node_state.get('current_iteration', 'N/A')}")
-    print(f"Max Iterations: {current_node_state.get('max_iterations', 'N/A')}")
-    print("History:")
-    for entry in current_node_state.get("history", []):
-        print(f"{entry['agent']}: {entry['message']}")
-    print("-" * 50)  # Separator for clarity
+    if args.metrics:
+        write_metrics(args.metrics)
 
 
+if __name__ == "__main__":
+    main()
@@ -1,8 +1,17 @@
+import argparse
+import os
+import sys
+from functools import partial
 from dotenv import load_dotenv
 from langgraph.graph import StateGraph, END
 from typing import TypedDict
 from langchain_core.messages import SystemMessage, HumanMessage
-from langchain_openai import ChatOpenAI
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from Shared.Diagram import add_draw_argument, draw
+from Shared.Instrumentation import add_metrics_argument, instrument, write_metrics
+from Shared.Clients import ClientRegistry, default_registry
+from Shared.Convergence import ConvergenceDetector, STOP_MAX_ITERATIONS
 
 _ = load_dotenv()
 
@@ -12,6 +21,7 @@ class AgentState(TypedDict):
     SecondAgentMessage: str
     current_iteration: int
     max_iterations: int
+    stop_reason: str  # why the conversation ended: converged or max_iterations
 
 
 FIRST_AGENT_PROMPT = """
@@ -22,9 +32,14 @@ SECOND_AGENT_PROMPT = """
 You are an AI assistant which should speak with other assistant about provided topic.
 """
 
-model = ChatOpenAI(model="gpt-4o-mini", temperature=0.6, max_tokens=500)
+MODEL = "gpt-4o-mini"
+# Dialogues are meant to be sampled, so they never come from the LLM cache
+MODEL_PARAMS = {"temperature": 0.6, "max_tokens": 500, "cache": False}
+
+# Ends the conversation once the second agent keeps saying the same; build_graph(convergence=None) disables it
+CONVERGENCE = ConvergenceDetector()
 
-def first_agent(state: AgentState):
+def first_agent(state: AgentState, model):
     user_message = HumanMessage(
         content=f"Here is the topic: {state['topic']}\n\nHere is your interlocutor message:\n\n{state['SecondAgentMessage']}")
 
@@ -37,7 +52,7 @@ def first_agent(state: AgentState):
     return {"FirstAgentMessage": response.content}
 
 
-def second_agent(state: AgentState):
+def second_agent(state: AgentState, model, convergence):
     user_message = HumanMessage(
         content=f"Here is the topic: {state['topic']}\n\nHere is your interlocutor message:\n\n{state['FirstAgentMessage']}")
 
@@ -47,9 +62,14 @@ def second_agent(state: AgentState):
     ]
 
     response = model.invoke(messages)
+    current_iteration = state.get("current_iteration", 1) + 1
+    stop_reason = convergence.stop_reason(state.get("SecondAgentMessage"), response.content) if convergence else ""
+    if not stop_reason and current_iteration > state["max_iterations"]:
+        stop_reason = STOP_MAX_ITERATIONS
     return {
         "SecondAgentMessage": response.content,
-        "current_iteration": state.get("current_iteration", 1) + 1
+        "current_iteration": current_iteration,
+        "stop_reason": stop_reason,
     }
 
 
@@ -57,50 +77,64 @@ def should_continue(state: AgentState):
     """
     Checks if we can make one more iteration.
     """
-    if state["current_iteration"] > state["max_iterations"]:
+    if state.get("stop_reason"):
         return END
     return "first_agent"
 
 
-builder = StateGraph(AgentState)
+def build_graph(clients: ClientRegistry = None, convergence: ConvergenceDetector = CONVERGENCE):
+    model = (clients or default_registry).get("openai", MODEL, **MODEL_PARAMS)
+
+    builder = StateGraph(AgentState)
 
-builder.add_node("first_agent", first_agent)
-builder.add_node("second_agent", second_agent)
+    builder.add_node("first_agent", partial(first_agent, model=model))
+    builder.add_node("second_agent", partial(second_agent, model=model, convergence=convergence))
 
-builder.set_entry_point("first_agent")
-builder.add_edge("first_agent", "second_agent")
+    builder.set_entry_point("first_agent")
+    builder.add_edge("first_agent", "second_agent")
 
 
-builder.add_conditional_edges(
-    "second_agent",
-    should_continue,
-    {END: END, "first_agent": "first_agent"}
-)
+    builder.add_conditional_edges(
+        "second_agent",
+        should_continue,
+        {END: END, "first_agent": "first_agent"}
+    )
 
-graph = builder.compile()
+    return builder.compile()
 
 
-# Save as PNG
-graph_image = graph.get_graph().draw_mermaid_png()
-with open("graph_diagram.png", "wb") as file:
-    file.write(graph_image)
-print("Saved as PNG 'graph_diagram.png'")
+def main():
+    parser = argparse.ArgumentParser()
+    add_draw_argument(parser)
+    add_metrics_argument(parser)
+    args = parser.parse_args()
 
+    graph = build_graph()
+    if args.draw:
+        draw(graph, "graph_diagram", args.draw)
+        return
+    if args.metrics:
+        graph = instrument(graph, jsonl_path=args.metrics, name="PingPong")
 
-# Thread configuration and graph input
-thread = {"configurable": {"thread_id": "1"}}
+    # Thread configuration and graph input
+    thread = {"configurable": {"thread_id": "1"}}
+
+    user_input = {
+        "topic": "Miami",
+        "FirstAgentMessage": "",
+        "SecondAgentMessage": "",
+        "current_iteration": 1,
+        "max_iterations": 3,
+    }
 
-user_input = {
-    "topic": "Miami",
-    "FirstAgentMessage": str,
-    "SecondAgentMessage": str,
-    "current_iteration": 1,
-    "max_iterations": 3,
-}
+    # Stream through the graph with the user-defined task
+    for state in graph.stream(user_input, thread):
+        print(state)
+        print(f"Topic: {state.get('topic')}")
 
-# Stream through the graph with the user-defined task
-for state in graph.stream(user_input, thread):
-    print(state)
-    print(f"Topic: {state.get('topic')}")
+    if args.metrics:
+        write_metrics(args.metrics)
 
 
+if __name__ == "__main__":
+    main()
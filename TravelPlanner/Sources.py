@@ -0,0 +1,41 @@
+import json
+import os
+import re
+from typing import Any, Dict, List
+
+DATA_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "data", "countries.json")
+
+
+def load_countries(path: str = DATA_PATH) -> List[Dict[str, Any]]:
+    with open(path, encoding="utf-8") as file:
+        return json.load(file)["countries"]
+
+
+def _words(text: str) -> set:
+    return set(re.findall(r"\w+", text.lower()))
+
+
+class LocalSearchClient:
+    """
+    Offline stand-in for TavilyClient: same `search(query, max_results=...)` call and response shape,
+    answered from data/countries.json by word overlap. Works with Shared.SearchFanout.search_all.
+    """
+
+    def __init__(self, path: str = DATA_PATH):
+        self.documents = [self._document(country) for country in load_countries(path)]
+
+    @staticmethod
+    def _document(country: Dict[str, Any]) -> Dict[str, str]:
+        visa_free = ", ".join(country["visa_free_for"]) or "no nationality in particular"
+        content = (f"{country['name']}: citizens with {visa_free} passports can visit {country['name']} "
+                   f"without a visa for short stays; other travellers need a visa. "
+                   f"Typical daily travel cost in {country['name']} is about ${country['daily_cost_usd']}. "
+                   f"Popular activities: {', '.join(country['activities'])}.")
+        return {"title": country["name"], "url": f"local://countries/{country['name']}", "content": content}
+
+    def search(self, query: str, max_results: int = 5, **params) -> Dict[str, Any]:
+        query_words = _words(query)
+        scored = [(len(query_words & _words(doc["content"])), doc) for doc in self.documents]
+        scored = [(score, doc) for score, doc in scored if score]
+        scored.sort(key=lambda item: -item[0])
+        return {"query": query, "results": [doc for _, doc in scored[:max_results]]}
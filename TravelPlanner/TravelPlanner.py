@@ -1,99 +1,431 @@
-import sqlite3
-from datetime import datetime
+import argparse
+import sys
+from datetime import date, datetime
+from functools import partial
 from dotenv import load_dotenv
-from langgraph.graph import StateGraph, END
-from typing import TypedDict, Annotated, List
-from langgraph.checkpoint.sqlite import SqliteSaver
-from langchain_core.messages import AnyMessage, SystemMessage, HumanMessage, AIMessage, ChatMessage
-from langchain_openai import ChatOpenAI
-from pydantic import BaseModel
-from tavily import TavilyClient
+from langgraph.constants import Send
+from langgraph.graph import StateGraph, START, END
+from typing import TypedDict, Annotated, List, Dict, Optional
+from langchain_core.messages import SystemMessage, HumanMessage
+from pydantic import BaseModel, Field
 import os
-from pydantic import BaseModel
-from typing import List, Dict, Tuple
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+from Shared.LLMCache import enable_llm_cache
+from Shared.Diagram import add_draw_argument, draw
+from Shared.Instrumentation import add_metrics_argument, instrument, write_metrics
+from Shared.Clients import ClientRegistry, default_registry
+from Shared.SearchFanout import search_all, collect_contents
+from Shared.SearchCache import CachedAsyncSearchClient
+from Shared.ContentStore import select_snippets
+from Sources import LocalSearchClient
+from Weather import Climatology, summarize_weather
+from VisaIndex import VisaIndex, get_visa_index
 
 _ = load_dotenv()
 
+
+def merge_by_country(left: Optional[Dict[str, object]], right: Optional[Dict[str, object]]) -> Dict[str, object]:
+    """
+    Reducer for per-country results sent back by parallel branches: a newer entry for a
+    country replaces the older one, the other countries are kept.
+    """
+    return {**(left or {}), **(right or {})}
+
+
 class AgentState(TypedDict):
     budget: int                                  # Budget in USD ($)
     weather_preference: str                      # User's preferred weather (e.g., "rainy", "sunny")
     activity_type: str                           # Desired activity type (e.g., "hiking", "beach", "culture")
     nationality: str                             # User's nationality (to determine visa requirements)
-    travel_date: datetime.date                   # Departure date
+    travel_date: date                            # Departure date
     stay_duration_days: int                      # Duration of the trip in days
     visa_info: Dict[str, bool]                   # Mapping of country names to whether a visa is required
-    weather_data: Dict[str, str]                 # Country-specific weather description (e.g., "sunny", "rainy")
-    critiques: List[Tuple[str, str]]             # List of critiques (country, critique text)
+    candidates: Annotated[Dict[str, dict], merge_by_country]   # Country -> filter verdict, cost, activities
+    weather_data: Dict[str, dict]                # Country -> weather of the stay: description, match score, mean/p10/p90
+    ranking: List[dict]                          # Best countries of the current iteration, best first
+    critiques: Annotated[Dict[str, str], merge_by_country]     # Country -> sceptic's critique
+    research_notes: Dict[str, str]               # Country -> facts found about its critique
     iterations: int                              # Current iteration count
     max_iterations: int                          # Maximum number of iterations allowed
+    plan: str                                    # Final trip suggestions
+
+
+MAX_VISA_SEARCHES = 4           # visa queries sent at once
+MAX_CANDIDATE_COUNTRIES = 12    # countries evaluated in parallel in the first iteration
+MAX_RANKED_COUNTRIES = 3        # countries kept by the ranking
+SEARCH_MAX_CONCURRENCY = 4
+SEARCH_TIMEOUT = 15.0
+RESEARCH_TOKEN_BUDGET = 300     # research notes per country passed back to the filter
 
+# Clients come from a ClientRegistry when the graph is built (see build_graph)
+MODEL = "gpt-4o"
+TEMPERATURE = 0.6
 
 
 VISA_INFO_PROMPT = """
-You are a travel assistant helping a user plan their trip. Using the web search tool, 
+You are a travel assistant helping a user plan their trip. Using the web search results below,
 find the latest visa regulations for citizen's nationality. Your goal is to identify:
 Countries they can travel to without a visa.
 Countries they can travel to with a visa.
+Use country names only and list every country you find evidence for.
+
+------
+
+{content}
 """
 
+FILTER_PROMPT = """
+You are a travel assistant checking one destination for a user.
+Decide whether {country} fits the user's budget and desired activity. Reject it if the trip would be
+too expensive or the activity is not really available there. Estimate the daily cost in USD and list
+what the user could do there. If there is a critique of this destination, take it and the research
+notes into account, but weigh the minuses honestly instead of rejecting it for minor issues.
+"""
+
+RANK_PROMPT = """
+You are a travel assistant. From the candidate destinations below, choose the best {count} for the user
+and order them best first. Consider budget, activity, weather match, visa requirement, and any critique
+and research notes. For each, explain briefly why and sketch how to start the trip (visa steps if needed,
+what to book, what to do there).
+"""
+
+CRITIQUE_PROMPT = """
+You are a sceptical traveller reviewing a suggested destination before you pay for it.
+Write a short message listing the concrete downsides and risks of this trip for you: costs that may
+be underestimated, weather, visa hassle, safety, crowds, whether the activity is really good there.
+Do not suggest other countries.
+"""
+
+CRITIQUE_RESEARCH_PROMPT = """
+You are a researcher checking sceptical critiques of travel destinations.
+For each critique, write one web search query that would confirm or refute its main concern.
+"""
+
+
+class VisaInfo(BaseModel):
+    visa_free: List[str] = Field(description="Countries the traveller can visit without a visa.")
+    visa_required: List[str] = Field(description="Countries the traveller can visit with a visa.")
 
-def visa_finder_node(state: AgentState):
+
+class CountryFit(BaseModel):
+    keep: bool = Field(description="Whether the destination fits the budget and activity.")
+    estimated_daily_cost_usd: int = Field(description="Estimated daily cost of the stay in USD.")
+    activities: List[str] = Field(description="Things matching the desired activity to do there.")
+    reason: str = Field(description="Short justification.")
+
+
+class RankedCountry(BaseModel):
+    country: str
+    reason: str
+    how_to_start: str = Field(description="Visa steps if needed, what to book, what to do there.")
+
+
+class Ranking(BaseModel):
+    countries: List[RankedCountry]
+
+
+class CountryQuery(BaseModel):
+    country: str
+    query: str
+
+
+class CritiqueQueries(BaseModel):
+    queries: List[CountryQuery]
+
+
+def extract_visa_info(nationality: str, year: int, model, search) -> Dict[str, bool]:
     """
-    Takes VISA_INFO_PROMPT and user's nationality to find the latest visa regulations.
+    Searches visa regulations for a nationality (all queries at once) and extracts
+    which countries need a visa, visa-free countries first.
     """
+    queries = [
+        f"countries {nationality} citizens can visit without a visa {year}",
+        f"visa-free and visa on arrival destinations for {nationality} passport holders",
+        f"countries requiring a visa for {nationality} citizens {year}",
+        f"e-visa countries for {nationality} citizens",
+    ][:MAX_VISA_SEARCHES]
+    responses = search_all(search, queries, max_concurrency=SEARCH_MAX_CONCURRENCY, timeout=SEARCH_TIMEOUT,
+                           max_results=5)
+    content = "\n\n".join(dict.fromkeys(collect_contents(responses)))
+
     messages = [
-        SystemMessage(content=VISA_INFO_PROMPT),
-        HumanMessage(content=state["nationality"])
+        SystemMessage(content=VISA_INFO_PROMPT.format(content=content)),
+        HumanMessage(content=nationality)
     ]
-    response = ChatOpenAI(model="gpt-4o", temperature=0.6).invoke(messages)
-    return {"plan": response.content}
+    visa = model.with_structured_output(VisaInfo).invoke(messages)
+
+    # Visa-free countries first, they are the easiest trips
+    visa_info = {country: False for country in visa.visa_free}
+    for country in visa.visa_required:
+        visa_info.setdefault(country, True)
+    return visa_info
+
+
+def visa_finder_node(state: AgentState, model, search, index: VisaIndex):
+    """
+    Node 1: visa requirements for the user's nationality, from the visa index while it is fresh,
+    otherwise extracted from a web search once and stored in the index.
+    """
+    nationality = state["nationality"]
+    visa_info = index.lookup(nationality)
+    if visa_info is None:
+        visa_info = extract_visa_info(nationality, state["travel_date"].year, model, search)
+        index.update(nationality, visa_info)
+    return {"visa_info": dict(list(visa_info.items())[:MAX_CANDIDATE_COUNTRIES])}
+
 
+def weather_node(state: AgentState, climatology: Climatology):
+    """
+    Node 2: weather over the stay for every candidate country at once, scored against the preference.
+    """
+    return {"weather_data": summarize_weather(climatology, list(state["visa_info"]), state["travel_date"],
+                                              state["stay_duration_days"], state["weather_preference"])}
+
+
+def send_evaluations(state: AgentState):
+    """
+    Map step: every candidate country is filtered in its own branch.
+    First all countries with known visa rules, later only the ranked ones, with their critique.
+    """
+    countries = [entry["country"] for entry in state.get("ranking") or []] or list(state["visa_info"])
+    if not countries:
+        return "finalize"
+    return [Send("evaluate_country", {
+        "country": country,
+        "visa_required": state["visa_info"].get(country, True),
+        "budget": state["budget"],
+        "activity_type": state["activity_type"],
+        "weather": state["weather_data"].get(country, {}).get("description", "unknown"),
+        "stay_duration_days": state["stay_duration_days"],
+        "critique": (state.get("critiques") or {}).get(country, ""),
+        "research": (state.get("research_notes") or {}).get(country, ""),
+    }) for country in countries]
+
+
+def evaluate_country_node(state: dict, model):
+    """
+    Node 3 for one country: LLM budget/activity filter.
+    """
+    country = state["country"]
+    request = (f"Destination: {country}\n"
+               f"Visa required: {'yes' if state['visa_required'] else 'no'}\n"
+               f"Budget: ${state['budget']} for {state['stay_duration_days']} days\n"
+               f"Desired activity: {state['activity_type']}\n"
+               f"Weather during the stay: {state['weather']}")
+    if state.get("critique"):
+        request += f"\n\nCritique:\n{state['critique']}"
+    if state.get("research"):
+        request += f"\n\nResearch notes:\n{state['research']}"
 
+    fit = model.with_structured_output(CountryFit).invoke([
+        SystemMessage(content=FILTER_PROMPT.format(country=country)),
+        HumanMessage(content=request)
+    ])
+    return {"candidates": {country: fit.model_dump()}}
 
 
-builder = StateGraph(AgentState)
+def format_candidate(state: AgentState, country: str) -> str:
+    candidate = state["candidates"][country]
+    weather = state["weather_data"].get(country, {"description": "unknown", "score": 0.5})
+    text = (f"## {country}\n"
+            f"Visa required: {'yes' if state['visa_info'].get(country, True) else 'no'}\n"
+            f"Estimated daily cost: ${candidate['estimated_daily_cost_usd']}\n"
+            f"Activities: {', '.join(candidate['activities'])}\n"
+            f"Weather: {weather['description']} (match {weather['score']})\n"
+            f"Assessment: {candidate['reason']}")
+    if (state.get("critiques") or {}).get(country):
+        text += f"\nCritique: {state['critiques'][country]}"
+    if (state.get("research_notes") or {}).get(country):
+        text += f"\nResearch notes: {state['research_notes'][country]}"
+    return text
+
+
+def rank_node(state: AgentState, model):
+    """
+    Node 4: keeps the best countries among those that passed the filter.
+    If a critique round rejects every ranked country, or the model names none of the
+    candidates, the previous ranking stays.
+    """
+    previous = {entry["country"] for entry in state.get("ranking") or []}
+    kept = [country for country, candidate in state["candidates"].items()
+            if candidate["keep"] and (not previous or country in previous)]
+    if not kept:
+        return {"ranking": state.get("ranking") or []}
+
+    # Best weather match first, so the model sees the strongest candidates early
+    kept.sort(key=lambda country: -state["weather_data"].get(country, {}).get("score", 0.5))
+    request = (f"Budget: ${state['budget']} for {state['stay_duration_days']} days from {state['travel_date']}\n"
+               f"Desired activity: {state['activity_type']}\n"
+               f"Weather preference: {state['weather_preference']}\n\n"
+               + "\n\n".join(format_candidate(state, country) for country in kept))
+    ranking = model.with_structured_output(Ranking).invoke([
+        SystemMessage(content=RANK_PROMPT.format(count=min(MAX_RANKED_COUNTRIES, len(kept)))),
+        HumanMessage(content=request)
+    ])
+    # The model may change the case or spacing of a name; entries keep the candidate's spelling
+    canonical = {" ".join(country.lower().split()): country for country in kept}
+    entries = []
+    for entry in ranking.countries:
+        country = canonical.get(" ".join(entry.country.lower().split()))
+        if country is not None:
+            entries.append({**entry.model_dump(), "country": country})
+    if not entries:
+        return {"ranking": state.get("ranking") or []}
+    return {"ranking": entries[:MAX_RANKED_COUNTRIES]}
+
+
+def send_critiques(state: AgentState):
+    """
+    Map step: every ranked country gets its own sceptic, unless we are out of iterations.
+    """
+    if state["iterations"] >= state["max_iterations"] or not state.get("ranking"):
+        return "finalize"
+    return [Send("critique_country", {
+        "country": entry["country"],
+        "draft": format_candidate(state, entry["country"]) + f"\nHow to start: {entry['how_to_start']}",
+    }) for entry in state["ranking"]]
+
+
+def critique_country_node(state: dict, model):
+    """
+    Node 5 for one country: a sceptical user's message about the suggestion.
+    """
+    critique = model.invoke([
+        SystemMessage(content=CRITIQUE_PROMPT),
+        HumanMessage(content=state["draft"])
+    ])
+    return {"critiques": {state["country"]: critique.content}}
+
+
+def critique_research_node(state: AgentState, model, search):
+    """
+    Node 6: searches what each critique worries about (all queries at once) and keeps the
+    most relevant snippets per country for the next filter round.
+    """
+    ranked = [entry["country"] for entry in state["ranking"]]
+    critiques = "\n\n".join(f"## {country}\n{state['critiques'][country]}" for country in ranked
+                            if country in state["critiques"])
+    queries = model.with_structured_output(CritiqueQueries).invoke([
+        SystemMessage(content=CRITIQUE_RESEARCH_PROMPT),
+        HumanMessage(content=critiques)
+    ]).queries
+    queries = [q for q in queries if q.country in ranked]
+
+    responses = search_all(search, [q.query for q in queries], max_concurrency=SEARCH_MAX_CONCURRENCY,
+                           timeout=SEARCH_TIMEOUT, max_results=3)
+    # A country can get several queries, its snippets are pooled before selecting
+    snippets: Dict[str, List[str]] = {}
+    for q, response in zip(queries, responses):
+        snippets.setdefault(q.country, []).extend(collect_contents([response]))
+    notes = {country: "\n".join(select_snippets(found, state["critiques"].get(country, country),
+                                                k=3, token_budget=RESEARCH_TOKEN_BUDGET))
+             for country, found in snippets.items()}
+    return {"research_notes": notes, "iterations": state["iterations"] + 1}
+
+
+def finalize_node(state: AgentState):
+    """
+    Writes the countries of the last ranking as the final plan.
+    """
+    if not state.get("ranking"):
+        return {"plan": "No destination matched the budget and activity."}
+    parts = []
+    for position, entry in enumerate(state["ranking"], start=1):
+        parts.append(f"{position}. {format_candidate(state, entry['country'])}\n"
+                     f"Why: {entry['reason']}\nHow to start: {entry['how_to_start']}")
+    return {"plan": "\n\n".join(parts)}
+
+
+def build_graph(clients: ClientRegistry = None, search=None, climatology: Climatology = None,
+                visa_index: VisaIndex = None):
+    """
+    search: any client with Tavily's `search(query, max_results=...)`, by default cached Tavily.
+    climatology: daily climate normals, by default data/climatology.csv (see Weather.Climatology.load).
+    visa_index: visa requirements by nationality, by default the shared VisaIndex.db.
+    """
+    clients = clients or default_registry
+    # One pooled client instead of a new ChatOpenAI on every call
+    model = clients.get("openai", MODEL, temperature=TEMPERATURE)
+    search = search or CachedAsyncSearchClient(clients.get("tavily"))
+    climatology = climatology or Climatology.load()
+    visa_index = visa_index or get_visa_index()
+
+    builder = StateGraph(AgentState)
 
-builder.add_node("visa_finder", visa_finder_node)
+    builder.add_node("visa_finder", partial(visa_finder_node, model=model, search=search, index=visa_index))
+    builder.add_node("weather", partial(weather_node, climatology=climatology))
+    builder.add_node("evaluate_country", partial(evaluate_country_node, model=model))
+    builder.add_node("rank", partial(rank_node, model=model))
+    builder.add_node("critique_country", partial(critique_country_node, model=model))
+    builder.add_node("critique_research", partial(critique_research_node, model=model, search=search))
+    builder.add_node("finalize", finalize_node)
 
-builder.set_entry_point("visa_finder")
-builder.set_finish_point("visa_finder")
+    builder.add_edge(START, "visa_finder")
+    builder.add_edge("visa_finder", "weather")
+    builder.add_conditional_edges("weather", send_evaluations, ["evaluate_country", "finalize"])
+    builder.add_edge("evaluate_country", "rank")
+    builder.add_conditional_edges("rank", send_critiques, ["critique_country", "finalize"])
+    builder.add_edge("critique_country", "critique_research")
+    builder.add_conditional_edges("critique_research", send_evaluations, ["evaluate_country", "finalize"])
+    builder.add_edge("finalize", END)
 
-graph = builder.compile()
+    return builder.compile()
 
 
-# Save as PNG
-graph_image = graph.get_graph().draw_mermaid_png()
-with open("graph_diagram.png", "wb") as file:
-    file.write(graph_image)
-print("Saved as PNG 'graph_diagram.png'")
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--offline", action="store_true",
+                        help="answer searches from data/countries.json instead of Tavily")
+    parser.add_argument("--climatology", help="CSV or Parquet climate normals (default data/climatology.csv)")
+    parser.add_argument("--visa-index", help="CSV (nationality,destination,visa_required) or countries.json "
+                                             "to bulk load into the visa index")
+    add_draw_argument(parser)
+    add_metrics_argument(parser)
+    args = parser.parse_args()
 
+    # Offline runs keep their visa index in memory, so they never touch the shared one
+    visa_index = VisaIndex(":memory:") if args.offline else get_visa_index()
+    if args.visa_index:
+        print(f"Loaded {visa_index.load_file(args.visa_index)} visa entries from '{args.visa_index}'")
 
-# Thread configuration and graph input
-thread = {"configurable": {"thread_id": "1"}}
+    graph = build_graph(search=LocalSearchClient() if args.offline else None,
+                        climatology=Climatology.load(args.climatology) if args.climatology else None,
+                        visa_index=visa_index)
+    if args.draw:
+        draw(graph, "graph_diagram", args.draw)
+        return
+    if args.metrics:
+        graph = instrument(graph, jsonl_path=args.metrics, name="TravelPlanner")
 
-user_input = {
-    "budget": 500,  # User budget
-    "weather_preference": "not important",  # User does not prioritize weather
-    "activity_type": "walking",  # Activity type preferred by the user
-    "nationality": "Ukrainian",  # User's nationality
-    "travel_date": datetime(2025, 2, 2).date(),  # Travel departure date
-    "stay_duration_days": 7,  # Duration of stay in days
-    "visa_info": {},  # Initially no visa information
-    "weather_data": {},  # Initially no weather data
-    "critiques": [],  # Initially no critiques
-    "iterations": 0,  # Starting iteration
-    "max_iterations": 3  # Maximum allowed iterations
-}
+    # Re-runs with the same inputs are answered from LLMCache.db
+    enable_llm_cache()
 
-# Stream through the graph with the user-defined task
-for state in graph.stream(user_input, thread):
-    print(state)
+    user_input = {
+        "budget": 500,  # User budget
+        "weather_preference": "not important",  # User does not prioritize weather
+        "activity_type": "walking",  # Activity type preferred by the user
+        "nationality": "Ukrainian",  # User's nationality
+        "travel_date": datetime(2025, 2, 2).date(),  # Travel departure date
+        "stay_duration_days": 7,  # Duration of stay in days
+        "visa_info": {},  # Initially no visa information
+        "weather_data": {},  # Initially no weather data
+        "critiques": {},  # Initially no critiques
+        "iterations": 0,  # Starting iteration
+        "max_iterations": 3  # Maximum allowed iterations
+    }
 
+    # Stream through the graph with the user-defined task
+    for state in graph.stream(user_input, stream_mode="updates"):
+        print(state)
+        if "finalize" in state:
+            print("=" * 50)
+            print(state["finalize"]["plan"])
 
-# CRITIQUE_PROMPT = """
-# You are a travel advisor reviewing potential destinations for a client.
-# For each suggested country, provide constructive considerations or potential challenges
-# the client should be aware of, while maintaining a positive and helpful tone.
-# """
+    if args.metrics:
+        write_metrics(args.metrics)
 
 
+if __name__ == "__main__":
+    main()
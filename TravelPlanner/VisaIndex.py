@@ -0,0 +1,139 @@
+import csv
+import json
+import os
+import sqlite3
+import threading
+import time
+from typing import Dict, Iterable, Optional, Tuple
+
+# One file in the repository root, next to the search and LLM caches
+VISA_INDEX_PATH = os.getenv(
+    "VISA_INDEX_PATH",
+    os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "VisaIndex.db"),
+)
+VISA_INDEX_TTL = float(os.getenv("VISA_INDEX_TTL", 30 * 24 * 3600))  # visa rules change rarely
+
+# (nationality, destination, visa_required)
+VisaRow = Tuple[str, str, bool]
+
+
+def _key(name: str) -> str:
+    """ "Ukrainian " and "ukrainian" are the same nationality """
+    return " ".join(name.split()).lower()
+
+
+class VisaIndex:
+    """
+    Visa requirements keyed by (nationality, destination), persisted in SQLite.
+
+    The whole table is kept in a dict as well, so a lookup for a nationality is a dictionary hit.
+    Once any entry of a nationality is older than `ttl` seconds, the nationality is treated as
+    missing and its destinations get extracted again.
+    `path=":memory:"` gives an index that lives only in the process (offline runs, tests).
+    """
+
+    def __init__(self, path: str = VISA_INDEX_PATH, ttl: Optional[float] = VISA_INDEX_TTL):
+        self.path = path
+        self.ttl = ttl
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS visa ("
+            "nationality TEXT NOT NULL, destination TEXT NOT NULL, visa_required INTEGER NOT NULL, "
+            "updated REAL NOT NULL, PRIMARY KEY (nationality, destination))"
+        )
+        self._conn.commit()
+        # nationality -> {destination: (visa_required, updated)}, destinations in insertion order
+        self._entries: Dict[str, Dict[str, Tuple[bool, float]]] = {}
+        for nationality, destination, required, updated in self._conn.execute(
+                "SELECT nationality, destination, visa_required, updated FROM visa ORDER BY rowid"):
+            self._entries.setdefault(nationality, {})[destination] = (bool(required), updated)
+
+    def lookup(self, nationality: str) -> Optional[Dict[str, bool]]:
+        """
+        Destinations for the nationality, visa-free ones first, or None when there are none or
+        any of them is stale (a partial answer would silently drop the stale destinations).
+        """
+        now = time.time()
+        entries = self._entries.get(_key(nationality), {})
+        if not entries or (self.ttl is not None and any(now - updated > self.ttl for _, updated in entries.values())):
+            self.misses += 1
+            return None
+        self.hits += 1
+        return dict(sorted(((destination, required) for destination, (required, _) in entries.items()),
+                           key=lambda item: item[1]))
+
+    def update(self, nationality: str, visa_info: Dict[str, bool]) -> None:
+        """ Stores one extraction result for a nationality, replacing all its older entries """
+        key = _key(nationality)
+        with self._lock:
+            # Committed together with the new rows by bulk_load
+            self._conn.execute("DELETE FROM visa WHERE nationality = ?", (key,))
+            self._entries.pop(key, None)
+        self.bulk_load((nationality, destination, required) for destination, required in visa_info.items())
+
+    def bulk_load(self, rows: Iterable[VisaRow]) -> int:
+        """ Inserts or refreshes many entries in one transaction, returns how many """
+        now = time.time()
+        rows = [(_key(nationality), destination.strip(), bool(required)) for nationality, destination, required in rows]
+        with self._lock:
+            self._conn.executemany(
+                "INSERT OR REPLACE INTO visa (nationality, destination, visa_required, updated) VALUES (?, ?, ?, ?)",
+                [(nationality, destination, int(required), now) for nationality, destination, required in rows],
+            )
+            self._conn.commit()
+            for nationality, destination, required in rows:
+                self._entries.setdefault(nationality, {})[destination] = (required, now)
+        return len(rows)
+
+    def load_file(self, path: str) -> int:
+        """
+        Bulk load from a CSV with `nationality,destination,visa_required` columns or from a
+        countries.json like data/countries.json (see rows_from_countries).
+        """
+        if path.endswith(".json"):
+            with open(path, encoding="utf-8") as file:
+                return self.bulk_load(rows_from_countries(json.load(file)["countries"]))
+        with open(path, newline="", encoding="utf-8") as file:
+            return self.bulk_load(
+                (row["nationality"], row["destination"], row["visa_required"].strip().lower() in ("1", "true", "yes"))
+                for row in csv.DictReader(file)
+            )
+
+    def stats(self) -> Dict[str, float]:
+        total = self.hits + self.misses
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "nationalities": len(self._entries),
+            "entries": sum(len(entries) for entries in self._entries.values()),
+            "hit_rate": self.hits / total if total else 0.0,
+        }
+
+    def close(self) -> None:
+        with self._lock:
+            self._conn.close()
+
+
+def rows_from_countries(countries) -> Iterable[VisaRow]:
+    """
+    Every nationality mentioned in `visa_free_for` gets an entry for every country:
+    visa-free where it is listed, visa required elsewhere.
+    """
+    nationalities = list(dict.fromkeys(n for country in countries for n in country["visa_free_for"]))
+    for nationality in nationalities:
+        for country in countries:
+            yield nationality, country["name"], nationality not in country["visa_free_for"]
+
+
+_visa_index: Optional[VisaIndex] = None
+
+
+def get_visa_index() -> VisaIndex:
+    """ Opens the shared on-disk index on first use """
+    global _visa_index
+    if _visa_index is None:
+        _visa_index = VisaIndex()
+    return _visa_index
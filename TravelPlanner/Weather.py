@@ -0,0 +1,171 @@
+import csv
+import os
+import warnings
+from datetime import date
+from typing import Dict, List, Sequence
+
+import numpy as np
+
+from Shared.ContentStore import tokenize
+
+CLIMATOLOGY_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "data", "climatology.csv")
+
+METRICS = ("temp_c", "rain_probability", "sunshine_hours")
+PERCENTILES = (10, 90)
+
+# Day of year (0-based) in the middle of each month, where the monthly normals are pinned
+_MONTH_MIDDLES = np.array([15, 45, 74, 105, 135, 166, 196, 227, 258, 288, 319, 349], dtype=float)
+
+
+class Climatology:
+    """
+    Daily climate normals for many countries as one array of shape (countries × 365 × metrics),
+    interpolated once from monthly rows. `window` cuts the stay out of it for any set of countries
+    with a single fancy-indexing operation.
+    """
+
+    def __init__(self, countries: Sequence[str], monthly: np.ndarray):
+        """
+        :param countries: Country names, in the order of the first axis of `monthly`
+        :param monthly: Array of shape (countries × 12 × metrics)
+        """
+        self.countries = list(countries)
+        self.index = {name: i for i, name in enumerate(self.countries)}
+        days = np.arange(365, dtype=float)
+        # Periodic interpolation, so December blends into January
+        self.daily = np.stack([
+            np.stack([np.interp(days, _MONTH_MIDDLES, monthly[c, :, m], period=365) for m in range(len(METRICS))],
+                     axis=-1)
+            for c in range(len(self.countries))
+        ]) if self.countries else np.empty((0, 365, len(METRICS)))
+
+    @classmethod
+    def from_rows(cls, rows: List[Dict[str, object]]) -> "Climatology":
+        """
+        Rows with `country`, `month` (1-12) and one column per metric; missing months are NaN.
+        """
+        countries = list(dict.fromkeys(str(row["country"]) for row in rows))
+        index = {name: i for i, name in enumerate(countries)}
+        monthly = np.full((len(countries), 12, len(METRICS)), np.nan)
+        for row in rows:
+            monthly[index[str(row["country"])], int(row["month"]) - 1] = [float(row[m]) for m in METRICS]
+        return cls(countries, monthly)
+
+    @classmethod
+    def from_csv(cls, path: str = CLIMATOLOGY_PATH) -> "Climatology":
+        with open(path, newline="", encoding="utf-8") as file:
+            return cls.from_rows(list(csv.DictReader(file)))
+
+    @classmethod
+    def from_parquet(cls, path: str) -> "Climatology":
+        """ Same columns as the CSV. Needs pyarrow. """
+        try:
+            import pyarrow.parquet as pq
+        except ImportError as error:
+            raise ImportError("Reading a Parquet climatology needs pyarrow: pip install pyarrow") from error
+        table = pq.read_table(path, columns=["country", "month", *METRICS]).to_pydict()
+        return cls.from_rows([dict(zip(table, values)) for values in zip(*table.values())])
+
+    @classmethod
+    def load(cls, path: str = CLIMATOLOGY_PATH) -> "Climatology":
+        return cls.from_parquet(path) if path.endswith(".parquet") else cls.from_csv(path)
+
+    def window(self, countries: Sequence[str], start: date, days: int) -> np.ndarray:
+        """
+        Daily values of the stay, shape (countries × days × metrics). Unknown countries are all NaN.
+        """
+        day_index = (start.timetuple().tm_yday - 1 + np.arange(days)) % 365
+        rows = np.array([self.index.get(name, -1) for name in countries], dtype=int)
+        if not self.countries:
+            return np.full((len(rows), days, len(METRICS)), np.nan)
+        series = self.daily[np.ix_(np.maximum(rows, 0), day_index)]
+        series[rows < 0] = np.nan
+        return series
+
+
+# Per-day match (0..1) of each preference word, computed on whole arrays at once
+WEATHER_PREFERENCES = {
+    "sunny": lambda temp, rain, sun: np.clip(sun / 10, 0, 1),
+    "dry": lambda temp, rain, sun: 1 - rain,
+    "rainy": lambda temp, rain, sun: rain,
+    "warm": lambda temp, rain, sun: np.clip((temp - 10) / 15, 0, 1),
+    "hot": lambda temp, rain, sun: np.clip((temp - 18) / 12, 0, 1),
+    "mild": lambda temp, rain, sun: np.clip(1 - np.abs(temp - 20) / 12, 0, 1),
+    "cool": lambda temp, rain, sun: np.clip(1 - np.abs(temp - 12) / 10, 0, 1),
+    "cold": lambda temp, rain, sun: np.clip((10 - temp) / 15, 0, 1),
+    "snow": lambda temp, rain, sun: np.clip(-temp / 5, 0, 1) * rain,
+}
+NEGATIONS = {"not", "no", "without", "avoid"}
+NEGATION_SCOPE = 2              # a negation turns around a preference word at most this many words after it
+
+
+def preference_rules(preference: str) -> List:
+    """
+    Rules of the preference words, matched as whole words. A negated word ("not too hot", "no snow")
+    gives the opposite rule.
+    """
+    words = tokenize(preference)
+    rules = []
+    for i, word in enumerate(words):
+        rule = WEATHER_PREFERENCES.get(word)
+        if rule is None:
+            continue
+        if NEGATIONS & set(words[max(0, i - NEGATION_SCOPE):i]):
+            rules.append(lambda temp, rain, sun, rule=rule: 1 - rule(temp, rain, sun))
+        else:
+            rules.append(rule)
+    return rules
+
+
+def preference_scores(series: np.ndarray, preference: str) -> np.ndarray:
+    """
+    Mean daily match of every country with the preference, shape (countries,).
+    1.0 when the preference names nothing we can measure (e.g. "not important"), NaN without data.
+    """
+    rules = preference_rules(preference)
+    if not rules:
+        return np.where(np.isnan(series).all(axis=(1, 2)), np.nan, 1.0)
+    temp, rain, sun = (series[..., i] for i in range(len(METRICS)))
+    daily = np.mean([rule(temp, rain, sun) for rule in rules], axis=0)
+    with warnings.catch_warnings():
+        warnings.simplefilter("ignore", RuntimeWarning)  # all-NaN rows for countries without data
+        return np.nanmean(daily, axis=1)
+
+
+def aggregate(series: np.ndarray) -> Dict[str, np.ndarray]:
+    """
+    Mean and percentiles over the stay for every country and metric, each of shape (countries × metrics).
+    """
+    with warnings.catch_warnings():
+        warnings.simplefilter("ignore", RuntimeWarning)  # all-NaN rows for countries without data
+        stats = {"mean": np.nanmean(series, axis=1)}
+        for p in PERCENTILES:
+            stats[f"p{p}"] = np.nanpercentile(series, p, axis=1)
+    return stats
+
+
+def summarize_weather(climatology: Climatology, countries: Sequence[str], start: date, days: int,
+                      preference: str) -> Dict[str, dict]:
+    """
+    Weather of the stay for all countries in one vectorized pass:
+    {country: {"description", "score", "mean", "p10", "p90"}}, metrics as dicts.
+    """
+    countries = list(countries)
+    series = climatology.window(countries, start, days)
+    stats = aggregate(series)
+    scores = preference_scores(series, preference)
+
+    temp, rain, sun = METRICS.index("temp_c"), METRICS.index("rain_probability"), METRICS.index("sunshine_hours")
+    weather = {}
+    for i, country in enumerate(countries):
+        if np.isnan(scores[i]):
+            weather[country] = {"description": "no weather data", "score": 0.5}
+            continue
+        mean, low, high = stats["mean"][i], stats["p10"][i], stats["p90"][i]
+        weather[country] = {
+            "description": (f"{round(mean[temp])}°C on average ({round(low[temp])} to {round(high[temp])}°C), "
+                            f"{mean[rain]:.0%} chance of rain per day, {round(mean[sun])} h of sun"),
+            "score": round(float(scores[i]), 2),
+            **{name: dict(zip(METRICS, np.round(stats[name][i], 2).tolist())) for name in stats},
+        }
+    return weather